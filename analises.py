@@ -1,50 +1,202 @@
+import pandas as pd
+import numpy as np
+
+from data import Granularidade
+from instrumentacao import Instrumentacao
+
 
 class Analises:
 
-    def MatrizCorrelacao(df_unificado):
+    # Limiares de classificação das correlações (valor absoluto), do mais forte ao mais fraco
+    limiares = [(0.8, 'forte'), (0.5, 'moderada'), (0.3, 'fraca')]
+
+    def _pearson(X, Y):
+        '''
+            Correlação de Pearson entre todas as colunas de X (..., n, k) e de Y (..., n, m), com
+            tratamento par a par dos valores ausentes: cada par usa apenas as linhas em que os
+            dois valores existem, como em DataFrame.corr(). As dimensões iniciais (...) formam
+            lotes (ex.: defasagens ou reamostragens). Retorna (r, n), com forma (..., k, m).
+        '''
+        mx = ~np.isnan(X)
+        my = ~np.isnan(Y)
+
+        # Centralizar pelas médias de cada coluna (não altera a correlação e melhora a precisão)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            media_x = np.where(mx, X, 0.0).sum(axis=-2, keepdims=True) / mx.sum(axis=-2, keepdims=True)
+            media_y = np.where(my, Y, 0.0).sum(axis=-2, keepdims=True) / my.sum(axis=-2, keepdims=True)
+        x0 = np.where(mx, X - media_x, 0.0)
+        y0 = np.where(my, Y - media_y, 0.0)
+        mx = mx.astype(float)
+        my = my.astype(float)
+
+        # Somas par a par restritas às linhas válidas nos dois lados, para todos os pares de uma vez
+        produto = lambda a, b: np.swapaxes(a, -1, -2) @ b
+        n = produto(mx, my)
+        sx = produto(x0, my)
+        sy = produto(mx, y0)
+        sxx = produto(x0 ** 2, my)
+        syy = produto(mx, y0 ** 2)
+        sxy = produto(x0, y0)
+
+        return Analises._de_somas(n, sx, sy, sxx, syy, sxy), n
+
+    def _de_somas(n, sx, sy, sxx, syy, sxy):
+        # Correlação a partir das somas par a par (contagem, somas, somas dos quadrados e dos produtos)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = sxy - sx * sy / n
+            var = (sxx - sx ** 2 / n) * (syy - sy ** 2 / n)
+            r = np.where((n >= 2) & (var > 0), cov / np.sqrt(var), np.nan)
+
+        return np.clip(r, -1.0, 1.0)
+
+    def _postos(A):
+        # Postos (média nos empates) ao longo do eixo das linhas, ignorando NaN
+        forma = A.shape
+        planos = np.moveaxis(A, -2, 0).reshape(forma[-2], -1)
+        postos = pd.DataFrame(planos).rank(method='average').to_numpy()
+        return np.moveaxis(postos.reshape((forma[-2],) + forma[:-2] + forma[-1:]), 0, -2)
+
+    def _spearman(X, Y):
+        '''
+            Correlação de Spearman com tratamento par a par dos valores ausentes. Os postos de
+            um par dependem das linhas válidas nos dois lados; por isso os pares são agrupados
+            pelo padrão de linhas válidas e cada padrão distinto é resolvido de uma vez.
+        '''
+        mascara = ~np.isnan(X)[:, :, None] & ~np.isnan(Y)[..., :, None, :]
+        mascara = np.moveaxis(mascara, -3, -1)
+        forma = mascara.shape[:-1]
+        padroes, inverso = np.unique(np.packbits(mascara.reshape(-1, mascara.shape[-1]), axis=1),
+                                     axis=0, return_inverse=True)
+        inverso = inverso.reshape(forma)
+
+        r = np.full(forma, np.nan)
+        n = np.zeros(forma)
+        for indice, padrao in enumerate(padroes):
+            linhas = np.unpackbits(padrao)[:X.shape[0]].astype(bool)
+            if not linhas.any():
+                continue
+            r_padrao, n_padrao = Analises._pearson(Analises._postos(X[linhas]), Analises._postos(Y[..., linhas, :]))
+            selecionados = inverso == indice
+            r[selecionados] = r_padrao[selecionados]
+            n[selecionados] = n_padrao[selecionados]
+
+        return r, n
+
+    def _p_valor(r, n):
+        # Teste t bicaudal para H0: correlação nula, com n - 2 graus de liberdade
+        from scipy.special import stdtr
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gl = n - 2
+            t = np.abs(r) * np.sqrt(gl / (1 - r ** 2))
+            p = 2 * stdtr(gl, -t)
+        return np.where(gl > 0, p, np.nan)
+
+    def _defasar(df, colunas, defasagens):
+        # Empilhar as colunas deslocadas: plano k contém o valor em t + defasagens[k] (dentro de cada UF nos painéis)
+        ordenado = df.sort_values([c for c in ['UF', 'Ano', 'Mês'] if c in df.columns])
+        grupos = ordenado.groupby('UF', observed=True)[colunas] if 'UF' in df.columns else ordenado[colunas]
+        planos = [grupos.shift(-k).to_numpy(dtype=float) for k in defasagens]
+        return ordenado[colunas].to_numpy(dtype=float), np.stack(planos)
+
+    def ClassificarCorrelacoes(valores):
+        '''
+            Classifica um array de correlações em 'forte', 'moderada', 'fraca' ou 'desprezível'
+            pelo valor absoluto, em uma única operação vetorizada.
+        '''
+        absolutos = np.abs(np.asarray(valores, dtype=float))
+        return np.select([absolutos > limiar for limiar, _ in Analises.limiares],
+                         [classe for _, classe in Analises.limiares], default='desprezível')
+
+    @Instrumentacao.medir()
+    def CorrelacoesDetalhadas(df_unificado, metodos=('pearson', 'spearman'), defasagens=range(0, 4), colunas=None):
+        '''
+            Calcula, para todos os pares de indicadores, as correlações de cada método com
+            p-valor, número de observações e classificação, incluindo correlações cruzadas
+            defasadas: a defasagem k compara Variavel1 em t com Variavel2 em t + k (ex.:
+            Registros em t com Homicidios em t + 2). Retorna uma tabela longa com as colunas
+            Metodo, Defasagem, Variavel1, Variavel2, Correlacao, PValor, N e Classificacao.
+        '''
         try:
-            # Selecionar apenas as colunas numéricas para análise de correlação
-            df_numeric = df_unificado[['Crimes', 'Homicidios', 'Registros', 'Apreendidas', 'IDH', 'Desemprego', 'IPC']]
-            
-            # Calcular a matriz de correlação
-            correlation_matrix = df_numeric.corr()
+            colunas = list(colunas or Granularidade.indicadores(df_unificado))
+            defasagens = list(defasagens)
+            X, Y = Analises._defasar(df_unificado, colunas, defasagens)
+
+            tabelas = []
+            for metodo in metodos:
+                r, n = Analises._spearman(X, Y) if metodo == 'spearman' else Analises._pearson(X, Y)
+                indice = pd.MultiIndex.from_product([[metodo], defasagens, colunas, colunas],
+                                                    names=['Metodo', 'Defasagem', 'Variavel1', 'Variavel2'])
+                tabelas.append(pd.DataFrame({
+                    'Correlacao': r.ravel(),
+                    'PValor': Analises._p_valor(r, n).ravel(),
+                    'N': n.ravel().astype(int),
+                    'Classificacao': Analises.ClassificarCorrelacoes(r).ravel(),
+                }, index=indice))
+
+            return pd.concat(tabelas).reset_index()
+        except Exception as e:
+            print("Erro ao calcular as correlações detalhadas:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def MatrizCorrelacao(df_unificado, agrupar_por=None, metodo='pearson'):
+        '''
+            Matriz de correlação dos indicadores ('pearson' ou 'spearman'). Para painéis
+            (granularidade por UF e/ou mês), agrupar_por='UF' calcula uma matriz por grupo,
+            indexada por (UF, indicador); sem agrupamento a correlação é calculada sobre todas
+            as linhas do painel.
+        '''
+        try:
+            # Selecionar apenas as colunas de indicadores para análise de correlação
+            colunas = Granularidade.indicadores(df_unificado)
+
+            def matriz(df):
+                X = df[colunas].to_numpy(dtype=float)
+                r, n = Analises._spearman(X, X) if metodo == 'spearman' else Analises._pearson(X, X)
+
+                # A diagonal é exatamente 1 sempre que a correlação está definida
+                diagonal = np.diag_indices_from(r)
+                r[diagonal] = np.where(np.isnan(r[diagonal]), np.nan, 1.0)
+                return pd.DataFrame(r, index=colunas, columns=colunas)
+
+            # Calcular a matriz de correlação (uma por grupo, se pedido)
+            if agrupar_por is None:
+                correlation_matrix = matriz(df_unificado)
+            else:
+                grupos = df_unificado.groupby(agrupar_por, observed=True)
+                correlation_matrix = pd.concat({chave: matriz(grupo) for chave, grupo in grupos})
 
             # Retornar a matriz de correlação
             return correlation_matrix
         except Exception as e:
             print("Erro ao calcular a matriz de correlação:", e)
+            Instrumentacao.registrar_erro(e)
             return None
 
+    @Instrumentacao.medir(valor=False)
     def AnalisarCorrelacoes(df):
         try:
-            # Calcular a matriz de correlação
-            matriz_correlacao = df.corr()
+            # A entrada já é a matriz de correlação; recalcular .corr() sobre ela correlacionaria as colunas da matriz
+            matriz_correlacao = df
 
             # Verificar se a matriz de correlação foi calculada com sucesso
             if not matriz_correlacao.empty:
                 print("Análise das Correlações:")
 
-                # Iterar sobre as linhas da matriz de correlação
-                for i, row in matriz_correlacao.iterrows():
-                    # Iterar sobre os índices das colunas da matriz de correlação
-                    for j in row.index:
-                        if i != j:
-                            value = matriz_correlacao.loc[i, j]
-                            print(f"Correlação entre {i} e {j}: {value:.3f}")
-
-                            # Verificar os limiares e classificar a correlação
-                            if abs(value) > 0.8:
-                                print(f"Correlação forte entre {i} e {j}")
-                            elif abs(value) > 0.5:
-                                print(f"Correlação moderada entre {i} e {j}")
-                            elif abs(value) > 0.3:
-                                print(f"Correlação fraca entre {i} e {j}")
-                            else:
-                                print(f"Correlação desprezível entre {i} e {j}")
-
-                            print()
+                # Selecionar todos os pares fora da diagonal e classificá-los de uma vez
+                valores = matriz_correlacao.to_numpy(dtype=float)
+                linhas, colunas = np.nonzero(matriz_correlacao.index.to_numpy()[:, None] != matriz_correlacao.columns.to_numpy()[None, :])
+                classes = Analises.ClassificarCorrelacoes(valores[linhas, colunas])
+
+                texto = ''.join(
+                    f"Correlação entre {i} e {j}: {value:.3f}\nCorrelação {classe} entre {i} e {j}\n\n"
+                    for i, j, value, classe in zip(matriz_correlacao.index[linhas], matriz_correlacao.columns[colunas],
+                                                   valores[linhas, colunas], classes))
+                print(texto, end='')
             else:
                 print("A matriz de correlação está vazia. Verifique se o DataFrame possui dados.")
 
         except Exception as e:
-            print("Ocorreu um erro ao calcular a matriz de correlação:", e)
\ No newline at end of file
+            print("Ocorreu um erro ao calcular a matriz de correlação:", e)
+            Instrumentacao.registrar_erro(e)
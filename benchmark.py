@@ -0,0 +1,380 @@
+from contextlib import redirect_stdout
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+from data import Cache, Dados, Granularidade
+from instrumentacao import Instrumentacao
+from pipeline import Pipeline
+from planilhas import Planilhas
+from saidas import Saidas
+import main
+
+
+class Sintetico:
+    '''
+        Gerador de dados sintéticos com os mesmos esquemas dos arquivos de dados/ (nomes de
+        colunas, separador, vírgula decimal, BOM e fim de linha), para medir o pipeline com
+        volumes maiores que os reais. Os valores são sorteados das distribuições empíricas dos
+        arquivos originais: as fontes por registro (apreensões e a planilha de crimes) têm o
+        número de linhas multiplicado pela escala e as séries nacionais anuais mantêm os
+        mesmos anos, com ruído nos valores.
+    '''
+
+    # Número máximo de linhas de uma aba do Excel (sem o cabeçalho)
+    limite_planilha = 1_048_575
+
+    def _formato(arquivo):
+        # Codificação (com ou sem BOM) e fim de linha do arquivo original
+        with open(arquivo, 'rb') as f:
+            inicio = f.read(1 << 16)
+        codificacao = 'utf-8-sig' if inicio.startswith(b'\xef\xbb\xbf') else 'utf-8'
+        return codificacao, '\r\n' if b'\r\n' in inicio else '\n'
+
+    def _escrever_csv(df, origem, destino):
+        codificacao, terminador = Sintetico._formato(origem)
+        df.to_csv(destino, sep=';', index=False, encoding=codificacao, lineterminator=terminador)
+
+    def _ruido(valores, rng, desvio=0.05):
+        # Multiplicar os valores por um ruído log-normal, mantendo o formato (inteiro ou vírgula decimal)
+        texto = valores.astype(str)
+        decimal = texto.str.contains(',').any()
+        numeros = pd.to_numeric(texto.str.replace(',', '.'), errors='coerce').to_numpy(dtype=float)
+        numeros = numeros * rng.lognormal(0.0, desvio, size=len(numeros))
+        if not decimal:
+            return pd.Series(np.rint(numeros), index=valores.index).astype('Int64')
+        casas = int(texto.str.split(',').str[1].str.len().max())
+        return pd.Series([f'{v:.{casas}f}'.replace('.', ',') for v in numeros], index=valores.index)
+
+    def _serie(origem, destino, rng):
+        # Série nacional anual: mesmos anos, valores com ruído
+        df = pd.read_csv(origem, delimiter=';', dtype=str, encoding='utf-8-sig')
+        coluna = df.columns[-1]
+        df[coluna] = Sintetico._ruido(df[coluna], rng)
+        Sintetico._escrever_csv(df, origem, destino)
+
+    def _apreendidas(origem, destino, escala, rng):
+        real = pd.read_csv(origem, delimiter=';', encoding='utf-8-sig')
+        linhas = max(1, round(len(real) * escala))
+
+        # Local da apreensão (UF, unidade e município) sorteado em conjunto para manter a coerência
+        df = real[['UF Apreensão', 'Unidade Apreensão', 'Município']].iloc[rng.integers(0, len(real), linhas)]
+        df = df.reset_index(drop=True)
+        for coluna in ['Espécie', 'Apreendidas', 'País de origem', 'Tipo Penal']:
+            df[coluna] = real[coluna].to_numpy()[rng.integers(0, len(real), linhas)]
+
+        # Data no formato serial do Excel, com Mês e Ano derivados dela
+        serial = rng.integers(real['Data apreensão'].min(), real['Data apreensão'].max() + 1, linhas)
+        datas = pd.Timestamp('1899-12-30') + pd.to_timedelta(serial, unit='D')
+        df['Data apreensão'] = serial
+        df['Mês'] = np.array(list(Granularidade.meses))[datas.month - 1]
+        df['Ano'] = datas.year
+
+        Sintetico._escrever_csv(df[real.columns], origem, destino)
+        return linhas
+
+    def _crimes(origem, destino, escala, rng):
+        abas = Planilhas.ler_abas(origem)
+        linhas = {}
+        with pd.ExcelWriter(destino) as escritor:
+            for aba, real in abas.items():
+                # Sortear registros reais e substituir a contagem por um valor de Poisson com a mesma média
+                n = min(max(1, round(len(real) * escala)), Sintetico.limite_planilha)
+                df = real.iloc[rng.integers(0, len(real), n)].reset_index(drop=True)
+                coluna = df.columns[-1]
+                df[coluna] = rng.poisson(df[coluna].clip(lower=0))
+                df.to_excel(escritor, sheet_name=aba, index=False)
+                linhas[aba] = n
+        return linhas
+
+    def gerar(destino, escala=1, escala_planilha=None, semente=0, origem='dados'):
+        '''
+            Gera em destino/dados/ um arquivo sintético para cada arquivo de Dados.arquivos,
+            com os mesmos nomes. escala multiplica o número de apreensões e escala_planilha (por
+            padrão igual a escala) o número de linhas da planilha de crimes, limitado ao máximo
+            de linhas do Excel. A tabela de mandatos presidenciais (Dados.presidentes) é
+            copiada sem alterações. Retorna o número de linhas geradas por fonte.
+        '''
+        rng = np.random.default_rng(semente)
+        escala_planilha = escala if escala_planilha is None else escala_planilha
+        os.makedirs(os.path.join(destino, 'dados'), exist_ok=True)
+
+        linhas = {}
+        for fonte, arquivo in Dados.arquivos.items():
+            original = os.path.join(origem, os.path.basename(arquivo))
+            gerado = os.path.join(destino, arquivo)
+            if fonte == 'Apreendidas':
+                linhas[fonte] = Sintetico._apreendidas(original, gerado, escala, rng)
+            elif fonte == 'Crimes':
+                linhas[fonte] = Sintetico._crimes(original, gerado, escala_planilha, rng)
+            else:
+                Sintetico._serie(original, gerado, rng)
+
+        # Os mandatos presidenciais são uma tabela de referência, usada pelas etapas por período
+        shutil.copyfile(os.path.join(origem, os.path.basename(Dados.presidentes)), os.path.join(destino, Dados.presidentes))
+        return linhas
+
+
+class Benchmark:
+    '''
+        Mede cada etapa do grafo de main.etapas (carregadores de Dados, Dados.UniData, Analises
+        e os gráficos de Visualizacoes) sobre dados sintéticos, por escala e granularidade.
+        As etapas rodam em sequência, dentro do diretório dos dados sintéticos, e para cada
+        uma são registrados o tempo (mínimo e mediana das repetições), o tempo de CPU, o pico
+        de memória alocada pelo Python (tracemalloc, em uma execução à parte) e as linhas de
+        entrada e de saída. Nas etapas que leem arquivos, a primeira execução é feita com o
+        cache colunar vazio (segundos_frio). O pico de memória não inclui os processos filhos
+        dos pools de renderização.
+    '''
+
+    def _ambiente():
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                    check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+        }
+
+    def _arquivo_padrao(ambiente):
+        # Junto dos demais relatórios (relatorios/, fora do controle de versão)
+        return os.path.join(Instrumentacao.diretorio, 'benchmark', f"{(ambiente['commit'] or 'local')[:12]}.json")
+
+    def _linhas(valor):
+        return len(valor) if isinstance(valor, (pd.DataFrame, pd.Series)) else None
+
+    def _chamar(funcao, argumentos, parametros):
+        # Executar a etapa sem a saída de texto e medir o tempo de relógio e de CPU, incluindo
+        # as gravações em segundo plano que ela deixou pendentes
+        with redirect_stdout(io.StringIO()) as saida:
+            inicio, inicio_cpu = time.perf_counter(), time.process_time()
+            resultado = funcao(*argumentos, **parametros)
+            Saidas.aguardar()
+            segundos, cpu = time.perf_counter() - inicio, time.process_time() - inicio_cpu
+        return resultado, segundos, cpu, saida.getvalue()
+
+    def medir(etapa, argumentos, repeticoes=3):
+        '''
+            Mede uma etapa do pipeline com os resultados das dependências em argumentos.
+            Retorna (resultado, registro).
+        '''
+        funcao = Pipeline._resolver(etapa['funcao'])
+        parametros = etapa.get('parametros', {})
+        registro = {'etapa': etapa['nome'], 'segundos_frio': None}
+
+        # Etapas que leem arquivos: primeira execução com o cache vazio
+        if etapa.get('entradas'):
+            Cache.limpar()
+            _, registro['segundos_frio'], _, _ = Benchmark._chamar(funcao, argumentos, parametros)
+
+        tempos, tempos_cpu = [], []
+        for _ in range(max(1, repeticoes)):
+            resultado, segundos, cpu, saida = Benchmark._chamar(funcao, argumentos, parametros)
+            tempos.append(segundos)
+            tempos_cpu.append(cpu)
+
+        # Pico de memória em uma execução separada, pois o tracemalloc deixa o código mais lento
+        tracemalloc.start()
+        try:
+            Benchmark._chamar(funcao, argumentos, parametros)
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        # Mesmo critério de falha do pipeline: resultado None ou saída declarada não gerada
+        erro = None
+        if etapa.get('valor', True) and resultado is None:
+            erro = saida.strip() or 'a etapa retornou None'
+        elif any(not os.path.exists(caminho) for caminho in etapa.get('saidas', [])):
+            erro = saida.strip() or 'saídas não geradas'
+
+        registro.update({
+            'segundos_min': min(tempos),
+            'segundos_mediana': statistics.median(tempos),
+            'cpu_segundos': statistics.median(tempos_cpu),
+            'memoria_pico_mb': pico / 2 ** 20,
+            'linhas_entrada': sum(Benchmark._linhas(a) or 0 for a in argumentos),
+            'linhas_saida': Benchmark._linhas(resultado),
+            'erro': erro,
+        })
+        return resultado, registro
+
+    def executar(diretorio, granularidade, limite=2019, repeticoes=3):
+        '''
+            Executa e mede todas as etapas de main.etapas sobre os dados de diretorio/dados.
+            Retorna a lista de registros, um por etapa.
+        '''
+        anterior = os.getcwd()
+        os.chdir(diretorio)
+        try:
+            os.makedirs('graficos/dados', exist_ok=True)
+            valores = {}
+            registros = []
+            for etapa in main.etapas(limite, granularidade):
+                deps = etapa.get('dependencias', [])
+                if any(valores.get(dep) is None for dep in deps if dep in valores):
+                    registros.append({'etapa': etapa['nome'], 'erro': 'dependência falhou'})
+                    valores[etapa['nome']] = None
+                    continue
+                argumentos = [valores.get(dep) for dep in deps]
+                resultado, registro = Benchmark.medir(etapa, argumentos, repeticoes)
+                Instrumentacao.limpar()
+                if etapa.get('valor', True):
+                    valores[etapa['nome']] = resultado
+                registros.append(registro)
+            return registros
+        finally:
+            os.chdir(anterior)
+
+    def Executar(escalas=(1, 10, 100), granularidades=(Granularidade.ANO, Granularidade.ANO_UF), repeticoes=3,
+                 saida=None, diretorio=None, escala_planilha=None, semente=0):
+        '''
+            Gera os dados sintéticos de cada escala e mede o pipeline em cada granularidade,
+            gravando um JSON {'ambiente': {...}, 'resultados': [...]} em saida (por padrão
+            relatorios/benchmark/<commit>.json). Sem diretorio, os dados sintéticos ficam em um
+            diretório temporário removido ao final. Retorna os resultados como DataFrame.
+        '''
+        ambiente = Benchmark._ambiente()
+        saida = os.path.abspath(saida or Benchmark._arquivo_padrao(ambiente))
+        origem = os.path.abspath('dados')
+
+        resultados = []
+        for escala in escalas:
+            destino = os.path.join(diretorio, f'escala_{escala}') if diretorio else tempfile.mkdtemp(prefix='benchmark-')
+            try:
+                inicio = time.perf_counter()
+                linhas = Sintetico.gerar(destino, escala, escala_planilha, semente, origem)
+                print(f"Escala {escala}: dados sintéticos gerados em {time.perf_counter() - inicio:.1f} s {linhas}")
+
+                for granularidade in granularidades:
+                    for registro in Benchmark.executar(destino, granularidade, repeticoes=repeticoes):
+                        resultados.append({'escala': escala, 'granularidade': granularidade, **registro})
+                        print(f"  {granularidade:<10} {registro['etapa']:<32} "
+                              f"{registro.get('segundos_mediana', float('nan')):8.3f} s "
+                              f"{registro.get('memoria_pico_mb', float('nan')):9.1f} MB"
+                              + (f"  ERRO: {registro['erro']}" if registro.get('erro') else ''))
+            finally:
+                if not diretorio:
+                    shutil.rmtree(destino, ignore_errors=True)
+
+        os.makedirs(os.path.dirname(saida), exist_ok=True)
+        with open(f'{saida}.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'ambiente': ambiente, 'resultados': resultados}, f, ensure_ascii=False, indent=2)
+        os.replace(f'{saida}.tmp', saida)
+        print("Resultados gravados em", saida)
+
+        return pd.DataFrame(resultados)
+
+    # Execução de main em um subprocesso com vários processos, mesmo em máquinas com uma CPU
+    _main_paralelo = 'import os, sys; os.cpu_count = lambda: {processos}; import main; sys.exit(main.main(sys.argv[1:]))'
+
+    def reexecucao(diretorio, granularidade=Granularidade.ANO_UF, apagar=None, processos=4, tempo_limite=600):
+        '''
+            Verifica que uma reexecução incremental com parte das saídas apagadas termina:
+            executa main sobre diretorio/dados, apaga os arquivos de apagar (relativos a
+            diretorio; por padrão uma tabela e um gráfico de UF, que fazem o processo principal
+            gravar em segundo plano antes de criar os pools de processos) e executa de novo,
+            com pools de processos paralelos e limite de tempo. Retorna a lista de erros (vazia
+            se as duas execuções terminaram bem).
+        '''
+        apagar = apagar or ['graficos/dados/dfUnificado.csv', 'graficos/SP/grafico_linha.png']
+        raiz = os.path.dirname(os.path.abspath(__file__))
+        comando = [sys.executable, '-c', Benchmark._main_paralelo.format(processos=processos),
+                   '--granularidade', granularidade]
+        ambiente = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [raiz, os.environ.get('PYTHONPATH')]))}
+
+        erros = []
+        for execucao in ('primeira', 'reexecucao'):
+            if execucao == 'reexecucao':
+                for caminho in apagar:
+                    if os.path.exists(os.path.join(diretorio, caminho)):
+                        os.remove(os.path.join(diretorio, caminho))
+            try:
+                processo = subprocess.run(comando, cwd=diretorio, env=ambiente, capture_output=True, text=True,
+                                          timeout=tempo_limite)
+            except subprocess.TimeoutExpired:
+                erros.append(f'{execucao}: não terminou em {tempo_limite} s')
+                break
+            if processo.returncode != 0:
+                erros.append(f'{execucao}: código de saída {processo.returncode}')
+
+        faltantes = [caminho for caminho in apagar if not os.path.exists(os.path.join(diretorio, caminho))]
+        if not erros and faltantes:
+            erros.append(f'saídas não geradas: {faltantes}')
+        return erros
+
+    def comparar(anterior, atual, tolerancia=0.10, minimo=0.01):
+        '''
+            Compara dois arquivos de resultados por (escala, granularidade, etapa). Uma etapa é
+            marcada como regressão quando a mediana do tempo ou o pico de memória cresceu mais
+            que tolerancia (fração) e a diferença de tempo é maior que minimo segundos.
+        '''
+        tabelas = []
+        for arquivo in (anterior, atual):
+            with open(arquivo, encoding='utf-8') as f:
+                tabelas.append(pd.DataFrame(json.load(f)['resultados']))
+
+        chaves = ['escala', 'granularidade', 'etapa']
+        colunas = chaves + ['segundos_mediana', 'memoria_pico_mb']
+        df = tabelas[0][colunas].merge(tabelas[1][colunas], on=chaves, suffixes=('_anterior', '_atual'))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['razao_tempo'] = df['segundos_mediana_atual'] / df['segundos_mediana_anterior']
+            df['razao_memoria'] = df['memoria_pico_mb_atual'] / df['memoria_pico_mb_anterior']
+        lento = (df['razao_tempo'] > 1 + tolerancia) & \
+                (df['segundos_mediana_atual'] - df['segundos_mediana_anterior'] > minimo)
+        df['regressao'] = lento | (df['razao_memoria'] > 1 + tolerancia)
+        return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark do pipeline com dados sintéticos.')
+    parser.add_argument('--escalas', type=float, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--granularidades', nargs='+', default=[Granularidade.ANO, Granularidade.ANO_UF],
+                        choices=list(Granularidade.chaves))
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--escala-planilha', type=float, default=None,
+                        help='escala da planilha de crimes (padrão: a mesma das apreensões)')
+    parser.add_argument('--saida', default=None, help='arquivo JSON de resultados')
+    parser.add_argument('--diretorio', default=None, help='manter os dados sintéticos neste diretório')
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--comparar', default=None, help='resultados anteriores para comparação')
+    parser.add_argument('--reexecucao', action='store_true',
+                        help='só verificar que uma reexecução em painel com saídas apagadas termina')
+    args = parser.parse_args()
+
+    if args.reexecucao:
+        with tempfile.TemporaryDirectory(prefix='benchmark-') as destino:
+            Sintetico.gerar(destino, semente=args.semente, origem=os.path.abspath('dados'))
+            erros = Benchmark.reexecucao(destino)
+        print('\n'.join(erros) if erros else 'Reexecução concluída.')
+        sys.exit(1 if erros else 0)
+
+    escalas = [int(e) if float(e).is_integer() else e for e in args.escalas]
+    Benchmark.Executar(escalas, args.granularidades, args.repeticoes, args.saida, args.diretorio,
+                       args.escala_planilha, args.semente)
+
+    if args.comparar:
+        saida = args.saida or Benchmark._arquivo_padrao(Benchmark._ambiente())
+        comparacao = Benchmark.comparar(args.comparar, saida)
+        print(comparacao[comparacao['regressao']].to_string(index=False) if comparacao['regressao'].any()
+              else "Nenhuma regressão encontrada.")
@@ -0,0 +1,135 @@
+from concurrent.futures import ProcessPoolExecutor
+import warnings
+
+import pandas as pd
+import numpy as np
+
+from analises import Analises
+from data import Granularidade
+from instrumentacao import Instrumentacao
+
+
+class Bootstrap:
+    '''
+        Intervalos de confiança por bootstrap e testes de permutação para as correlações de
+        Pearson dos indicadores. As reamostragens de um lote são sorteadas como uma única
+        matriz de índices (reamostragens x linhas) e todas as matrizes de correlação do lote
+        são calculadas de uma vez pelo motor vetorizado de Analises, sem laço sobre as
+        reamostragens. Cada lote tem a sua própria semente derivada de semente, de forma que o
+        resultado é o mesmo com qualquer número de processos.
+    '''
+
+    # Número máximo de valores (reamostragens x linhas) sorteados por lote quando tamanho_lote não é informado
+    valores_por_lote = 500_000
+
+    def _sementes(semente, total, tamanho_lote):
+        # Uma semente independente por lote, derivada da semente principal
+        tamanhos = [min(tamanho_lote, total - inicio) for inicio in range(0, total, tamanho_lote)]
+        return list(zip(np.random.SeedSequence(semente).spawn(len(tamanhos)), tamanhos))
+
+    def _lote_bootstrap(X, semente, tamanho):
+        # Sortear as linhas com reposição e calcular as correlações de todas as reamostragens do lote
+        indices = np.random.default_rng(semente).integers(0, X.shape[0], size=(tamanho, X.shape[0]))
+        amostras = X[indices]
+        r, _ = Analises._pearson(amostras, amostras)
+        return r
+
+    def _padroes(X):
+        # Pares de colunas agrupados pelo padrão de linhas em que os dois valores existem: (linhas, máscara de pares)
+        m = ~np.isnan(X)
+        pares = m[:, :, None] & m[:, None, :]
+        padroes, inverso = np.unique(np.packbits(pares.reshape(X.shape[0], -1).T, axis=1), axis=0, return_inverse=True)
+        inverso = inverso.reshape(X.shape[1], X.shape[1])
+        return [(np.unpackbits(padrao)[:X.shape[0]].astype(bool), inverso == indice)
+                for indice, padrao in enumerate(padroes)]
+
+    def _lote_permutacao(X, semente, tamanho):
+        # Permutar as linhas de Y em relação a X, quebrando a associação entre as variáveis. A permutação é
+        # feita só entre as linhas em que os dois valores do par existem, para que cada par mantenha o seu n
+        # sob a hipótese nula; os pares com o mesmo padrão de linhas válidas são permutados juntos, como em
+        # Analises._spearman
+        rng = np.random.default_rng(semente)
+        r = np.full((tamanho, X.shape[1], X.shape[1]), np.nan)
+        for linhas, pares in Bootstrap._padroes(X):
+            if linhas.sum() < 2:
+                continue
+            validas = X[linhas]
+            indices = rng.permuted(np.tile(np.arange(validas.shape[0]), (tamanho, 1)), axis=1)
+            r_padrao, _ = Analises._pearson(validas, validas[indices])
+            r[:, pares] = r_padrao[:, pares]
+        return r
+
+    def _executar(funcao, X, semente, total, tamanho_lote, processos):
+        # Lotes menores para painéis com muitas linhas, limitando a memória de cada lote
+        tamanho_lote = tamanho_lote or max(1, min(1000, Bootstrap.valores_por_lote // max(1, X.shape[0])))
+        lotes = Bootstrap._sementes(semente, total, tamanho_lote)
+        if processos > 1 and len(lotes) > 1:
+            with ProcessPoolExecutor(max_workers=processos) as pool:
+                futuros = [pool.submit(funcao, X, s, tamanho) for s, tamanho in lotes]
+                resultados = [futuro.result() for futuro in futuros]
+        else:
+            resultados = [funcao(X, s, tamanho) for s, tamanho in lotes]
+        return np.concatenate(resultados)
+
+    def _tabela(colunas, **valores):
+        # Converter matrizes (k, k) em uma tabela longa por par de variáveis
+        indice = pd.MultiIndex.from_product([colunas, colunas], names=['Variavel1', 'Variavel2'])
+        return pd.DataFrame({nome: matriz.ravel() for nome, matriz in valores.items()}, index=indice).reset_index()
+
+    @Instrumentacao.medir()
+    def IntervalosConfianca(df_unificado, reamostragens=10000, confianca=0.95, semente=None,
+                            tamanho_lote=None, processos=1, colunas=None):
+        '''
+            Intervalos de confiança por bootstrap (percentis) para a correlação de Pearson de
+            todos os pares de indicadores. Retorna uma tabela com Variavel1, Variavel2,
+            Correlacao, LimiteInferior, LimiteSuperior, ErroPadrao e Reamostragens (número de
+            reamostragens em que a correlação do par estava definida).
+        '''
+        try:
+            colunas = list(colunas or Granularidade.indicadores(df_unificado))
+            X = df_unificado[colunas].to_numpy(dtype=float)
+
+            observada, _ = Analises._pearson(X, X)
+            r = Bootstrap._executar(Bootstrap._lote_bootstrap, X, semente, reamostragens, tamanho_lote, processos)
+
+            # Percentis calculados sobre as reamostragens em que a correlação está definida
+            alfa = (1 - confianca) / 2
+            validas = (~np.isnan(r)).sum(axis=0)
+            with warnings.catch_warnings():
+                # Pares sem nenhuma reamostragem válida resultam em NaN
+                warnings.simplefilter('ignore', RuntimeWarning)
+                inferior, superior = np.nanquantile(r, [alfa, 1 - alfa], axis=0)
+                erro_padrao = np.nanstd(r, axis=0, ddof=1)
+
+            return Bootstrap._tabela(colunas, Correlacao=observada, LimiteInferior=inferior, LimiteSuperior=superior,
+                                     ErroPadrao=erro_padrao, Reamostragens=validas)
+        except Exception as e:
+            print("Erro ao calcular os intervalos de confiança por bootstrap:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def TestePermutacao(df_unificado, permutacoes=10000, semente=None, tamanho_lote=None, processos=1, colunas=None):
+        '''
+            Teste de permutação bicaudal para a correlação de Pearson de todos os pares de
+            indicadores. Retorna uma tabela com Variavel1, Variavel2, Correlacao e PValor, com
+            PValor = (1 + permutações com |r| >= |r observado|) / (1 + permutações válidas).
+        '''
+        try:
+            colunas = list(colunas or Granularidade.indicadores(df_unificado))
+            X = df_unificado[colunas].to_numpy(dtype=float)
+
+            observada, _ = Analises._pearson(X, X)
+            r = Bootstrap._executar(Bootstrap._lote_permutacao, X, semente, permutacoes, tamanho_lote, processos)
+
+            # Contar, para todos os pares de uma vez, as permutações tão extremas quanto a observada
+            with np.errstate(invalid='ignore'):
+                extremas = (np.abs(r) >= np.abs(observada) - 1e-12).sum(axis=0)
+                validas = (~np.isnan(r)).sum(axis=0)
+                p_valor = np.where(np.isnan(observada), np.nan, (1 + extremas) / (1 + validas))
+
+            return Bootstrap._tabela(colunas, Correlacao=observada, PValor=p_valor)
+        except Exception as e:
+            print("Erro ao calcular o teste de permutação:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+from data import Cache, Dados, Granularidade
+from instrumentacao import Instrumentacao
+
+
+class Cubo:
+    '''
+        Cubo OLAP das apreensões de armas: os registros de Dados.CarregarRegistros('Apreendidas')
+        são agregados (soma das armas apreendidas e número de registros) por combinações de
+        dimensões previamente escolhidas, e cada agregado é gravado no cache colunar ao lado
+        da cópia do arquivo de origem, sendo reconstruído apenas quando o arquivo muda.
+
+        Cubo.Consultar responde qualquer agrupamento e recorte a partir do menor agregado que
+        contém as dimensões envolvidas, sem reler os registros. Ex.: pistolas de origem
+        estrangeira apreendidas em SP, por mês:
+            Cubo.Consultar(por=['Ano', 'Mês'], filtros={'Espécie': 'Pistola', 'Origem': 'Estrangeira', 'UF': 'SP'})
+    '''
+
+    fonte = 'Apreendidas'
+
+    # Dimensões do cubo; 'Origem' agrupa os países em nacional, estrangeira e não identificada
+    dimensoes = ['Ano', 'Mês', 'UF', 'Espécie', 'Origem', 'País de origem', 'Tipo Penal']
+    medidas = ['Apreendidas', 'Registros']
+
+    # Agregados materializados, do menor para o maior; o último (todas as dimensões) responde qualquer consulta
+    agregados = [
+        ['Ano'],
+        ['Ano', 'UF'],
+        ['Ano', 'Espécie'],
+        ['Ano', 'Origem'],
+        ['Ano', 'País de origem'],
+        ['Ano', 'Tipo Penal'],
+        ['Ano', 'Mês', 'UF'],
+        ['Ano', 'UF', 'Espécie', 'Origem'],
+        ['Ano', 'Mês', 'UF', 'Espécie', 'Origem'],
+        ['Ano', 'UF', 'Espécie', 'País de origem', 'Tipo Penal'],
+        dimensoes,
+    ]
+
+    versao = 1
+
+    def _base(pacote=None, alternativa=None):
+        # Agregado com todas as dimensões, calculado a partir dos registros individuais
+        registros = Dados.CarregarRegistros(Cubo.fonte, pacote=pacote, alternativa=alternativa)
+        if registros is None:
+            raise ValueError(f"Não foi possível carregar os registros de {Cubo.fonte}")
+
+        pais = registros['País de origem'].astype(str)
+        origem = np.select([pais == 'Brasil', pais == 'Não identificado'], ['Nacional', 'Não identificada'],
+                           default='Estrangeira')
+        df = pd.DataFrame({
+            'Ano': registros['Ano'].astype('int16'),
+            'Mês': Granularidade.codificar_mes(registros['Mês']),
+            'UF': Granularidade.codificar_uf(registros['UF Apreensão']),
+            'Espécie': registros['Espécie'].astype('category'),
+            'Origem': pd.Categorical(origem, categories=['Nacional', 'Estrangeira', 'Não identificada']),
+            'País de origem': registros['País de origem'].astype('category'),
+            'Tipo Penal': registros['Tipo Penal'].astype('category'),
+            'Apreendidas': registros['Apreendidas'].astype('int64'),
+            'Registros': np.ones(len(registros), dtype='int64'),
+        })
+        return Cubo._agregar(df, Cubo.dimensoes)
+
+    def _agregar(df, dimensoes):
+        if not dimensoes:
+            return df[Cubo.medidas].sum().to_frame().T
+        return df.groupby(list(dimensoes), observed=True, dropna=False)[Cubo.medidas].sum().reset_index()
+
+    def _variante(dimensoes, alternativa):
+        return f"cubo={Cubo.versao};{'|'.join(dimensoes)};alternativa={alternativa or ''}"
+
+    def _ler(dimensoes, pacote=None, alternativa=None, base=None):
+        # Agregado pelo cache colunar; ao ser (re)construído, parte do agregado completo, calculado uma única vez
+        declaracao = Dados._declaracao(Cubo.fonte, pacote, alternativa)
+        base = {} if base is None else base
+
+        def construir(_):
+            if base.get('df') is None:
+                base['df'] = Cubo._base(pacote, alternativa)
+            return Cubo._agregar(base['df'], dimensoes)
+
+        return Cache.ler(declaracao['arquivo'], construir, variante=Cubo._variante(dimensoes, alternativa))
+
+    @Instrumentacao.medir()
+    def Construir(pacote=None, alternativa=None):
+        '''
+            Materializa (ou valida) todos os agregados do cubo e retorna {dimensões: linhas}.
+            pacote e alternativa escolhem o arquivo de origem, como em Dados.Carregar.
+        '''
+        try:
+            base = {}
+            return {' x '.join(dimensoes): len(Cubo._ler(dimensoes, pacote, alternativa, base))
+                    for dimensoes in Cubo.agregados}
+        except Exception as e:
+            print("Erro ao construir o cubo de apreensões:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    def _filtrar(df, filtros):
+        # Filtros {dimensão: valor ou lista de valores}; UFs podem ser siglas ou nomes por extenso
+        for dimensao, valores in filtros.items():
+            valores = list(valores) if isinstance(valores, (list, tuple, set)) else [valores]
+            if dimensao == 'UF':
+                valores = [Granularidade.siglas.get(uf, uf) for uf in valores]
+            if dimensao == 'Mês':
+                valores = list(Granularidade.codificar_mes(valores))
+            df = df[df[dimensao].isin(valores)]
+        return df
+
+    @Instrumentacao.medir()
+    def Consultar(por=('Ano',), filtros=None, pacote=None, alternativa=None):
+        '''
+            Soma das armas apreendidas e número de registros agrupados pelas dimensões em por
+            (uma lista vazia retorna o total), considerando apenas os registros que atendem a
+            filtros ({dimensão: valor ou lista de valores}). A consulta é respondida pelo menor
+            agregado materializado que contém as dimensões de por e de filtros.
+        '''
+        try:
+            por, filtros = list(por), dict(filtros or {})
+            desconhecidas = [d for d in por + list(filtros) if d not in Cubo.dimensoes]
+            if desconhecidas:
+                raise ValueError(f"Dimensões desconhecidas: {desconhecidas}. Use uma de {Cubo.dimensoes}.")
+
+            necessarias = set(por) | set(filtros)
+            dimensoes = next(d for d in Cubo.agregados if necessarias <= set(d))
+            df = Cubo._filtrar(Cubo._ler(dimensoes, pacote, alternativa), filtros)
+            return Cubo._agregar(df, por)
+        except Exception as e:
+            print("Erro ao consultar o cubo de apreensões:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
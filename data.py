@@ -1,43 +1,680 @@
+from contextlib import contextmanager
+import hashlib
+import io
+import json
+import os
+import unicodedata
+import zipfile
+
+import numpy as np
 import pandas as pd
 
-class Dados:
+from instrumentacao import Instrumentacao
+from planilhas import Planilhas
 
-    def Crimes(limite):
-        ''''
 
-            Autor: Ministério da Justiça e Segurança Pública
-            Título do site: Dados Nacionais de Segurança Pública - UF
-            URL: https://dados.mj.gov.br/dataset/sistema-nacional-de-estatisticas-de-seguranca-publica
-            Exemplo de citação no formato ABNT:
+class Pacote:
+    '''
+        Leitura das fontes diretamente de um arquivo .zip (ex.: dados/Arquivo Comprimido.zip),
+        sem extraí-lo. Um membro é indicado pelo caminho do .zip seguido do nome do membro,
+        como em 'dados/Arquivo Comprimido.zip/apreendidas.csv'; caminhos sem .zip são
+        arquivos comuns e passam pelas mesmas funções sem alteração.
 
-            MINISTÉRIO DA JUSTIÇA E SEGURANÇA PÚBLICA. Dados Nacionais de Segurança Pública - UF. Disponível em: https://dados.mj.gov.br/dataset/sistema-nacional-de-estatisticas-de-seguranca-publica. 
-            Acesso em: 20 de setembro de 2021.
+        Os nomes dos membros são normalizados (UTF-8 em NFC, mesmo quando o .zip foi gerado
+        no macOS sem a marcação de UTF-8) e as entradas de metadados do macOS (__MACOSX/,
+        ._*, .DS_Store) são ignoradas. Na primeira leitura de cada membro o CRC-32 é
+        conferido e o SHA-256 do conteúdo é gravado em Pacote.diretorio; as leituras
+        seguintes usam o valor gravado enquanto o .zip não mudar.
+    '''
+
+    diretorio = 'dados/.cache/pacotes'
+    versao = 1
+
+    _indices = {}
+
+    def separar(caminho):
+        '''
+            Separa o caminho em (arquivo .zip, nome do membro). Para arquivos comuns retorna
+            (caminho, None).
+        '''
+        partes = os.path.normpath(caminho).split(os.sep)
+        for i in range(1, len(partes)):
+            arquivo = os.sep.join(partes[:i])
+            if arquivo.lower().endswith('.zip') and os.path.isfile(arquivo):
+                return arquivo, '/'.join(partes[i:])
+        return caminho, None
+
+    def _nome(info):
+        # Nomes gravados sem a marcação de UTF-8 são decodificados pelo zipfile como cp437
+        nome = info.filename
+        if not info.flag_bits & 0x800:
+            try:
+                nome = nome.encode('cp437').decode('utf-8')
+            except UnicodeError:
+                pass
+        return unicodedata.normalize('NFC', nome)
+
+    def _ignorar(nome):
+        # Diretórios e metadados do macOS (resource forks e .DS_Store)
+        base = nome.rsplit('/', 1)[-1]
+        return nome.endswith('/') or nome.startswith('__MACOSX/') or base.startswith('._') or base == '.DS_Store'
+
+    def membros(arquivo):
+        '''
+            Retorna {nome normalizado: ZipInfo} dos membros de dados do .zip. O índice é
+            mantido em memória enquanto o .zip não mudar.
+        '''
+        stat = os.stat(arquivo)
+        chave = (os.path.abspath(arquivo), stat.st_mtime_ns, stat.st_size)
+        if chave not in Pacote._indices:
+            with zipfile.ZipFile(arquivo) as z:
+                Pacote._indices[chave] = {Pacote._nome(info): info for info in z.infolist()
+                                          if not Pacote._ignorar(Pacote._nome(info))}
+        return Pacote._indices[chave]
+
+    def _info(arquivo, membro):
+        info = Pacote.membros(arquivo).get(unicodedata.normalize('NFC', membro))
+        if info is None:
+            raise FileNotFoundError(f"Membro não encontrado em {arquivo}: {membro}")
+        return info
+
+    @contextmanager
+    def abrir(caminho):
+        '''
+            Abre o arquivo ou o membro do .zip para leitura binária. Membros são
+            descomprimidos à medida que são lidos, sem arquivos temporários.
+        '''
+        arquivo, membro = Pacote.separar(caminho)
+        if membro is None:
+            with open(caminho, 'rb') as f:
+                yield f
+            return
+
+        info = Pacote._info(arquivo, membro)
+        with zipfile.ZipFile(arquivo) as z, z.open(info) as f:
+            yield f
+
+    def assinatura(caminho):
+        '''
+            (mtime_ns, tamanho) usados para validar entradas de cache: do próprio arquivo ou,
+            para membros, o mtime do .zip e o tamanho descomprimido do membro.
+        '''
+        arquivo, membro = Pacote.separar(caminho)
+        stat = os.stat(arquivo)
+        if membro is None:
+            return stat.st_mtime_ns, stat.st_size
+        return stat.st_mtime_ns, Pacote._info(arquivo, membro).file_size
+
+    def _caminho_manifesto(arquivo):
+        chave = hashlib.sha1(os.path.abspath(arquivo).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(Pacote.diretorio, f'{os.path.basename(arquivo)}.{chave}.json')
+
+    def verificar(caminho):
+        '''
+            Confere o membro (CRC-32, verificado pelo zipfile ao final da leitura) e retorna o
+            SHA-256 do seu conteúdo. A verificação é feita uma única vez por versão do .zip;
+            para arquivos comuns apenas calcula o SHA-256.
+        '''
+        arquivo, membro = Pacote.separar(caminho)
+        if membro is None:
+            return Cache._hash_conteudo(caminho)
+
+        info = Pacote._info(arquivo, membro)
+        caminho_manifesto = Pacote._caminho_manifesto(arquivo)
+        stat = os.stat(arquivo)
+
+        manifesto = None
+        if os.path.exists(caminho_manifesto):
+            with open(caminho_manifesto, encoding='utf-8') as f:
+                manifesto = json.load(f)
+        if not manifesto or [manifesto.get(c) for c in ('versao', 'mtime_ns', 'tamanho')] != \
+                [Pacote.versao, stat.st_mtime_ns, stat.st_size]:
+            manifesto = {'versao': Pacote.versao, 'arquivo': os.path.abspath(arquivo),
+                         'mtime_ns': stat.st_mtime_ns, 'tamanho': stat.st_size, 'membros': {}}
+
+        salvo = manifesto['membros'].get(membro)
+        if salvo and salvo['crc32'] == info.CRC and salvo['tamanho'] == info.file_size:
+            return salvo['sha256']
+
+        sha = hashlib.sha256()
+        with Pacote.abrir(caminho) as f:
+            for bloco in iter(lambda: f.read(1 << 20), b''):
+                sha.update(bloco)
+
+        # Processos concorrentes podem sobrescrever a verificação um do outro; no pior caso o membro é verificado de novo
+        manifesto['membros'][membro] = {'crc32': info.CRC, 'tamanho': info.file_size, 'sha256': sha.hexdigest()}
+        os.makedirs(Pacote.diretorio, exist_ok=True)
+        Cache._gravar_atomico(caminho_manifesto, lambda t: Cache._escrever_json(t, manifesto))
+        return sha.hexdigest()
+
+    def ler(caminho, leitor, sequencial=True):
+        '''
+            Aplica leitor ao arquivo. Para membros do .zip, o membro é verificado e leitor
+            recebe o fluxo descomprimido; com sequencial=False (leitores que precisam de
+            acesso aleatório, como os de planilhas .xlsx e .ods) o membro é carregado em
+            memória.
+        '''
+        arquivo, membro = Pacote.separar(caminho)
+        if membro is None:
+            return leitor(caminho)
+
+        Pacote.verificar(caminho)
+        with Pacote.abrir(caminho) as f:
+            return leitor(f if sequencial else io.BytesIO(f.read()))
+
+
+class Cache:
+    '''
+        Cache colunar das fontes brutas de dados/.
+
+        Cada arquivo é convertido uma única vez para Arrow/Feather (sem compressão, para
+        permitir memory mapping) e as leituras seguintes são servidas a partir dessa cópia.
+        A entrada é identificada pelo caminho do arquivo e validada pelo mtime, tamanho e
+        hash SHA-256 do conteúdo; entradas desatualizadas são reconstruídas automaticamente.
+        Membros de arquivos .zip (ver Pacote) são validados pelo .zip e pelo SHA-256 verificado
+        do membro.
+    '''
+
+    diretorio = 'dados/.cache'
+    versao = 1
+
+    def _hash_conteudo(arquivo):
+        # Calcular o SHA-256 do arquivo em blocos de 1 MB (membros de .zip usam o valor verificado)
+        if Pacote.separar(arquivo)[1] is not None:
+            return Pacote.verificar(arquivo)
+        sha = hashlib.sha256()
+        with open(arquivo, 'rb') as f:
+            for bloco in iter(lambda: f.read(1 << 20), b''):
+                sha.update(bloco)
+        return sha.hexdigest()
+
+    def _caminhos(arquivo, variante):
+        # Nome da entrada derivado do caminho absoluto do arquivo e da variante de leitura
+        chave = hashlib.sha1(f'{os.path.abspath(arquivo)}|{variante}'.encode('utf-8')).hexdigest()[:16]
+        base = os.path.join(Cache.diretorio, f'{os.path.basename(arquivo)}.{chave}')
+        return base + '.feather', base + '.json'
+
+    def _gravar_atomico(caminho, escrever):
+        # Escrever em arquivo temporário e renomear, para que leitores nunca vejam arquivos parciais
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        try:
+            escrever(temporario)
+            os.replace(temporario, caminho)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def _escrever_json(caminho, conteudo):
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(conteudo, f, ensure_ascii=False, indent=2)
+
+    def valido(arquivo, variante=''):
+        '''
+            Verifica se existe uma entrada atualizada para o arquivo, sem reconstruí-la.
+            Quando apenas o mtime mudou mas o conteúdo é o mesmo, o manifesto é atualizado.
+        '''
+        caminho_dados, caminho_manifesto = Cache._caminhos(arquivo, variante)
+        if not (os.path.exists(caminho_dados) and os.path.exists(caminho_manifesto)):
+            return False
+
+        with open(caminho_manifesto, encoding='utf-8') as f:
+            manifesto = json.load(f)
+
+        mtime_ns, tamanho = Pacote.assinatura(arquivo)
+        if manifesto.get('versao') != Cache.versao or manifesto.get('tamanho') != tamanho:
+            return False
+
+        # Caminho rápido: mesmo mtime e tamanho
+        if manifesto.get('mtime_ns') == mtime_ns:
+            return True
+
+        # O mtime mudou: comparar o hash do conteúdo antes de invalidar a entrada
+        if manifesto.get('sha256') != Cache._hash_conteudo(arquivo):
+            return False
+
+        manifesto['mtime_ns'] = mtime_ns
+        Cache._gravar_atomico(caminho_manifesto, lambda t: Cache._escrever_json(t, manifesto))
+        return True
+
+    def _filtrar(df, filtro):
+        # Filtro {coluna: (mínimo, máximo) ou lista de valores} aplicado a um DataFrame
+        for coluna, condicao in (filtro or {}).items():
+            if isinstance(condicao, tuple):
+                minimo, maximo = condicao
+                if minimo is not None:
+                    df = df[df[coluna] >= minimo]
+                if maximo is not None:
+                    df = df[df[coluna] <= maximo]
+            else:
+                df = df[df[coluna].isin(list(condicao))]
+        return df
+
+    def _filtrar_tabela(tabela, filtro):
+        # Mesmo filtro aplicado à tabela Arrow, antes da conversão para pandas
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        mascara = None
+        for coluna, condicao in filtro.items():
+            campo = tabela[coluna]
+            if isinstance(condicao, tuple):
+                partes = [pc.greater_equal(campo, condicao[0]) if condicao[0] is not None else None,
+                          pc.less_equal(campo, condicao[1]) if condicao[1] is not None else None]
+            else:
+                partes = [pc.is_in(campo, value_set=pa.array(list(condicao), type=campo.type))]
+            for parte in partes:
+                if parte is not None:
+                    mascara = parte if mascara is None else pc.and_(mascara, parte)
+        return tabela if mascara is None else tabela.filter(mascara)
+
+    def ler(arquivo, leitor, variante='', colunas=None, filtro=None):
+        '''
+            Retorna o DataFrame do arquivo a partir do cache, reconstruindo a entrada com
+            leitor(arquivo) quando ela não existe ou está desatualizada. O parâmetro variante
+            distingue leituras diferentes do mesmo arquivo (por exemplo, abas de uma planilha)
+            e colunas permite carregar apenas parte das colunas armazenadas.
+
+            filtro ({coluna: (mínimo, máximo) ou lista de valores}) é aplicado sobre a cópia
+            Arrow mapeada em memória, antes da conversão para pandas: apenas as colunas pedidas
+            e as do filtro são lidas e só as linhas selecionadas são convertidas.
         '''
         try:
-            # Abrir o arquivo .xlsx
-            arquivo = 'dados/indicadoressegurancapublicauf.xlsx'
-            df = pd.read_excel(arquivo, sheet_name=0)
+            from pyarrow import feather
+        except ImportError:
+            # Sem pyarrow, ler diretamente a fonte original
+            df = Cache._filtrar(leitor(arquivo), filtro)
+            return df if colunas is None else df[colunas]
+
+        caminho_dados, caminho_manifesto = Cache._caminhos(arquivo, variante)
+
+        if not Cache.valido(arquivo, variante):
+            os.makedirs(Cache.diretorio, exist_ok=True)
+            mtime_ns, tamanho = Pacote.assinatura(arquivo)
+            df = leitor(arquivo).reset_index(drop=True)
+
+            # Gravar os dados antes do manifesto: um manifesto só existe para dados completos
+            Cache._gravar_atomico(caminho_dados, lambda t: feather.write_feather(df, t, compression='uncompressed'))
+            manifesto = {
+                'versao': Cache.versao,
+                'arquivo': os.path.abspath(arquivo),
+                'variante': variante,
+                'mtime_ns': mtime_ns,
+                'tamanho': tamanho,
+                'sha256': Cache._hash_conteudo(arquivo),
+            }
+            Cache._gravar_atomico(caminho_manifesto, lambda t: Cache._escrever_json(t, manifesto))
+
+        if not filtro:
+            return feather.read_table(caminho_dados, columns=colunas, memory_map=True).to_pandas()
+
+        leitura = None if colunas is None else list(dict.fromkeys(list(colunas) + list(filtro)))
+        tabela = Cache._filtrar_tabela(feather.read_table(caminho_dados, columns=leitura, memory_map=True), filtro)
+        return (tabela if colunas is None else tabela.select(list(colunas))).to_pandas()
+
+    def limpar():
+        '''
+            Remove todas as entradas do cache, inclusive as dos subdiretórios (ex.: os modelos
+            de Imputacao e os resultados do pipeline). O diretório do cache é mantido.
+        '''
+        if os.path.isdir(Cache.diretorio):
+            for raiz, diretorios, arquivos in os.walk(Cache.diretorio, topdown=False):
+                for nome in arquivos:
+                    os.remove(os.path.join(raiz, nome))
+                for nome in diretorios:
+                    os.rmdir(os.path.join(raiz, nome))
+
+
+class Granularidade:
+    '''
+        Níveis de detalhe do pipeline: 'ano' (série nacional anual), 'ano_uf' (painel ano x UF)
+        e 'ano_mes_uf' (painel ano x mês x UF). As chaves do painel são codificadas em tipos
+        compactos: 'Ano' como int16, 'Mês' como int8 (1 a 12) e 'UF' como categoria com as 27
+        siglas, evitando chaves de agrupamento em strings Python.
+    '''
+
+    ANO = 'ano'
+    ANO_UF = 'ano_uf'
+    ANO_MES_UF = 'ano_mes_uf'
+
+    # Colunas-chave de cada granularidade, na ordem canônica
+    chaves = {
+        ANO: ['Ano'],
+        ANO_UF: ['Ano', 'UF'],
+        ANO_MES_UF: ['Ano', 'Mês', 'UF'],
+    }
+    colunas = ['Ano', 'Mês', 'UF']
+
+    ufs = ['AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+           'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO']
+
+    siglas = {
+        'Acre': 'AC', 'Alagoas': 'AL', 'Amazonas': 'AM', 'Amapá': 'AP', 'Bahia': 'BA', 'Ceará': 'CE',
+        'Distrito Federal': 'DF', 'Espírito Santo': 'ES', 'Goiás': 'GO', 'Maranhão': 'MA',
+        'Minas Gerais': 'MG', 'Mato Grosso do Sul': 'MS', 'Mato Grosso': 'MT', 'Pará': 'PA',
+        'Paraíba': 'PB', 'Pernambuco': 'PE', 'Piauí': 'PI', 'Paraná': 'PR', 'Rio de Janeiro': 'RJ',
+        'Rio Grande do Norte': 'RN', 'Rondônia': 'RO', 'Roraima': 'RR', 'Rio Grande do Sul': 'RS',
+        'Santa Catarina': 'SC', 'Sergipe': 'SE', 'São Paulo': 'SP', 'Tocantins': 'TO',
+    }
+
+    meses = {
+        'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
+        'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12,
+    }
+
+    def indicadores(df):
+        # Colunas de indicadores: as colunas numéricas que não são chaves, na ordem do DataFrame
+        return [coluna for coluna in df.select_dtypes(include='number').columns if coluna not in Granularidade.colunas]
+
+    def validar(granularidade):
+        if granularidade not in Granularidade.chaves:
+            raise ValueError(f"Granularidade inválida: {granularidade}. Use uma de {list(Granularidade.chaves)}.")
+        return Granularidade.chaves[granularidade]
+
+    def codificar_uf(valores):
+        # Traduzir apenas as categorias distintas (sigla ou nome por extenso) e reaproveitar os códigos
+        categorias = pd.Series(valores).astype('category').cat
+        tabela = pd.Categorical([Granularidade.siglas.get(uf, uf) for uf in categorias.categories],
+                                categories=Granularidade.ufs).codes
+        codigos = np.where(categorias.codes >= 0, tabela[categorias.codes], -1)
+        return pd.Categorical.from_codes(codigos, categories=Granularidade.ufs)
+
+    def codificar_mes(valores):
+        # Aceitar o mês abreviado ('jan'), por extenso ('janeiro') ou já numérico
+        categorias = pd.Series(valores).astype('category').cat
+        tabela = np.array([Granularidade.meses.get(str(mes)[:3].lower(), mes) for mes in categorias.categories], dtype='int8')
+        return tabela[categorias.codes]
+
+    def codificar(df, granularidade, uf='UF', mes='Mês'):
+        '''
+            Converte as colunas-chave do DataFrame para os tipos compactos da granularidade,
+            renomeando as colunas de origem uf e mes para 'UF' e 'Mês'. Para 'ano' o
+            DataFrame é retornado sem alterações.
+        '''
+        chaves = Granularidade.validar(granularidade)
+        if granularidade == Granularidade.ANO:
+            return df
+
+        df = df.rename(columns={uf: 'UF', mes: 'Mês'})
+        codificado = {'Ano': df['Ano'].astype('int16')}
+        if 'Mês' in chaves:
+            codificado['Mês'] = Granularidade.codificar_mes(df['Mês'])
+        codificado['UF'] = Granularidade.codificar_uf(df['UF'])
+
+        return df.assign(**codificado)
+
+
+class Compacto:
+    '''
+        Representação compacta de tabelas de registros individuais (ex.: as apreensões):
+        colunas de texto com poucos valores distintos são codificadas como categorias (um
+        dicionário de valores e códigos inteiros), inteiros são reduzidos ao menor tipo que
+        comporta os valores e datas em número de série do Excel são convertidas para
+        datetime64 de uma vez.
+    '''
+
+    # Fração máxima de valores distintos para que uma coluna de texto vire categoria
+    limite_categorias = 0.5
+
+    # Dia zero dos números de série de datas do Excel (sistema de 1900)
+    origem_excel = '1899-12-30'
 
-            # Filtrar o DataFrame para 'Tipo Crime' contendo 'Roubo' ou 'Morte'
-            filtro = df['Tipo Crime'].str.contains('Roubo|Morte', case=False)
-            df_filtrado = df[filtro]
+    def datas_excel(serie):
+        # Números de série do Excel para datetime64, vetorizado; colunas que já são datas são mantidas
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return serie
+        return pd.to_datetime(serie, unit='D', origin=Compacto.origem_excel)
 
-            # Filtrar os dados até o ano máximo de limite
-            df_filtrado = df_filtrado[df_filtrado['Ano'] <= limite]
+    def compactar(df, datas=()):
+        '''
+            Retorna uma cópia compacta do DataFrame; datas são as colunas com datas em número de
+            série do Excel.
+        '''
+        colunas = {}
+        for coluna in df.columns:
+            serie = df[coluna]
+            if coluna in datas:
+                serie = Compacto.datas_excel(serie)
+            elif pd.api.types.is_integer_dtype(serie):
+                serie = pd.to_numeric(serie, downcast='integer')
+            elif pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+                if serie.nunique() <= Compacto.limite_categorias * len(serie):
+                    serie = serie.astype('category')
+            colunas[coluna] = serie
+        return pd.DataFrame(colunas, index=df.index)
+
+    def memoria(df, referencia=None):
+        '''
+            Relatório do uso de memória por coluna (incluindo os objetos Python das strings),
+            com uma linha 'Total'. Com referencia (ex.: o DataFrame original), inclui os bytes
+            da referência e o fator de redução de cada coluna.
+        '''
+        relatorio = pd.DataFrame({'Tipo': df.dtypes.astype(str), 'Bytes': df.memory_usage(deep=True, index=False)})
+        if referencia is not None:
+            relatorio['BytesReferencia'] = referencia.memory_usage(deep=True, index=False).reindex(relatorio.index)
+        relatorio.loc['Total'] = relatorio.drop(columns='Tipo').sum().to_dict() | {'Tipo': ''}
+        if referencia is not None:
+            relatorio['Reducao'] = relatorio['BytesReferencia'] / relatorio['Bytes']
+        return relatorio
 
-            # Agrupar e somar a coluna 'Ocorrências' por 'Ano'
-            crimes = df_filtrado.groupby('Ano')['Ocorrências'].sum().reset_index()
 
-            # Renomear campo Ocorrências para Crimes
-            crimes = crimes.rename(columns={'Ocorrências': 'Crimes'})
+class Dados:
 
-            # Retornar o DataFrame crimes
-            return crimes
-        
+    # Registro declarativo das fontes, na ordem das colunas do DataFrame unificado. Cada fonte declara:
+    #   'arquivo'      caminho do arquivo em dados/
+    #   'formato'      'csv' (padrão) ou 'excel' (.xlsx ou .ods, lidos em fluxo por Planilhas)
+    #   'delimitador'  separador do CSV (padrão ';')
+    #   'decimal'      separador decimal do arquivo (padrão '.')
+    #   'aba'          aba da planilha (formato 'excel', padrão 0)
+    #   'cabecalho'    linha do cabeçalho na planilha (formato 'excel', padrão 0)
+    #   'ano'          coluna do ano no arquivo
+    #   'valor'        coluna do valor no arquivo
+    #   'tipo'         tipo do valor (ex.: 'int64', 'float64')
+    #   'agregacao'    função de agregação pelas chaves da granularidade (ex.: 'sum'); None mantém as linhas
+    #   'filtro'       {coluna: expressão regular}: mantém as linhas em que a coluna contém a expressão
+    #   'uf', 'mes'    colunas de UF e de mês das fontes regionais (detalhadas por UF e mês)
+    #   'datas'        colunas de datas gravadas como número de série do Excel (ver Compacto)
+    # O nome da fonte é também o nome da coluna do indicador no DataFrame unificado.
+    registro = {
+        'Crimes': {
+            'arquivo': 'dados/indicadoressegurancapublicauf.xlsx', 'formato': 'excel', 'aba': 0,
+            'ano': 'Ano', 'valor': 'Ocorrências', 'tipo': 'int64', 'agregacao': 'sum',
+            'filtro': {'Tipo Crime': 'Roubo|Morte'}, 'uf': 'UF', 'mes': 'Mês',
+        },
+        'Homicidios': {
+            'arquivo': 'dados/homicidios-por-armas-de-fogo.csv',
+            'ano': 'período', 'valor': 'valor', 'tipo': 'int64',
+        },
+        'Registros': {
+            'arquivo': 'dados/registro_armas_CR.csv',
+            'ano': 'ano', 'valor': 'registros', 'tipo': 'int64',
+        },
+        'Apreendidas': {
+            'arquivo': 'dados/apreendidas.csv',
+            'ano': 'Ano', 'valor': 'Apreendidas', 'tipo': 'int64', 'agregacao': 'sum',
+            'uf': 'UF Apreensão', 'mes': 'Mês', 'datas': ['Data apreensão'],
+        },
+        'IDH': {
+            'arquivo': 'dados/idh.csv', 'decimal': ',',
+            'ano': 'Data', 'valor': 'IDH', 'tipo': 'float64',
+        },
+        'Desemprego': {
+            'arquivo': 'dados/desemprego.csv', 'decimal': ',',
+            'ano': 'Ano', 'valor': 'Desemprego', 'tipo': 'float64',
+        },
+        'IPC': {
+            'arquivo': 'dados/IPC.csv',
+            'ano': 'Ano', 'valor': 'IPC', 'tipo': 'int64',
+        },
+    }
+
+    # Declarações alternativas das fontes: cada uma substitui parte das chaves da declaração em registro
+    alternativas = {
+        'Apreendidas': {
+            # A planilha original da PF, da qual apreendidas.csv foi exportado (mesmas colunas da versão .ods)
+            'xlsx': {
+                'arquivo': 'dados/Armas e Munições apreendidas 2013 a 2021.xlsx', 'formato': 'excel',
+                'aba': 'Armas_apreendidas', 'cabecalho': 1,
+                'ano': 'Ano ', 'valor': 'Qtde Apreensão ', 'uf': 'UF Apreensão ', 'mes': 'Mês ',
+            },
+            # A mesma tabela de apreensões na planilha .ods publicada pela PF: título na primeira linha e
+            # nomes de colunas com um espaço no final, como no arquivo
+            'ods': {
+                'arquivo': 'dados/Armas e Munições apreendidas 2013 a 2021.ods', 'formato': 'excel',
+                'aba': 'Armas_apreendidas', 'cabecalho': 1,
+                'ano': 'Ano ', 'valor': 'Qtde Apreensão ', 'uf': 'UF Apreensão ', 'mes': 'Mês ',
+            },
+        },
+    }
+
+    def _declaracao(nome, pacote=None, alternativa=None):
+        # Declaração da fonte com a alternativa aplicada e, com um pacote (.zip), o arquivo lido de dentro dele
+        declaracao = dict(Dados.registro[nome], **(Dados.alternativas[nome][alternativa] if alternativa else {}))
+        if pacote:
+            declaracao['arquivo'] = os.path.join(pacote, os.path.basename(declaracao['arquivo']))
+        return declaracao
+
+    def _leitor(declaracao):
+        # Função de leitura do arquivo (ou membro de .zip) com separador e decimal nativos e tipos explícitos
+        tipos = {declaracao['ano']: 'int64', declaracao['valor']: declaracao['tipo']}
+        if declaracao.get('formato', 'csv') == 'excel':
+            ler = lambda origem: Planilhas.ler(origem, declaracao.get('aba', 0),
+                                               cabecalho=declaracao.get('cabecalho', 0), tipos=tipos)
+            return lambda arquivo: Pacote.ler(arquivo, ler, sequencial=False)
+        ler = lambda origem: pd.read_csv(origem, delimiter=declaracao.get('delimitador', ';'),
+                                         decimal=declaracao.get('decimal', '.'), dtype=tipos)
+        return lambda arquivo: Pacote.ler(arquivo, ler)
+
+    def _variante(declaracao):
+        # Identifica no cache colunar a forma de leitura do arquivo
+        if declaracao.get('formato', 'csv') == 'excel':
+            cabecalho = declaracao.get('cabecalho', 0)
+            return f"sheet={declaracao.get('aba', 0)}" + (f";cabecalho={cabecalho}" if cabecalho else '')
+        return f"csv;delimitador={declaracao.get('delimitador', ';')};decimal={declaracao.get('decimal', '.')}"
+
+    def _colunas(declaracao):
+        # Colunas do arquivo usadas pela fonte (as demais não precisam ser lidas do cache)
+        colunas = [declaracao['ano'], declaracao['valor']] + [declaracao[c] for c in ('uf', 'mes') if c in declaracao]
+        return list(dict.fromkeys(colunas + list(declaracao.get('filtro', {}))))
+
+    def _predicados(declaracao, limite, anos=None, ufs=None):
+        # Traduzir o intervalo de anos e as UFs da consulta para as colunas originais do arquivo
+        inicio, fim = anos or (None, None)
+        if limite is not None:
+            fim = limite if fim is None else min(fim, limite)
+
+        filtro = {}
+        if inicio is not None or fim is not None:
+            filtro[declaracao['ano']] = (inicio, fim)
+        if ufs is not None and 'uf' in declaracao:
+            # A coluna de UF do arquivo pode ter a sigla ou o nome por extenso
+            filtro[declaracao['uf']] = list(ufs) + [uf for uf, sigla in Granularidade.siglas.items() if sigla in ufs]
+        return filtro
+
+    def _preparar(df, nome, declaracao, limite, granularidade):
+        # Passos comuns a todas as fontes: filtros, ano limite, nomes das colunas, chaves e agregação
+        for coluna, expressao in declaracao.get('filtro', {}).items():
+            df = df[df[coluna].str.contains(expressao, case=False)]
+        if limite is not None:
+            df = df[df[declaracao['ano']] <= limite]
+        df = df.rename(columns={declaracao['ano']: 'Ano', declaracao['valor']: nome})
+
+        # Fontes nacionais ignoram a granularidade; as regionais são codificadas nas chaves pedidas
+        if 'uf' in declaracao:
+            df = Granularidade.codificar(df, granularidade, uf=declaracao['uf'], mes=declaracao.get('mes', 'Mês'))
+            chaves = Granularidade.chaves[granularidade]
+        else:
+            chaves = ['Ano']
+
+        if declaracao.get('agregacao'):
+            return df.groupby(chaves, observed=True)[nome].agg(declaracao['agregacao']).reset_index().sort_values(chaves)
+        return df[chaves + [nome]].sort_values(chaves, kind='stable')
+
+    @Instrumentacao.medir()
+    def Carregar(nome, limite, granularidade=Granularidade.ANO, streaming=False, tamanho_bloco=100_000,
+                 anos=None, ufs=None, pacote=None, alternativa=None):
+        '''
+            Carregador genérico das fontes de Dados.registro: lê o arquivo (pelo cache colunar),
+            aplica os filtros e o ano limite e retorna um DataFrame com as chaves da
+            granularidade ('Ano' nas fontes nacionais) e a coluna do indicador. Com
+            streaming=True, fontes com agregação 'sum' (CSV ou planilhas) são lidas em blocos
+            de tamanho_bloco linhas, apenas com as colunas necessárias, mantendo a memória
+            constante.
+
+            anos=(inicio, fim) e ufs (siglas) restringem as linhas lidas: os predicados são
+            aplicados na cópia colunar do arquivo, que é lida apenas com as colunas da fonte.
+            limite=None não impõe ano máximo.
+
+            pacote (ex.: 'dados/Arquivo Comprimido.zip') lê o arquivo da fonte de dentro do .zip,
+            sem extraí-lo (ver Pacote), e alternativa escolhe uma declaração de
+            Dados.alternativas (ex.: alternativa='ods' para as apreensões).
+        '''
+        try:
+            declaracao = Dados._declaracao(nome, pacote, alternativa)
+            if streaming:
+                return Dados._carregar_em_blocos(nome, declaracao, limite, tamanho_bloco, granularidade)
+
+            df = Cache.ler(declaracao['arquivo'], Dados._leitor(declaracao), variante=Dados._variante(declaracao),
+                           colunas=Dados._colunas(declaracao),
+                           filtro=Dados._predicados(declaracao, limite, anos, ufs))
+            return Dados._preparar(df, nome, declaracao, limite, granularidade).reset_index(drop=True)
         except Exception as e:
-            print("Erro ao carregar os dados de crimes:", e)
+            print(f"Erro ao carregar os dados de {nome}:", e)
+            Instrumentacao.registrar_erro(e)
             return None
 
+    def _carregar_em_blocos(nome, declaracao, limite, tamanho_bloco, granularidade=Granularidade.ANO):
+        if declaracao.get('agregacao') != 'sum':
+            raise ValueError(f"A leitura em blocos exige uma fonte com agregação 'sum': {nome}")
+
+        totais = None
+        chaves = Granularidade.validar(granularidade) if 'uf' in declaracao else ['Ano']
+
+        # Ler somente as colunas necessárias, em blocos e com tipos explícitos
+        colunas = {declaracao['ano']: 'int64', declaracao['valor']: declaracao['tipo']}
+        if 'Mês' in chaves:
+            colunas[declaracao.get('mes', 'Mês')] = 'category'
+        if 'UF' in chaves:
+            colunas[declaracao['uf']] = 'category'
+        colunas.update({coluna: 'category' for coluna in declaracao.get('filtro', {})})
+
+        # Membros de .zip são descomprimidos junto com a leitura dos blocos (o CRC-32 é conferido ao final)
+        with Pacote.abrir(declaracao['arquivo']) as arquivo:
+            if declaracao.get('formato', 'csv') == 'excel':
+                # Planilhas precisam de acesso aleatório ao .zip da planilha: membros de pacotes vão para a memória
+                origem = declaracao['arquivo'] if Pacote.separar(declaracao['arquivo'])[1] is None else io.BytesIO(arquivo.read())
+                blocos = Planilhas.lotes(origem, declaracao.get('aba', 0), colunas=list(colunas),
+                                         cabecalho=declaracao.get('cabecalho', 0), tipos=colunas,
+                                         tamanho_lote=tamanho_bloco)
+            else:
+                blocos = pd.read_csv(arquivo, delimiter=declaracao.get('delimitador', ';'),
+                                     decimal=declaracao.get('decimal', '.'), usecols=list(colunas), dtype=colunas,
+                                     chunksize=tamanho_bloco)
+
+            for bloco in blocos:
+                # Somar o bloco pelas chaves e acumular as somas parciais
+                parcial = Dados._preparar(bloco, nome, declaracao, limite, granularidade).set_index(chaves)[nome]
+                totais = parcial if totais is None else totais.add(parcial, fill_value=0)
+
+        if totais is None:
+            totais = pd.Series(dtype=declaracao['tipo'], name=nome, index=pd.MultiIndex.from_tuples([], names=chaves))
+
+        # Mesmo formato do carregamento completo: chaves codificadas e valor no tipo declarado, ordenados
+        resultado = totais.astype(declaracao['tipo']).sort_index().reset_index()
+        return Granularidade.codificar(resultado, granularidade) if 'uf' in declaracao else resultado
+
+    def Crimes(limite, granularidade=Granularidade.ANO):
+        ''''
+
+            Autor: Ministério da Justiça e Segurança Pública
+            Título do site: Dados Nacionais de Segurança Pública - UF
+            URL: https://dados.mj.gov.br/dataset/sistema-nacional-de-estatisticas-de-seguranca-publica
+            Exemplo de citação no formato ABNT:
+
+            MINISTÉRIO DA JUSTIÇA E SEGURANÇA PÚBLICA. Dados Nacionais de Segurança Pública - UF. Disponível em: https://dados.mj.gov.br/dataset/sistema-nacional-de-estatisticas-de-seguranca-publica.
+            Acesso em: 20 de setembro de 2021.
+        '''
+        return Dados.Carregar('Crimes', limite, granularidade)
+
 
     def Homicidios(limite):
         ''''
@@ -47,40 +684,14 @@ class Dados:
             URL: https://www.ipea.gov.br/atlasviolencia/filtros-series/5/bitos-por-armas-de-fogo
             Exemplo de citação no formato ABNT:
 
-            INSTITUTO DE PESQUISA ECONÔMICA APLICADA (IPEA). Atlas da Violência: Homicídios por Armas de Fogo. Disponível em: https://www.ipea.gov.br/atlasviolencia/filtros-series/5/bitos-por-armas-de-fogo. 
+            INSTITUTO DE PESQUISA ECONÔMICA APLICADA (IPEA). Atlas da Violência: Homicídios por Armas de Fogo. Disponível em: https://www.ipea.gov.br/atlasviolencia/filtros-series/5/bitos-por-armas-de-fogo.
             Acesso em: 20 de setembro de 2021.
         '''
-        
-        try:
-            # Abrir o arquivo .csv com delimitador ponto e vírgula
-            arquivo_homicidios = 'dados/homicidios-por-armas-de-fogo.csv'
-            df_homicidios = pd.read_csv(arquivo_homicidios, delimiter=';')
-
-            # Selecionar apenas as colunas 'período' e 'valor' e renomear as colunas
-            homicidios = df_homicidios[['período', 'valor']].rename(columns={'período': 'Ano', 'valor': 'Ocorrências'})
-
-            # Converter o campo 'Ano' para o tipo inteiro
-            homicidios['Ano'] = pd.to_numeric(homicidios['Ano'], errors='coerce')
-
-            # Converter o campo 'Ocorrências' para o tipo inteiro
-            homicidios['Ocorrências'] = pd.to_numeric(homicidios['Ocorrências'], errors='coerce')
-
-            # Aplicar filtro com base no ano limite
-            homicidios = homicidios[homicidios['Ano'] <= limite]
-
-            # Renomear campo 'Ocorrências' para 'Homicidios'
-            homicidios = homicidios.rename(columns={'Ocorrências': 'Homicidios'})
-
-            # Retornar o DataFrame homicidios
-            return homicidios
-        
-        except Exception as e:
-            print("Erro ao carregar os dados de homicídios:", e)
-            return None
+        return Dados.Carregar('Homicidios', limite)
 
 
     def IDH(limite):
-        ''' 
+        '''
             Autor: CountryEconomy
             Título do site: CountryEconomy
             URL: https://pt.countryeconomy.com/demografia/idh/brasil
@@ -88,59 +699,23 @@ class Dados:
             Exemplo de citação no formato ABNT:
 
             COUNTRYECONOMY. Brasil - Índice de Desenvolvimento Humano. Disponível em: https://pt.countryeconomy.com/demografia/idh/brasil
-            Acesso em: 20 de setembro de 2021.    
+            Acesso em: 20 de setembro de 2021.
         '''
-        try:
-            # Abrir o arquivo .csv com delimitador ponto e vírgula
-            arquivo_idh = 'dados/idh.csv'
-            df_idh = pd.read_csv(arquivo_idh, delimiter=';').rename(columns={'Data': 'Ano'}).sort_values('Ano')
-
-            # Converter o campo 'Ano' para o tipo inteiro
-            df_idh['Ano'] = df_idh['Ano'].astype(int)
-
-            # Filtrar os dados até o ano máximo de 2019
-            idh = df_idh[df_idh['Ano'] <= limite].copy()
-
-            # Converter o campo 'IDH' para o tipo float e substituir a vírgula pelo ponto decimal
-            idh['IDH'] = idh['IDH'].str.replace(',', '.').astype(float)
-
-            # Retornar o DataFrame idh
-            return idh
-        except Exception as e:
-            print("Erro ao carregar os dados de IDH:", e)
-            return None
+        return Dados.Carregar('IDH', limite)
 
 
     def Desemprego(limite):
-        '''       
+        '''
             Autor: IndexMundi
             Título do site: IndexMundi
             URL: https://www.indexmundi.com/g/g.aspx?c=br&v=74&l=pt
             Título da página: Taxa de desemprego (%)
             Exemplo de citação no formato ABNT:
 
-            INDEXMUNDI. Taxa de desemprego (%). Disponível em: https://www.indexmundi.com/g/g.aspx?c=br&v=74&l=pt. 
+            INDEXMUNDI. Taxa de desemprego (%). Disponível em: https://www.indexmundi.com/g/g.aspx?c=br&v=74&l=pt.
             Acesso em: 20 de setembro de 2021.
         '''
-        try:
-            # Abrir o arquivo .csv com delimitador ponto e vírgula
-            arquivo_desemprego = 'dados/desemprego.csv'
-            df_desemprego = pd.read_csv(arquivo_desemprego, delimiter=';').sort_values('Ano')
-
-            # Converter o campo 'Ano' para o tipo inteiro
-            df_desemprego['Ano'] = df_desemprego['Ano'].astype(int)
-
-            # Converter o campo 'Desemprego' para o tipo float e substituir a vírgula pelo ponto decimal
-            df_desemprego['Desemprego'] = df_desemprego['Desemprego'].str.replace(',', '.').astype(float)
-
-            # Aplicar filtro com base no ano limite
-            df_desemprego = df_desemprego[df_desemprego['Ano'] <= limite]
-
-            # Retornar o DataFrame df_desemprego
-            return df_desemprego
-        except Exception as e:
-            print("Erro ao carregar os dados de Desemprego:", e)
-            return None
+        return Dados.Carregar('Desemprego', limite)
 
 
     def IPC(limite):
@@ -153,101 +728,190 @@ class Dados:
             Subtítulo ou descrição: Evolução da nota do Brasil desde 2012
             Exemplo de citação no formato ABNT:
 
-            TRANSPARÊNCIA INTERNACIONAL. IPC - Índice de Percepção da Corrupção: Evolução da nota do Brasil desde 2012. Disponível em: https://transparenciainternacional.org.br/ipc/. 
+            TRANSPARÊNCIA INTERNACIONAL. IPC - Índice de Percepção da Corrupção: Evolução da nota do Brasil desde 2012. Disponível em: https://transparenciainternacional.org.br/ipc/.
             Acesso em: 20 de setembro de 2021.
 
         '''
-        try:
-            # Abrir o arquivo .csv com delimitador ponto e vírgula
-            arquivo_IPC = 'dados/IPC.csv'
-            df_IPC = pd.read_csv(arquivo_IPC, delimiter=';').sort_values('Ano')
-
-            # Converter o campo 'Ano' para o tipo inteiro
-            df_IPC['Ano'] = df_IPC['Ano'].astype(int)
-
-            # Converter o campo 'IPC' para o tipo inteiro
-            df_IPC['IPC'] = df_IPC['IPC'].astype(int)
-
-            # Aplicar filtro com base no ano limite
-            df_IPC = df_IPC[df_IPC['Ano'] <= limite]
-
-            # Retornar o DataFrame df_IPC
-            return df_IPC
-        except Exception as e:
-            print("Erro ao carregar os dados do IPC:", e)
-            return None
+        return Dados.Carregar('IPC', limite)
 
 
     def Registros(limite):
         # Fonte:
-        '''FÓRUM BRASILEIRO DE SEGURANÇA PÚBLICA. 
-        Anuário Brasileiro de Segurança Pública, 2022. 
-        Brasília, DF: Fórum Brasileiro de Segurança Pública, 2022. 
-        p. 282-283. Tabela 60 - 
-        Novos Certificados de Registro de Armas de Fogo no SIGMA/Exército Brasileiro, 
+        '''FÓRUM BRASILEIRO DE SEGURANÇA PÚBLICA.
+        Anuário Brasileiro de Segurança Pública, 2022.
+        Brasília, DF: Fórum Brasileiro de Segurança Pública, 2022.
+        p. 282-283. Tabela 60 -
+        Novos Certificados de Registro de Armas de Fogo no SIGMA/Exército Brasileiro,
         por ano, números absolutos (1), Brasil e Unidades da Federação - 2003-2022.'''
 
-        try:
-            # Abrir o arquivo .csv com delimitador ponto e vírgula
-            arquivo_registros = 'dados/registro_armas_CR.csv'
-            df_registros = pd.read_csv(arquivo_registros, delimiter=';')
+        return Dados.Carregar('Registros', limite)
 
-            # Filtrar os dados até o ano máximo de limite
-            df_registros = df_registros[df_registros['ano'] <= limite]
 
-            # Renomear as colunas 'ano' para 'Ano' e 'registros' para 'Registros'
-            registros = df_registros.rename(columns={'ano': 'Ano', 'registros': 'Registros'})
+    def Apreendidas(limite, streaming=False, tamanho_bloco=100_000, granularidade=Granularidade.ANO, registros=False):
+        '''
+            Total de armas apreendidas por ano. Com streaming=True o CSV é lido em blocos de
+            tamanho_bloco linhas, apenas com as colunas 'Ano' e 'Apreendidas' (e as chaves da
+            granularidade), e as somas parciais são acumuladas bloco a bloco, mantendo a memória
+            constante. Com registros=True retorna as apreensões individuais na representação
+            compacta (ver Dados.CarregarRegistros).
+        '''
+        if registros:
+            return Dados.CarregarRegistros('Apreendidas', limite)
+        return Dados.Carregar('Apreendidas', limite, granularidade, streaming=streaming, tamanho_bloco=tamanho_bloco)
 
-            # Retornar o DataFrame registros
-            return registros
+    @Instrumentacao.medir()
+    def CarregarRegistros(nome, limite=None, anos=None, ufs=None, pacote=None, alternativa=None):
+        '''
+            Registros individuais de uma fonte (todas as colunas do arquivo, sem os filtros e a
+            agregação da declaração), na representação de Compacto. As colunas do ano, valor,
+            UF e mês recebem os nomes do arquivo declarado em Dados.registro, qualquer que seja
+            a alternativa lida, e as colunas de 'datas' são convertidas para datetime64.
+            anos, ufs, pacote e alternativa funcionam como em Dados.Carregar. O uso de memória
+            pode ser conferido com Compacto.memoria.
+        '''
+        try:
+            declaracao = Dados._declaracao(nome, pacote, alternativa)
+            df = Cache.ler(declaracao['arquivo'], Dados._leitor(declaracao), variante=Dados._variante(declaracao),
+                           filtro=Dados._predicados(declaracao, limite, anos, ufs))
+
+            # Nomes canônicos das colunas, independentes do arquivo de origem (ex.: espaços no fim nas planilhas)
+            original = Dados.registro[nome]
+            df = df.rename(columns=str.strip).rename(columns={declaracao[chave].strip(): original[chave]
+                                                               for chave in ('ano', 'valor', 'uf', 'mes')
+                                                               if chave in declaracao})
+            return Compacto.compactar(df, datas=declaracao.get('datas', []))
         except Exception as e:
-            print("Erro ao carregar os dados de registros:", e)
+            print(f"Erro ao carregar os registros de {nome}:", e)
+            Instrumentacao.registrar_erro(e)
             return None
 
+    # Mandatos presidenciais (presidente, ano da eleição, ano da posse e partido), usados por Periodos
+    presidentes = 'dados/presidentes.csv'
 
-    def Apreendidas(limite):
+    @Instrumentacao.medir()
+    def Presidentes(pacote=None):
+        '''
+            Tabela dos mandatos presidenciais com as colunas Presidente, Eleito (ano da
+            eleição), Posse (ano da posse) e Partido, ordenada pela posse. Com pacote (um
+            .zip), o arquivo é lido de dentro dele. A expansão em anos fica em Periodos.
+        '''
         try:
-            # Ler o arquivo CSV com separador ponto e vírgula
-            df_apreendidas = pd.read_csv('dados/apreendidas.csv', delimiter=';')
+            arquivo = os.path.join(pacote, os.path.basename(Dados.presidentes)) if pacote else Dados.presidentes
+            ler = lambda origem: pd.read_csv(origem, delimiter=';', encoding='utf-8-sig',
+                                             dtype={'Eleito': 'int64', 'Governo': 'int64'})
+            df = Cache.ler(arquivo, lambda caminho: Pacote.ler(caminho, ler), variante='csv;delimitador=;')
+            df = df.rename(columns={'presidente': 'Presidente', 'Governo': 'Posse'})
+            return df.sort_values('Posse', kind='stable').reset_index(drop=True)
+        except Exception as e:
+            print("Erro ao carregar os mandatos presidenciais:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
 
-            # Filtrar os dados até o ano máximo de limite
-            df_apreendidas = df_apreendidas[df_apreendidas['Ano'] <= limite]
+    # Fontes na ordem esperada por UniData
+    fontes = list(registro)
 
-            # Totalizar o campo "Qtde Apreensão" pelo campo "Ano"
-            df_tot_apreendidas = df_apreendidas.groupby('Ano')['Apreendidas'].sum().reset_index()
+    # Arquivo de origem de cada fonte
+    arquivos = {nome: declaracao['arquivo'] for nome, declaracao in registro.items()}
 
-            # Ordenar pelo campo "Ano"
-            apreendidas = df_tot_apreendidas.sort_values('Ano')
+    # Fontes com detalhamento por UF e mês; as demais são séries nacionais anuais
+    fontes_regionais = [nome for nome, declaracao in registro.items() if 'uf' in declaracao]
 
-            # Mostrar as informações selecionadas
-            return apreendidas
+    @Instrumentacao.medir()
+    def UniData(*fontes, inicio=2003, fim=None, ufs=None):
+        '''
+            Une qualquer número de DataFrames de indicadores em uma única passagem. O intervalo
+            de anos [inicio, fim] é aplicado em cada fonte antes da junção e todas são alinhadas
+            de uma vez sobre um índice comum, com o mesmo resultado da junção externa encadeada
+            (chaves ordenadas, NaN onde faltam dados).
+
+            As chaves de cada fonte são as colunas de Granularidade.colunas que ela possui. Se
+            alguma fonte for regional ('UF' e/ou 'Mês'), o índice comum é o produto dos anos com
+            as UFs (e meses) e as séries nacionais são replicadas em cada UF/mês do seu ano;
+            ufs restringe o painel a parte das UFs.
+        '''
+        try:
+            indicadores = []
+            for fonte in fontes:
+                # Converter a coluna 'Ano' para formato numérico
+                anos = pd.to_numeric(fonte['Ano'])
+
+                # Aplicar o intervalo de anos na própria fonte, antes da junção
+                filtro = anos >= inicio
+                if fim is not None:
+                    filtro &= anos <= fim
+
+                # Indexar a fonte pelas suas chaves, na ordem canônica
+                chaves = [coluna for coluna in Granularidade.colunas if coluna in fonte.columns]
+                indicador = fonte[filtro].assign(Ano=anos[filtro]).set_index(chaves)
+                indicadores.append(indicador)
+
+            chaves = [coluna for coluna in Granularidade.colunas if any(coluna in i.index.names for i in indicadores)]
+
+            if chaves == ['Ano']:
+                # Série nacional: alinhar todas as fontes sobre a união ordenada dos anos
+                df_merged = pd.concat(indicadores, axis=1, join='outer', sort=True)
+                df_merged.index.name = 'Ano'
+                return df_merged.reset_index()
+
+            # Painel: índice comum pré-calculado (anos x meses x UFs)
+            anos = sorted(set().union(*(i.index.get_level_values('Ano') for i in indicadores)))
+            niveis = {
+                'Ano': pd.Index(anos, dtype='int16'),
+                'Mês': pd.Index(range(1, 13), dtype='int8'),
+                'UF': pd.CategoricalIndex([uf for uf in Granularidade.ufs if ufs is None or uf in ufs],
+                                          categories=Granularidade.ufs),
+            }
+            indice = pd.MultiIndex.from_product([niveis[c] for c in chaves], names=chaves)
+
+            colunas = {}
+            for indicador in indicadores:
+                # Projetar o índice comum nas chaves da fonte e buscar os valores de uma vez
+                alvo = indice.droplevel([c for c in chaves if c not in indicador.index.names])
+                valores = indicador.reindex(alvo)
+                for coluna in valores.columns:
+                    colunas[coluna] = valores[coluna].to_numpy()
+
+            df_merged = pd.DataFrame(colunas, index=indice)
+
+            # Retornar o DataFrame resultante com as chaves como colunas
+            return df_merged.reset_index()
         except Exception as e:
-            print("Ocorreu um erro durante a execução:", e)
+            print("Erro ao unificar os DataFrames:", e)
+            Instrumentacao.registrar_erro(e)
             return None
 
 
-    def UniData(crimes, homicidios, registros, apreendidas, idh, df_desemprego, df_IPC):
+    @Instrumentacao.medir()
+    def Consultar(anos=None, ufs=None, indicadores=None, granularidade=None, pacote=None):
+        '''
+            Consulta o conjunto unificado sem executar o pipeline: carrega apenas os indicadores
+            pedidos (por padrão, todos), com o intervalo de anos (inicio, fim) e as UFs (siglas
+            ou nomes) aplicados na leitura de cada fonte, e retorna o DataFrame unificado. A
+            granularidade padrão é o painel ano x UF quando ufs é informado e a série nacional
+            anual caso contrário; nas séries nacionais, ufs restringe as fontes regionais às
+            UFs pedidas. Ex.: Dados.Consultar(anos=(2010, 2019), ufs=['SP', 'RJ'],
+            indicadores=['Crimes', 'Apreendidas']). pacote lê as fontes de dentro de um .zip.
+        '''
         try:
-            # Converter a coluna 'Ano' para formato numérico em todos os DataFrames
-            crimes['Ano'] = pd.to_numeric(crimes['Ano'])
-            homicidios['Ano'] = pd.to_numeric(homicidios['Ano'])
-            registros['Ano'] = pd.to_numeric(registros['Ano'])
-            apreendidas['Ano'] = pd.to_numeric(apreendidas['Ano'])
-            idh['Ano'] = pd.to_numeric(idh['Ano'])
-            df_desemprego['Ano'] = pd.to_numeric(df_desemprego['Ano'])
-            df_IPC['Ano'] = pd.to_numeric(df_IPC['Ano'])
-
-            # Juntar os DataFrames 'crimes', 'homicidios', 'registros', 'apreendidas', 'idh', 'df_desemprego' e 'df_IPC'
-            df_merged = crimes.merge(homicidios, on='Ano', how='outer').merge(registros, on='Ano', how='outer').merge(apreendidas, on='Ano', how='outer').merge(idh, on='Ano', how='outer').merge(df_desemprego, on='Ano', how='outer').merge(df_IPC, on='Ano', how='outer')
-
-            # Ordenar pelo campo 'Ano' em ordem crescente
-            df_merged = df_merged.sort_values('Ano')
-
-            # Remover os anos anteriores a 2003
-            df_merged = df_merged[df_merged['Ano'] >= 2003]
-
-            # Retornar o DataFrame resultante
-            return df_merged
+            inicio, fim = anos or (2003, None)
+            indicadores = list(indicadores or Dados.fontes)
+            desconhecidos = [nome for nome in indicadores if nome not in Dados.registro]
+            if desconhecidos:
+                raise ValueError(f"Indicadores desconhecidos: {desconhecidos}. Use um de {Dados.fontes}.")
+
+            granularidade = granularidade or (Granularidade.ANO_UF if ufs else Granularidade.ANO)
+            if ufs is not None:
+                ufs = [Granularidade.siglas.get(uf, uf) for uf in ufs]
+
+            fontes = [Dados.Carregar(nome, fim, granularidade, anos=(inicio, fim), ufs=ufs, pacote=pacote)
+                      for nome in indicadores]
+            falhas = [nome for nome, fonte in zip(indicadores, fontes) if fonte is None]
+            if falhas:
+                raise ValueError(f"Falha ao carregar: {falhas}")
+
+            return Dados.UniData(*fontes, inicio=inicio, fim=fim, ufs=ufs)
         except Exception as e:
-            print("Erro ao unificar os DataFrames:", e)
+            print("Erro ao consultar os dados:", e)
+            Instrumentacao.registrar_erro(e)
             return None
@@ -0,0 +1,314 @@
+from collections import OrderedDict
+import hashlib
+import os
+
+import pandas as pd
+import numpy as np
+
+from data import Cache, Granularidade
+from instrumentacao import Instrumentacao
+
+
+class Imputacao:
+    '''
+        Imputação e previsão dos indicadores por séries temporais. Os métodos disponíveis são:
+            'interpolacao'  interpolação linear no tempo; as pontas repetem o valor mais próximo
+            'linear'        tendência linear de cada série
+            'polinomial'    tendência polinomial de cada série (grau informado)
+            'regressao'     regressão (ridge) de cada indicador sobre os demais indicadores
+
+        Os dados são organizados em um array (séries, períodos, indicadores), com uma série
+        nacional ou uma série por UF nos painéis, e todos os indicadores de todas as séries são
+        ajustados de uma vez por mínimos quadrados ponderados pela máscara de valores
+        existentes. Os modelos ajustados ficam em cache (em memória e em disco), identificados
+        pela impressão digital dos dados e dos parâmetros do ajuste. Os dois caches são
+        limitados: em memória ficam os Imputacao.max_modelos usados mais recentemente e em
+        disco os Imputacao.max_arquivos arquivos usados mais recentemente (pelo mtime, renovado
+        a cada leitura); os mais antigos são descartados.
+    '''
+
+    metodos = ['interpolacao', 'linear', 'polinomial', 'regressao']
+
+    diretorio = os.path.join(Cache.diretorio, 'modelos')
+    max_modelos = 64
+    max_arquivos = 256
+    _modelos = OrderedDict()
+
+    def _colunas(df, colunas=None):
+        # Indicadores pedidos ou, por padrão, todas as colunas de indicadores do DataFrame
+        return list(colunas) if colunas is not None else Granularidade.indicadores(df)
+
+    def _tempo(df):
+        # Período contínuo: ano, ou ano fracionário nos painéis mensais
+        tempo = df['Ano'].to_numpy(dtype=float)
+        if 'Mês' in df.columns:
+            tempo = tempo + (df['Mês'].to_numpy(dtype=float) - 1) / 12
+        return tempo
+
+    def _organizar(df, colunas):
+        '''
+            Converte o DataFrame em um array Y (séries, períodos, indicadores), retornando
+            também os períodos ordenados e as posições (série, período) de cada linha, usadas
+            para devolver os valores ao DataFrame.
+        '''
+        tempo = Imputacao._tempo(df)
+        periodos, posicao_periodo = np.unique(tempo, return_inverse=True)
+        if 'UF' in df.columns:
+            posicao_serie, series = pd.factorize(df['UF'], sort=True)
+        else:
+            posicao_serie, series = np.zeros(len(df), dtype=int), pd.Index(['Brasil'])
+
+        Y = np.full((len(series), len(periodos), len(colunas)), np.nan)
+        Y[posicao_serie, posicao_periodo] = df[colunas].to_numpy(dtype=float)
+        return Y, periodos, series, (posicao_serie, posicao_periodo)
+
+    def _impressao_digital(Y, periodos, metodo, grau, alfa):
+        sha = hashlib.sha256(f'{metodo}|{grau}|{alfa}|{Y.shape}'.encode('utf-8'))
+        sha.update(np.ascontiguousarray(Y).tobytes())
+        sha.update(np.ascontiguousarray(periodos).tobytes())
+        return sha.hexdigest()
+
+    def _vandermonde(periodos, grau, referencia):
+        # Potências do período normalizado (melhora o condicionamento do ajuste)
+        centro, escala = referencia
+        return np.vander((periodos - centro) / escala, grau + 1, increasing=True)
+
+    def _interpolar(Y, periodos):
+        # Interpolação linear no tempo de todas as séries e indicadores de uma vez
+        planos = pd.DataFrame(np.moveaxis(Y, 1, 0).reshape(len(periodos), -1), index=periodos)
+        planos = planos.interpolate(method='index', limit_direction='both')
+        return np.moveaxis(planos.to_numpy().reshape((len(periodos),) + Y.shape[:1] + Y.shape[2:]), 0, 1)
+
+    def _resolver(A, b):
+        # Resolver os sistemas A x = b de todas as séries e indicadores; sistemas singulares usam a pseudoinversa
+        return (np.linalg.pinv(A) @ b[..., None])[..., 0]
+
+    def _ajustar_tendencia(Y, periodos, grau):
+        referencia = (periodos.mean(), periodos.std() or 1.0)
+        V = Imputacao._vandermonde(periodos, grau, referencia)
+        M = ~np.isnan(Y)
+        Y0 = np.where(M, Y, 0.0)
+
+        # Equações normais ponderadas pela máscara: A = V' diag(m) V e b = V' diag(m) y, por (série, indicador)
+        A = np.einsum('tp,gtk,tq->gkpq', V, M.astype(float), V)
+        b = np.einsum('tp,gtk->gkp', V, Y0)
+        coeficientes = Imputacao._resolver(A, b)
+        coeficientes[M.sum(axis=1) == 0] = np.nan
+        return {'coeficientes': coeficientes, 'referencia': np.array(referencia)}
+
+    def _preditores(Y, periodos, padronizacao=None):
+        # Demais indicadores completados por interpolação e padronizados, para a regressão
+        Z = Imputacao._interpolar(Y, periodos)
+        if padronizacao is None:
+            # Média e desvio de cada indicador sobre os valores existentes (0 e 1 se não houver nenhum)
+            M = ~np.isnan(Z)
+            contagem = np.maximum(M.sum(axis=(0, 1)), 1)
+            media = np.where(M, Z, 0.0).sum(axis=(0, 1)) / contagem
+            desvio = np.sqrt(np.where(M, (Z - media) ** 2, 0.0).sum(axis=(0, 1)) / contagem)
+            padronizacao = np.stack([media, np.where(desvio > 0, desvio, 1.0)])
+        Z = np.nan_to_num((Z - padronizacao[0]) / padronizacao[1])
+
+        # Matriz de projeto de cada indicador: intercepto e os demais indicadores
+        k = Y.shape[-1]
+        outros = np.array([[c for c in range(k) if c != j] for j in range(k)], dtype=int).reshape(k, k - 1)
+        D = np.concatenate([np.ones(Z.shape[:2] + (k, 1)), Z[..., outros]], axis=-1)
+        return D, padronizacao
+
+    def _ajustar_regressao(Y, periodos, alfa):
+        D, padronizacao = Imputacao._preditores(Y, periodos)
+        M = ~np.isnan(Y)
+        Y0 = np.where(M, Y, 0.0)
+
+        # Ridge sem penalizar o intercepto, com todos os indicadores de todas as séries em um único lote
+        penalidade = alfa * np.diag(np.r_[0.0, np.ones(D.shape[-1] - 1)])
+        A = np.einsum('gtkp,gtk,gtkq->gkpq', D, M.astype(float), D) + penalidade
+        b = np.einsum('gtkp,gtk->gkp', D, Y0)
+        coeficientes = Imputacao._resolver(A, b)
+        coeficientes[M.sum(axis=1) == 0] = np.nan
+        return {'coeficientes': coeficientes, 'padronizacao': padronizacao}
+
+    def _salvar_modelo(caminho, modelo):
+        # Passar o arquivo aberto evita que o numpy acrescente a extensão .npz ao nome temporário
+        with open(caminho, 'wb') as f:
+            np.savez(f, **modelo)
+
+    def _guardar(chave, modelo):
+        # Cache em memória com descarte do modelo usado há mais tempo
+        Imputacao._modelos[chave] = modelo
+        Imputacao._modelos.move_to_end(chave)
+        while len(Imputacao._modelos) > Imputacao.max_modelos:
+            Imputacao._modelos.popitem(last=False)
+
+    def _podar():
+        # Manter em disco só os max_arquivos modelos usados mais recentemente
+        try:
+            arquivos = [entrada for entrada in os.scandir(Imputacao.diretorio)
+                        if entrada.is_file() and entrada.name.endswith('.npz')]
+        except FileNotFoundError:
+            return
+        if len(arquivos) <= Imputacao.max_arquivos:
+            return
+        arquivos.sort(key=lambda entrada: entrada.stat().st_mtime_ns)
+        for entrada in arquivos[:len(arquivos) - Imputacao.max_arquivos]:
+            try:
+                os.remove(entrada.path)
+            except FileNotFoundError:
+                pass
+
+    def _ajustar(Y, periodos, metodo, grau=2, alfa=1.0, cache=True):
+        '''
+            Ajusta o modelo do método para todas as séries e indicadores de Y. Com cache=True o
+            modelo é reaproveitado (da memória ou de Imputacao.diretorio) sempre que os dados e
+            os parâmetros forem os mesmos.
+        '''
+        if metodo not in Imputacao.metodos:
+            raise ValueError(f"Método desconhecido: {metodo}. Use um de {Imputacao.metodos}.")
+        grau = 1 if metodo == 'linear' else grau
+        chave = Imputacao._impressao_digital(Y, periodos, metodo, grau, alfa)
+
+        if cache and chave in Imputacao._modelos:
+            Imputacao._modelos.move_to_end(chave)
+            return Imputacao._modelos[chave]
+        caminho = os.path.join(Imputacao.diretorio, f'{chave}.npz')
+        if cache and os.path.exists(caminho):
+            with np.load(caminho) as arquivo:
+                modelo = {nome: arquivo[nome] for nome in arquivo.files}
+            # Renovar o mtime: a poda do disco descarta os modelos lidos há mais tempo
+            os.utime(caminho)
+            Imputacao._guardar(chave, modelo)
+            return modelo
+
+        if metodo == 'interpolacao':
+            modelo = {'valores': Imputacao._interpolar(Y, periodos)}
+        elif metodo == 'regressao':
+            modelo = Imputacao._ajustar_regressao(Y, periodos, alfa)
+        else:
+            modelo = Imputacao._ajustar_tendencia(Y, periodos, grau)
+
+        if cache:
+            Imputacao._guardar(chave, modelo)
+            os.makedirs(Imputacao.diretorio, exist_ok=True)
+            Cache._gravar_atomico(caminho, lambda temporario: Imputacao._salvar_modelo(temporario, modelo))
+            Imputacao._podar()
+        return modelo
+
+    def _estimar(Y, periodos, metodo, grau=2, alfa=1.0, cache=True):
+        # Valores estimados pelo modelo em todos os períodos das séries de Y
+        modelo = Imputacao._ajustar(Y, periodos, metodo, grau, alfa, cache)
+        if metodo == 'interpolacao':
+            return modelo['valores']
+        if metodo == 'regressao':
+            D, _ = Imputacao._preditores(Y, periodos, modelo['padronizacao'])
+            return np.einsum('gtkp,gkp->gtk', D, modelo['coeficientes'])
+        grau = 1 if metodo == 'linear' else grau
+        V = Imputacao._vandermonde(periodos, grau, modelo['referencia'])
+        return np.einsum('tp,gkp->gtk', V, modelo['coeficientes'])
+
+    @Instrumentacao.medir()
+    def Imputar(df, metodo='interpolacao', grau=2, alfa=1.0, colunas=None):
+        '''
+            Preenche os valores faltantes dos indicadores com o método escolhido, ajustando uma
+            série por UF nos painéis. Os valores existentes não são alterados. Na regressão,
+            todos os indicadores do DataFrame são usados como preditores, mesmo que apenas
+            algumas colunas sejam preenchidas.
+        '''
+        try:
+            indicadores = Imputacao._colunas(df)
+            Y, periodos, _, posicoes = Imputacao._organizar(df, indicadores)
+            estimados = Imputacao._estimar(Y, periodos, metodo, grau, alfa)[posicoes]
+
+            df_imputado = df.copy()
+            for coluna in Imputacao._colunas(df, colunas):
+                faltantes = df[coluna].isna().to_numpy()
+                if faltantes.any():
+                    df_imputado[coluna] = np.where(faltantes, estimados[:, indicadores.index(coluna)], df[coluna])
+            return df_imputado
+        except Exception as e:
+            print("Erro ao imputar os valores faltantes:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def Prever(df, periodos=3, metodo='linear', grau=2, colunas=None):
+        '''
+            Previsão dos indicadores para os próximos períodos (anos, ou meses nos painéis
+            mensais) pela tendência de cada série. Apenas os métodos 'linear' e 'polinomial'
+            extrapolam; a interpolação e a regressão dependem de valores dos próprios períodos.
+            Retorna um DataFrame com as mesmas colunas de chave e os indicadores previstos.
+        '''
+        try:
+            if metodo not in ('linear', 'polinomial'):
+                raise ValueError("A previsão usa apenas os métodos 'linear' e 'polinomial'.")
+
+            colunas = Imputacao._colunas(df, colunas)
+            Y, existentes, series, _ = Imputacao._organizar(df, colunas)
+            modelo = Imputacao._ajustar(Y, existentes, metodo, grau)
+
+            # Próximos períodos a partir do último período existente
+            mensal = 'Mês' in df.columns
+            passo = 1 / 12 if mensal else 1
+            futuros = existentes[-1] + passo * np.arange(1, periodos + 1)
+            V = Imputacao._vandermonde(futuros, 1 if metodo == 'linear' else grau, modelo['referencia'])
+            previstos = np.einsum('tp,gkp->gtk', V, modelo['coeficientes'])
+
+            # Uma linha por (série, período futuro), com as chaves no mesmo formato do DataFrame
+            ano = np.floor(futuros + 1e-9)
+            chaves = {'Ano': np.tile(ano, len(series)).astype(df['Ano'].dtype)}
+            if mensal:
+                chaves['Mês'] = np.tile(np.rint((futuros - ano) * 12) + 1, len(series)).astype(df['Mês'].dtype)
+            if 'UF' in df.columns:
+                chaves['UF'] = pd.Categorical(np.repeat(series, periodos), categories=df['UF'].cat.categories
+                                              if isinstance(df['UF'].dtype, pd.CategoricalDtype) else None)
+
+            previsao = pd.DataFrame(chaves)
+            previsao[colunas] = previstos.reshape(-1, len(colunas))
+            return previsao[[c for c in df.columns if c in previsao.columns]]
+        except Exception as e:
+            print("Erro ao prever os indicadores:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def Backtest(df, metodos=None, dobras=5, semente=None, grau=2, alfa=1.0, colunas=None):
+        '''
+            Avalia os métodos escondendo os valores existentes: os valores de cada indicador
+            são divididos aleatoriamente em dobras e, a cada dobra, os valores escondidos são
+            estimados a partir dos demais. Retorna uma tabela com Metodo, Variavel, N, MAE,
+            RMSE e MAPE (%) por método e indicador.
+        '''
+        try:
+            metodos = list(metodos or Imputacao.metodos)
+            indicadores = Imputacao._colunas(df)
+            Y, periodos, _, _ = Imputacao._organizar(df, indicadores)
+
+            # Sortear a dobra de cada valor existente
+            existentes = ~np.isnan(Y)
+            dobra = np.where(existentes, np.random.default_rng(semente).integers(0, dobras, size=Y.shape), -1)
+
+            linhas = []
+            for metodo in metodos:
+                erros = np.full(Y.shape, np.nan)
+                for d in range(dobras):
+                    escondidos = dobra == d
+                    estimados = Imputacao._estimar(np.where(escondidos, np.nan, Y), periodos, metodo, grau, alfa, cache=False)
+                    erros[escondidos] = estimados[escondidos] - Y[escondidos]
+
+                for coluna in Imputacao._colunas(df, colunas):
+                    j = indicadores.index(coluna)
+                    erro = erros[..., j][~np.isnan(erros[..., j])]
+                    real = Y[..., j][~np.isnan(erros[..., j])]
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        linhas.append({
+                            'Metodo': metodo,
+                            'Variavel': coluna,
+                            'N': erro.size,
+                            'MAE': np.abs(erro).mean() if erro.size else np.nan,
+                            'RMSE': np.sqrt((erro ** 2).mean()) if erro.size else np.nan,
+                            'MAPE': (np.abs(erro / real)[real != 0].mean() * 100) if (real != 0).any() else np.nan,
+                        })
+
+            return pd.DataFrame(linhas)
+        except Exception as e:
+            print("Erro no backtest dos métodos de imputação:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
@@ -0,0 +1,226 @@
+from contextlib import contextmanager
+import cProfile
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import traceback
+
+
+class Instrumentacao:
+    '''
+        Instrumentação leve das etapas do pipeline. Cada etapa (um ponto de entrada de Dados,
+        Analises ou Visualizacoes decorado com Instrumentacao.medir, ou um bloco
+        Instrumentacao.etapa) gera um registro com o tempo de relógio e de CPU, o aumento do
+        pico de memória residente (RSS) do processo, as linhas de entrada e de saída e os erros.
+        Etapas chamadas dentro de outras ficam registradas com o nome da etapa pai.
+
+        Os pontos de entrada continuam tratando as próprias exceções (imprimem a mensagem e
+        retornam None), mas registram a exceção na etapa em andamento com
+        Instrumentacao.registrar_erro, de forma que o relatório aponte a causa da falha em vez
+        dos erros que ela provoca nas etapas seguintes.
+
+        Com Instrumentacao.perfil = True, cada etapa de nível mais alto é executada sob o
+        cProfile e o perfil é gravado em Instrumentacao.diretorio/perfis.
+    '''
+
+    diretorio = 'relatorios'
+    perfil = False
+
+    registros = []
+    _local = threading.local()
+    _inicio = time.time()
+
+    def _pilha():
+        # Pilha de etapas em andamento, separada por thread (etapas medidas em threads diferentes)
+        if not hasattr(Instrumentacao._local, 'pilha'):
+            Instrumentacao._local.pilha = []
+        return Instrumentacao._local.pilha
+
+    def _rss_pico_mb():
+        # Pico de memória residente do processo (ru_maxrss é em KB no Linux e em bytes no macOS)
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / 2 ** 20 if os.uname().sysname == 'Darwin' else pico / 2 ** 10
+
+    def _linhas(valor):
+        # Número de linhas de DataFrames e Series; None para os demais valores
+        return len(valor) if hasattr(valor, 'shape') and hasattr(valor, 'index') else None
+
+    @contextmanager
+    def etapa(nome, funcao=None, linhas_entrada=None):
+        '''
+            Registra a execução do bloco como uma etapa. O registro (um dicionário) é entregue
+            ao bloco, que pode preencher 'linhas_saida' ou marcar 'status' = 'falha'. Exceções
+            são registradas e propagadas.
+        '''
+        pilha = Instrumentacao._pilha()
+        registro = {
+            'nome': nome,
+            'funcao': funcao,
+            'pai': pilha[-1]['nome'] if pilha else None,
+            'pid': os.getpid(),
+            'inicio': time.time() - Instrumentacao._inicio,
+            'linhas_entrada': linhas_entrada,
+            'linhas_saida': None,
+            'status': 'ok',
+            'erros': [],
+            'perfil': None,
+        }
+        Instrumentacao.registros.append(registro)
+
+        # Apenas a etapa de nível mais alto é perfilada: o cProfile não admite perfis aninhados
+        perfilador = cProfile.Profile() if Instrumentacao.perfil and not pilha else None
+        pilha.append(registro)
+
+        rss = Instrumentacao._rss_pico_mb()
+        inicio, inicio_cpu = time.perf_counter(), time.process_time()
+        if perfilador:
+            perfilador.enable()
+        try:
+            yield registro
+        except BaseException as e:
+            Instrumentacao.registrar_erro(e)
+            raise
+        finally:
+            if perfilador:
+                perfilador.disable()
+            registro['segundos'] = time.perf_counter() - inicio
+            registro['cpu_segundos'] = time.process_time() - inicio_cpu
+            registro['rss_pico_delta_mb'] = Instrumentacao._rss_pico_mb() - rss
+            if registro['erros']:
+                registro['status'] = 'falha'
+            pilha.pop()
+
+            if perfilador:
+                diretorio = os.path.join(Instrumentacao.diretorio, 'perfis')
+                os.makedirs(diretorio, exist_ok=True)
+                registro['perfil'] = os.path.join(diretorio, f'{nome}-{os.getpid()}.prof')
+                perfilador.dump_stats(registro['perfil'])
+
+    def medir(nome=None, valor=True):
+        '''
+            Decorador de pontos de entrada. Com valor=True, um retorno None (a convenção de
+            falha das funções do projeto) marca a etapa como falha.
+        '''
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def envolvida(*args, **kwargs):
+                linhas = [Instrumentacao._linhas(a) for a in list(args) + list(kwargs.values())]
+                linhas = sum(n for n in linhas if n is not None) if any(n is not None for n in linhas) else None
+                with Instrumentacao.etapa(nome or funcao.__qualname__, funcao.__qualname__, linhas) as registro:
+                    resultado = funcao(*args, **kwargs)
+                    registro['linhas_saida'] = Instrumentacao._linhas(resultado)
+                    if valor and resultado is None:
+                        registro['status'] = 'falha'
+                    return resultado
+            return envolvida
+        return decorador
+
+    def registrar_erro(erro):
+        '''
+            Registra um erro (exceção ou mensagem) na etapa em andamento. Deve ser chamada nos
+            blocos except dos pontos de entrada, junto com a mensagem impressa.
+        '''
+        pilha = Instrumentacao._pilha()
+        if not pilha:
+            return
+        registro = pilha[-1]
+        if isinstance(erro, BaseException):
+            detalhe = {'tipo': type(erro).__name__, 'mensagem': str(erro),
+                       'traceback': ''.join(traceback.format_exception(type(erro), erro, erro.__traceback__))}
+        else:
+            detalhe = {'tipo': None, 'mensagem': str(erro), 'traceback': None}
+
+        # A mesma exceção pode ser registrada pelo except da função e pelo decorador
+        if detalhe not in registro['erros']:
+            registro['erros'].append(detalhe)
+        registro['status'] = 'falha'
+
+    def incorporar(registros):
+        '''
+            Acrescenta registros gerados em outros processos (ex.: workers de um pool), ligando
+            as etapas de nível mais alto à etapa em andamento neste processo.
+        '''
+        pilha = Instrumentacao._pilha()
+        for registro in registros:
+            if registro['pai'] is None and pilha:
+                registro['pai'] = pilha[-1]['nome']
+            Instrumentacao.registros.append(registro)
+
+    def relatorio(contexto=None):
+        '''
+            Relatório da execução: os registros de todas as etapas, um resumo com o tempo total
+            das etapas de nível mais alto e as etapas que falharam e, se informado, um
+            dicionário de contexto (ex.: parâmetros da execução).
+        '''
+        principais = [r for r in Instrumentacao.registros if r['pai'] is None]
+        return {
+            'inicio': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(Instrumentacao._inicio)),
+            'pid': os.getpid(),
+            'contexto': contexto or {},
+            'resumo': {
+                'etapas': len(Instrumentacao.registros),
+                'segundos': sum(r.get('segundos', 0.0) for r in principais),
+                'cpu_segundos': sum(r.get('cpu_segundos', 0.0) for r in principais),
+                'falhas': [r['nome'] for r in Instrumentacao.registros if r['status'] == 'falha'],
+            },
+            'etapas': Instrumentacao.registros,
+        }
+
+    def _gravar(caminho, dados):
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        with open(f'{caminho}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(f'{caminho}.tmp', caminho)
+        return caminho
+
+    def salvar(caminho=None, contexto=None):
+        '''
+            Grava o relatório da execução em JSON (por padrão em
+            Instrumentacao.diretorio/execucao.json) e retorna o caminho.
+        '''
+        caminho = caminho or os.path.join(Instrumentacao.diretorio, 'execucao.json')
+        return Instrumentacao._gravar(caminho, Instrumentacao.relatorio(contexto))
+
+    def importacoes(linhas, contexto=None):
+        '''
+            Relatório dos tempos de importação a partir da saída de python -X importtime
+            (linhas 'import time: próprio | acumulado | módulo', em microssegundos). O tempo
+            próprio de cada módulo é somado no pacote de nível mais alto a que ele pertence
+            (ex.: pandas.core.frame em pandas), do mais lento para o mais rápido.
+        '''
+        pacotes, modulos = {}, 0
+        for linha in linhas:
+            if not linha.startswith('import time:'):
+                continue
+            proprio, _, nome = linha[len('import time:'):].split('|', 2)
+            if not proprio.strip().isdigit():
+                continue  # cabeçalho
+            modulos += 1
+            pacote = nome.strip().split('.')[0]
+            pacotes[pacote] = pacotes.get(pacote, 0) + int(proprio) / 1e6
+
+        ordenados = sorted(pacotes.items(), key=lambda item: item[1], reverse=True)
+        return {
+            'contexto': contexto or {},
+            'modulos': modulos,
+            'segundos': sum(pacotes.values()),
+            'pacotes': [{'pacote': pacote, 'segundos': segundos} for pacote, segundos in ordenados],
+        }
+
+    def salvar_importacoes(linhas, caminho=None, contexto=None):
+        '''
+            Grava o relatório de Instrumentacao.importacoes em JSON (por padrão em
+            Instrumentacao.diretorio/importacoes.json) e retorna (caminho, relatório).
+        '''
+        caminho = caminho or os.path.join(Instrumentacao.diretorio, 'importacoes.json')
+        relatorio = Instrumentacao.importacoes(linhas, contexto)
+        return Instrumentacao._gravar(caminho, relatorio), relatorio
+
+    def limpar():
+        # Descartar os registros (ex.: entre execuções no mesmo processo)
+        Instrumentacao.registros.clear()
+        Instrumentacao._pilha().clear()
+        Instrumentacao._inicio = time.time()
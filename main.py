@@ -1,87 +1,269 @@
-from data import Dados
-from analises import Analises
-from visualizacoes import Visualizacoes
-
-def main():
+import argparse
+import os
+import subprocess
+import sys
+
+from data import Dados, Granularidade
+from instrumentacao import Instrumentacao
+from pipeline import Pipeline
+from saidas import Saidas
+
+
+def saidas_graficos(nomes, granularidade, saida='graficos'):
+    # Arquivos gerados por um gráfico: um por UF nos painéis
+    if granularidade == Granularidade.ANO:
+        diretorios = [saida]
+    else:
+        diretorios = [f'{saida}/{uf}' for uf in Granularidade.ufs]
+    return [f'{diretorio}/{nome}' for diretorio in diretorios for nome in nomes]
+
+
+def exportacao(nome, dependencia, arquivo, saida='graficos', formatos=('csv',), index=False):
+    # Etapa de exportação de uma tabela em saida/dados, com um arquivo por formato
+    caminho = f'{saida}/dados/{arquivo}'
+    return {'nome': nome, 'funcao': Pipeline.exportar, 'dependencias': [dependencia],
+            'parametros': {'caminho': caminho, 'index': index, 'formatos': list(formatos)},
+            'saidas': Saidas.caminhos(caminho, formatos), 'valor': False}
+
+
+def etapas(limite, granularidade, inicio=2003, pacote=None, varredura=None, saida='graficos', formatos=('csv',)):
+    '''
+        Declara o grafo de etapas do pipeline. As funções de Analises e Visualizacoes são
+        referenciadas pelo nome, para que seus módulos só sejam importados quando alguma
+        etapa precisar rodar. Com pacote (um .zip), as fontes são lidas de dentro dele e a
+        entrada de cada etapa de carregamento passa a ser o próprio .zip. Com varredura
+        (parâmetros de Varredura.Executar, ex.: {'fins': [2010, 2015], 'tamanho': 5}), o
+        grafo inclui a varredura de janelas de anos sobre as mesmas fontes carregadas.
+
+        Tabelas e gráficos são gravados em saida (ex.: o diretório versionado da execução,
+        de Saidas.diretorio_execucao), as tabelas em cada um dos formatos de Saidas.
+    '''
+    # Carregar cada fonte em uma etapa própria, dependente apenas do seu arquivo. Sem dependências, as
+    # etapas das fontes formam o primeiro nível do grafo e Pipeline.executar as roda juntas no pool de
+    # processos (a leitura do Excel é limitada pela CPU); o tempo do nível é o da fonte mais lenta
+    grafo = []
+    for fonte in Dados.fontes:
+        parametros = {'nome': fonte, 'limite': limite}
+        if fonte in Dados.fontes_regionais:
+            parametros['granularidade'] = granularidade
+        if pacote:
+            parametros['pacote'] = pacote
+        grafo.append({'nome': fonte, 'funcao': 'data:Dados.Carregar', 'parametros': parametros,
+                      'entradas': [pacote or Dados.arquivos[fonte]]})
+
+    # Mandatos presidenciais, expandidos em períodos de governo para as análises e os gráficos por período
+    grafo += [
+        {'nome': 'presidentes', 'funcao': 'data:Dados.Presidentes', 'parametros': {'pacote': pacote} if pacote else {},
+         'entradas': [pacote or Dados.presidentes]},
+        {'nome': 'periodos', 'funcao': 'periodos:Periodos.Governos', 'dependencias': ['presidentes']},
+    ]
+
+    tabela = lambda nome, dependencia, arquivo, index=False: exportacao(nome, dependencia, arquivo, saida, formatos, index)
+    graficos = {'diretorio': saida}
+
+    grafo += [
+        # Unificar os DataFrames e exportar o resultado
+        {'nome': 'unificado', 'funcao': 'data:Dados.UniData', 'dependencias': list(Dados.fontes),
+         'parametros': {'inicio': inicio}},
+        tabela('exportar_unificado', 'unificado', 'dfUnificado.csv'),
+
+        # Calcular as matrizes de correlação, exportar (com os rótulos das linhas) e analisar
+        {'nome': 'correlacao', 'funcao': 'analises:Analises.MatrizCorrelacao', 'dependencias': ['unificado']},
+        tabela('exportar_correlacao', 'correlacao', 'correlationMatrix.csv', index=True),
+        {'nome': 'analisar_correlacoes', 'funcao': 'analises:Analises.AnalisarCorrelacoes',
+         'dependencias': ['correlacao'], 'valor': False, 'sempre': True},
+        {'nome': 'correlacoes_detalhadas', 'funcao': 'analises:Analises.CorrelacoesDetalhadas',
+         'dependencias': ['unificado']},
+        tabela('exportar_correlacoes_detalhadas', 'correlacoes_detalhadas', 'correlacoesDetalhadas.csv'),
+        {'nome': 'bootstrap_correlacoes', 'funcao': 'bootstrap:Bootstrap.IntervalosConfianca',
+         'dependencias': ['unificado'], 'parametros': {'semente': 42}},
+        tabela('exportar_bootstrap_correlacoes', 'bootstrap_correlacoes', 'correlacoesBootstrap.csv'),
+
+        # Estatísticas e correlações por período de governo
+        {'nome': 'estatisticas_periodos', 'funcao': 'periodos:Periodos.Estatisticas',
+         'dependencias': ['unificado', 'periodos']},
+        tabela('exportar_estatisticas_periodos', 'estatisticas_periodos', 'estatisticasPeriodos.csv'),
+        {'nome': 'correlacao_periodos', 'funcao': 'periodos:Periodos.Correlacoes', 'dependencias': ['unificado', 'periodos']},
+        tabela('exportar_correlacao_periodos', 'correlacao_periodos', 'correlacaoPeriodos.csv', index=True),
+
+        # Gráficos das variáveis e mapa de calor
+        {'nome': 'analisar_variaveis', 'funcao': 'visualizacoes:Visualizacoes.AnalisarVariaveis',
+         'dependencias': ['unificado'], 'parametros': graficos, 'valor': False,
+         'saidas': saidas_graficos([f'{c}.png' for c in ['Ano'] + Dados.fontes], granularidade, saida)},
+        {'nome': 'mapa_calor', 'funcao': 'visualizacoes:Visualizacoes.grafico_calor',
+         'dependencias': ['correlacao'], 'parametros': graficos, 'valor': False,
+         'saidas': [f'{saida}/mapa_calor.png']},
+
+        # Predição de valores, exportação e escala percentual
+        {'nome': 'predicao', 'funcao': 'visualizacoes:Visualizacoes.predicao', 'dependencias': ['unificado']},
+        tabela('exportar_predicao', 'predicao', 'dfPredicoes.csv'),
+        {'nome': 'backtest_imputacao', 'funcao': 'imputacao:Imputacao.Backtest', 'dependencias': ['unificado'],
+         'parametros': {'semente': 42}},
+        tabela('exportar_backtest_imputacao', 'backtest_imputacao', 'backtestImputacao.csv'),
+        {'nome': 'porcentagem', 'funcao': 'visualizacoes:Visualizacoes.to_percentage', 'dependencias': ['predicao']},
+
+        # Picos e vales das séries preenchidas (os mesmos marcados nos gráficos de linha) e tendências dos dados observados
+        {'nome': 'extremos', 'funcao': 'tendencias:Tendencias.Extremos', 'dependencias': ['predicao']},
+        tabela('exportar_extremos', 'extremos', 'extremos.csv'),
+        {'nome': 'tendencias', 'funcao': 'tendencias:Tendencias.Resumo', 'dependencias': ['unificado']},
+        tabela('exportar_tendencias', 'tendencias', 'tendencias.csv'),
+
+        # Gráficos de linha, com as faixas dos períodos de governo e os extremos já calculados
+        {'nome': 'grafico_linha', 'funcao': 'visualizacoes:Visualizacoes.plot_dataframe',
+         'dependencias': ['porcentagem', 'periodos', 'extremos'], 'parametros': graficos, 'valor': False,
+         'saidas': saidas_graficos(['grafico_linha.png'], granularidade, saida)},
+        {'nome': 'grafico_homicidios_registros', 'funcao': 'visualizacoes:Visualizacoes.grafico_homicidios_registros',
+         'dependencias': ['unificado', 'periodos'], 'parametros': graficos, 'valor': False,
+         'saidas': saidas_graficos(['grafico_homicidios_registros.png'], granularidade, saida)},
+    ]
+
+    if varredura is not None:
+        # Correlações e predições de várias janelas de anos, a partir das fontes já carregadas até limite
+        grafo += [
+            {'nome': 'varredura', 'funcao': 'varredura:Varredura.Executar', 'dependencias': list(Dados.fontes),
+             'parametros': {'inicio': inicio, **varredura}},
+            tabela('exportar_varredura', 'varredura', 'varredura.csv'),
+        ]
+    return grafo
+
+
+def carregamento(relatorio):
+    '''
+        Tempos e falhas do carregamento de cada fonte (as etapas de Dados.fontes) a partir do
+        relatório de Pipeline.executar, com o caminho crítico em 'total': as fontes rodam em
+        paralelo, então o carregamento leva o tempo da fonte mais lenta executada.
+    '''
+    fontes = {nome: {'executada': relatorio[nome]['executada'], 'segundos': relatorio[nome]['segundos'],
+                     'erro': relatorio[nome]['erro']}
+              for nome in Dados.fontes if nome in relatorio}
+    segundos = [info['segundos'] for info in fontes.values() if info['executada']]
+    fontes['total'] = {'segundos': max(segundos, default=0.0), 'soma_segundos': sum(segundos),
+                       'erro': next((info['erro'] for info in fontes.values() if info['erro']), None)}
+    return fontes
+
+
+# Subcomandos da linha de comando: (alias em inglês, descrição, etapas alvo); None executa o grafo inteiro.
+# Cada comando executa só os alvos e as etapas de que eles dependem, de forma que bibliotecas pesadas
+# (scipy, seaborn, matplotlib) só são importadas pelos comandos que precisam delas.
+comandos = {
+    'carregar': ('load', 'carregar as fontes e exportar o DataFrame unificado', ['exportar_unificado']),
+    'correlacionar': ('correlate', 'calcular, exportar e analisar as correlações',
+                      ['exportar_correlacao', 'analisar_correlacoes', 'exportar_correlacoes_detalhadas',
+                       'exportar_bootstrap_correlacoes', 'exportar_estatisticas_periodos', 'exportar_correlacao_periodos']),
+    'prever': ('predict', 'imputar os valores faltantes e exportar a predição e o backtest',
+               ['exportar_predicao', 'exportar_backtest_imputacao', 'porcentagem']),
+    'graficos': ('render', 'gerar os gráficos',
+                 ['analisar_variaveis', 'mapa_calor', 'grafico_linha', 'grafico_homicidios_registros']),
+    'tendencias': ('trends', 'calcular e exportar os picos e vales, as tendências e os pontos de mudança',
+                   ['exportar_extremos', 'exportar_tendencias']),
+    'varrer': ('sweep', 'correlações e predições para vários anos finais (--fins) ou janelas móveis (--janela)',
+               ['exportar_varredura']),
+    'tudo': ('all', 'executar o pipeline completo', None),
+}
+
+
+def argumentos(argv=None):
+    aliases = {alias: comando for comando, (alias, _, _) in comandos.items()}
+    descricao = '\n'.join(f'  {comando} ({alias}): {texto}' for comando, (alias, texto, _) in comandos.items())
+    parser = argparse.ArgumentParser(description='Pipeline de dados de armas e violência.',
+                                     epilog=f'comandos:\n{descricao}',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('comando', nargs='?', default='tudo', choices=list(comandos) + list(aliases))
+    parser.add_argument('--inicio', type=int, default=2003, help='ano inicial da análise')
+    parser.add_argument('--limite', type=int, default=2019, help='ano limite da análise')
+    parser.add_argument('--granularidade', default=Granularidade.ANO, choices=list(Granularidade.chaves))
+    parser.add_argument('--pacote', default=None,
+                        help="ler as fontes de dentro de um .zip (ex.: 'dados/Arquivo Comprimido.zip')")
+    parser.add_argument('--fins', type=int, nargs='+', default=None,
+                        help='anos finais das janelas da varredura (padrão: todos a partir do terceiro ano)')
+    parser.add_argument('--janela', type=int, default=None,
+                        help='tamanho das janelas móveis da varredura (padrão: janelas crescentes desde --inicio)')
+    parser.add_argument('--sem-predicao', action='store_true', help='varredura apenas das correlações')
+    parser.add_argument('--formatos', nargs='+', default=['csv'], choices=list(Saidas.formatos),
+                        help='formatos das tabelas exportadas (ex.: csv parquet)')
+    parser.add_argument('--versionar', action='store_true',
+                        help='gravar as saídas em graficos/execucoes/<data-hora>, com o link graficos/ultima')
+    parser.add_argument('--perfil', action='store_true',
+                        help='gravar um perfil do cProfile por etapa em relatorios/perfis')
+    parser.add_argument('--forcar', action='store_true', help='executar todas as etapas, mesmo as atualizadas')
+    parser.add_argument('--tempos-importacao', action='store_true',
+                        help='medir o tempo de importação dos módulos (relatorios/importacoes.json)')
+    args = parser.parse_args(argv)
+    args.comando = aliases.get(args.comando, args.comando)
+    return args
+
+
+def tempos_importacao(argv):
+    '''
+        Executa o comando em um novo interpretador com -X importtime, repassando a saída, e
+        grava o relatório dos tempos de importação por pacote em relatorios/importacoes.json.
+        Os módulos importados pelos processos auxiliares (pools) também entram no relatório.
+    '''
+    argv = [a for a in argv if a != '--tempos-importacao']
+    processo = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), *argv],
+                              stderr=subprocess.PIPE, text=True)
+
+    # Repassar as mensagens de erro do comando, separando-as das linhas de tempo de importação
+    linhas = processo.stderr.splitlines()
+    for linha in linhas:
+        if not linha.startswith('import time:'):
+            print(linha, file=sys.stderr)
+
+    caminho, relatorio = Instrumentacao.salvar_importacoes(linhas, contexto={'argv': argv})
+    print(f"Importações: {relatorio['modulos']} módulos, {relatorio['segundos']:.2f} s ({caminho})")
+    for item in relatorio['pacotes'][:10]:
+        print(f"  {item['pacote']:<24} {item['segundos']:.3f} s")
+    return processo.returncode
+
+
+def main(argv=None):
     try:
-        # Definir o ano limite para análise
-        limite = 2019
-
-        # Carregar os dados de crimes
-        crimes = Dados.Crimes(limite)
-
-
-        # Carregar os dados de homicídios
-        homicidios = Dados.Homicidios(limite)
-
-
-        # Carregar os dados de registros
-        registros = Dados.Registros(limite)
-
-
-        # Carregar os dados de apreendidas
-        apreendidas = Dados.Apreendidas(limite)
-
-
-        # Carregar os dados de IDH
-        idh = Dados.IDH(limite)
-
-
-        # Carregar os dados de Desemprego
-        desemprego = Dados.Desemprego(limite)
-
-
-        # Carregar os dados de IPC
-        ipc = Dados.IPC(limite)
-
-
-        # Unificar os DataFrames
-        df_unificado = Dados.UniData(crimes, homicidios, registros, apreendidas, idh, desemprego, ipc)
-        
-
-        # Exportar o DataFrame unificado
-        df_unificado.to_csv("graficos/dados/dfUnificado.csv", index=False)
-
-
-        # Calcular a matriz de correlação
-        correlation_matrix = Analises.MatrizCorrelacao(df_unificado)
-
-
-        #Exportar a matriz de correlação
-        correlation_matrix.to_csv("graficos/dados/correlationMatrix.csv", index=False)
-
-
-        # Analisar as correlações
-        Analises.AnalisarCorrelacoes(correlation_matrix)
-
-
-        # Analisar as variáveis
-        Visualizacoes.AnalisarVariaveis(df_unificado)
-
-
-        # Gerar o mapa de calor
-        Visualizacoes.grafico_calor(correlation_matrix)
-
-
-        # Predição de valores
-        df_predicoes = Visualizacoes.predicao(df_unificado)
-
-        # Exportar o DataFrame de predições
-        df_predicoes.to_csv("graficos/dados/dfPredicoes.csv", index=False)
-        
-        # df porcentagem
-        df_porcentagem = Visualizacoes.to_percentage(df_predicoes)
-
-        
-        Visualizacoes.plot_dataframe(df_porcentagem)
-        
-
-        Visualizacoes.grafico_homicidios_registros(df_unificado)
+        argv = sys.argv[1:] if argv is None else list(argv)
+        args = argumentos(argv)
+        if args.tempos_importacao:
+            return tempos_importacao(argv)
+
+        # Intervalo de anos, granularidade (Granularidade.ANO, ANO_UF ou ANO_MES_UF) e, opcionalmente, o .zip das fontes
+        inicio, limite, granularidade, pacote = args.inicio, args.limite, args.granularidade, args.pacote
+
+        # Gravar um perfil do cProfile por etapa em relatorios/perfis
+        Instrumentacao.perfil = args.perfil
+
+        # Executar apenas as etapas do comando cujas entradas, parâmetros ou código mudaram
+        varredura = None
+        if args.comando == 'varrer':
+            varredura = {'fins': args.fins, 'tamanho': args.janela, 'predicao': not args.sem_predicao}
+        # Diretório das saídas: graficos ou, versionado, um diretório novo por execução
+        saida = Saidas.diretorio_execucao('graficos', args.versionar)
+        grafo = etapas(limite, granularidade, inicio, pacote, varredura, saida, args.formatos)
+        alvos = comandos[args.comando][2]
+        if alvos is not None:
+            grafo = Pipeline.selecionar(grafo, alvos)
+        relatorio = Pipeline.executar(grafo, forcar=args.forcar)
+
+        # Informar as etapas que falharam
+        falhas = [etapa for etapa, info in relatorio.items() if info['erro']]
+        for etapa in falhas:
+            print(f"Falha na etapa {etapa}:", relatorio[etapa]['erro'])
+
+        # Gravar o relatório da execução (tempos, memória, linhas e erros por etapa) em relatorios/execucao.json
+        contexto = {'comando': args.comando, 'varredura': varredura, 'inicio': inicio, 'limite': limite, 'granularidade': granularidade, 'pacote': pacote, 'saida': saida, 'formatos': args.formatos,
+                    'fontes': carregamento(relatorio), 'pipeline': relatorio}
+        Instrumentacao.salvar(contexto=contexto)
+
+        # Execução versionada: guardar o relatório junto das saídas e, sem falhas, apontar graficos/ultima para ela
+        if args.versionar:
+            Instrumentacao.salvar(os.path.join(saida, 'execucao.json'), contexto=contexto)
+            if not falhas:
+                Saidas.publicar(saida)
+
+        # Código de saída: 1 se alguma etapa falhou, para que scripts e CI percebam a falha
+        return 1 if falhas else 0
 
-        
     except Exception as e:
         print("Ocorreu um erro durante a execução:", e)
+        return 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
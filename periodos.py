@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from analises import Analises
+from data import Granularidade
+from instrumentacao import Instrumentacao
+
+
+class Periodos:
+    '''
+        Períodos de governo a partir dos mandatos de Dados.Presidentes. Cada mandato vai da
+        posse até o ano anterior à posse seguinte (o ano da posse pertence ao novo governo) e
+        os mandatos consecutivos do mesmo presidente formam um único governo.
+
+        As estatísticas e as correlações por período são calculadas de uma vez para todos os
+        períodos: as agregações em um único groupby e as correlações empilhando as linhas de
+        cada período em um lote de Analises._pearson, completado com NaN até o período mais
+        longo, em vez de repetir a análise para cada governo.
+    '''
+
+    # Duração de um mandato, usada para o fim do último governo da tabela
+    duracao = 4
+
+    # Colunas acrescentadas por Periodos.Anotar
+    colunas = ['Governo', 'Presidente', 'Partido']
+
+    @Instrumentacao.medir()
+    def Governos(presidentes):
+        '''
+            Governos em ordem cronológica, com as colunas Governo (rótulo 'Presidente
+            (início-fim)'), Presidente, Partido, Inicio e Fim (anos inclusivos).
+        '''
+        try:
+            mandatos = presidentes.sort_values('Posse', kind='stable').reset_index(drop=True)
+            fim = mandatos['Posse'].shift(-1) - 1
+            mandatos['Fim'] = fim.fillna(mandatos['Posse'] + Periodos.duracao - 1).astype('int64')
+
+            # Um novo governo começa sempre que o presidente muda
+            governo = mandatos['Presidente'].ne(mandatos['Presidente'].shift()).cumsum()
+            governos = mandatos.groupby(governo).agg(Presidente=('Presidente', 'first'), Partido=('Partido', 'first'),
+                                                     Inicio=('Posse', 'min'), Fim=('Fim', 'max'))
+            rotulos = governos['Presidente'] + ' (' + governos['Inicio'].astype(str) + '-' + governos['Fim'].astype(str) + ')'
+            return governos.assign(Governo=rotulos)[['Governo', 'Presidente', 'Partido', 'Inicio', 'Fim']].reset_index(drop=True)
+        except Exception as e:
+            print("Erro ao montar os períodos de governo:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    def Anos(governos, anos):
+        '''
+            Tabela ano -> Governo, Presidente e Partido para os anos informados (NaN nos anos
+            fora de todos os governos), com um único searchsorted sobre o início dos governos.
+        '''
+        anos = np.asarray(anos)
+        posicao = np.searchsorted(governos['Inicio'].to_numpy(), anos, side='right') - 1
+        dentro = (posicao >= 0) & (anos <= governos['Fim'].to_numpy()[np.maximum(posicao, 0)])
+        codigos = np.where(dentro, posicao, -1)
+
+        tabela = pd.DataFrame(index=pd.Index(anos, name='Ano'))
+        for coluna in Periodos.colunas:
+            # Categorias na ordem cronológica dos governos
+            categorias = list(dict.fromkeys(governos[coluna]))
+            indices = governos[coluna].map({valor: i for i, valor in enumerate(categorias)}).to_numpy()
+            tabela[coluna] = pd.Categorical.from_codes(np.where(codigos >= 0, indices[codigos], -1),
+                                                       categories=categorias, ordered=coluna == 'Governo')
+        return tabela
+
+    @Instrumentacao.medir()
+    def Anotar(df, governos):
+        '''
+            Acrescenta ao DataFrame (unificado ou painel) as colunas Governo, Presidente e
+            Partido correspondentes ao ano de cada linha.
+        '''
+        try:
+            periodos = Periodos.Anos(governos, df['Ano'].to_numpy())
+            return df.assign(**{coluna: periodos[coluna].array for coluna in Periodos.colunas})
+        except Exception as e:
+            print("Erro ao anotar os períodos de governo:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def Estatisticas(df_unificado, governos, por='Governo'):
+        '''
+            Estatísticas de cada indicador por período (por = 'Governo', 'Presidente' ou
+            'Partido') em um único groupby. Retorna uma tabela longa com as colunas do período,
+            Variavel, Inicio e Fim (anos com dados), N, Media, Desvio, Minimo e Maximo.
+        '''
+        try:
+            colunas = Granularidade.indicadores(df_unificado)
+            grupos = Periodos.Anotar(df_unificado, governos).groupby(por, observed=True)
+
+            # Colunas (indicador, estatística): cada linha de períodos vira uma linha por indicador
+            nomes = ['N', 'Media', 'Desvio', 'Minimo', 'Maximo']
+            estatisticas = grupos[colunas].agg(['count', 'mean', 'std', 'min', 'max'])
+            tabela = pd.DataFrame(estatisticas.to_numpy().reshape(-1, len(nomes)), columns=nomes,
+                                  index=pd.MultiIndex.from_product([estatisticas.index, colunas], names=[por, 'Variavel']))
+            tabela['N'] = tabela['N'].astype('int64')
+
+            anos = grupos['Ano'].agg(Inicio='min', Fim='max')
+            tabela = tabela.reset_index().merge(anos.reset_index(), on=por)
+            return tabela[[por, 'Variavel', 'Inicio', 'Fim'] + nomes]
+        except Exception as e:
+            print("Erro ao calcular as estatísticas por período:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def Correlacoes(df_unificado, governos, por='Governo'):
+        '''
+            Matrizes de correlação de Pearson dos indicadores em cada período, no formato de
+            Analises.MatrizCorrelacao com agrupar_por (índice (período, indicador)), calculadas
+            em uma única chamada vetorizada para todos os períodos.
+        '''
+        try:
+            colunas = Granularidade.indicadores(df_unificado)
+            periodo = Periodos.Anotar(df_unificado, governos)[por]
+            presentes = periodo.notna().to_numpy()
+            periodo = periodo[presentes].cat.remove_unused_categories()
+            codigos = periodo.cat.codes.to_numpy()
+            valores = df_unificado[colunas].to_numpy(dtype=float)[presentes]
+
+            # Empilhar as linhas de cada período em um lote (períodos, linhas, indicadores), completado com NaN
+            ordem = np.argsort(codigos, kind='stable')
+            tamanhos = np.bincount(codigos, minlength=len(periodo.cat.categories))
+            linha = np.arange(len(ordem)) - np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+            X = np.full((len(tamanhos), max(tamanhos.max(), 1), len(colunas)), np.nan)
+            X[codigos[ordem], linha] = valores[ordem]
+
+            r, _ = Analises._pearson(X, X)
+
+            # A diagonal é exatamente 1 sempre que a correlação está definida
+            diagonal = np.arange(len(colunas))
+            r[:, diagonal, diagonal] = np.where(np.isnan(r[:, diagonal, diagonal]), np.nan, 1.0)
+
+            indice = pd.MultiIndex.from_product([periodo.cat.categories, colunas], names=[por, None])
+            return pd.DataFrame(r.reshape(-1, len(colunas)), index=indice, columns=colunas)
+        except Exception as e:
+            print("Erro ao calcular as correlações por período:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
@@ -0,0 +1,335 @@
+from concurrent.futures import ProcessPoolExecutor
+import ast
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import json
+import os
+import pickle
+import time
+
+from instrumentacao import Instrumentacao
+from saidas import Saidas
+
+
+class Pipeline:
+    '''
+        Grafo de dependências entre as etapas de Dados, Analises e Visualizacoes com
+        recomputação incremental.
+
+        Cada etapa é um dicionário com as chaves:
+            'nome'          identificador único da etapa
+            'funcao'        função a executar, como objeto ou como 'modulo:Classe.metodo'
+                            (neste caso o módulo só é importado se a etapa precisar rodar)
+            'dependencias'  nomes das etapas cujos resultados são passados, em ordem, como argumentos
+            'parametros'    argumentos nomeados adicionais (ex.: {'limite': 2019})
+            'entradas'      arquivos lidos pela etapa
+            'saidas'        arquivos gerados pela etapa
+            'valor'         True se a etapa retorna um resultado (None indica falha)
+            'sempre'        True para executar a etapa em toda execução (ex.: relatórios
+                            impressos na saída padrão, que não deixam arquivos)
+
+        A impressão digital de uma etapa combina o nome, os parâmetros, o código-fonte do
+        módulo da função e dos módulos do projeto que ele importa (direta ou indiretamente,
+        inclusive as importações feitas dentro das funções), o conteúdo das entradas e as
+        impressões digitais das dependências.
+        Uma etapa só é executada quando a impressão digital mudou, quando alguma saída não
+        existe ou quando um resultado seu é necessário e não está salvo.
+    '''
+
+    diretorio = 'dados/.cache/pipeline'
+
+    # Módulos importados por cada arquivo-fonte, por (caminho, tamanho, mtime)
+    _importacoes = {}
+
+    def _resolver(funcao):
+        # Importar a função a partir de 'modulo:Classe.metodo'
+        if callable(funcao):
+            return funcao
+        modulo, caminho = funcao.split(':')
+        objeto = importlib.import_module(modulo)
+        for parte in caminho.split('.'):
+            objeto = getattr(objeto, parte)
+        return objeto
+
+    def _arquivo_fonte(funcao):
+        # Localizar o arquivo do código-fonte da função sem importar o módulo
+        if callable(funcao):
+            return inspect.getsourcefile(funcao)
+        especificacao = importlib.util.find_spec(funcao.split(':')[0])
+        return especificacao.origin if especificacao else None
+
+    def _modulos_importados(caminho):
+        # Nomes (primeiro componente) de todos os módulos importados no arquivo, sem executá-lo
+        stat = os.stat(caminho)
+        chave = (caminho, stat.st_size, stat.st_mtime_ns)
+        if chave not in Pipeline._importacoes:
+            with open(caminho, encoding='utf-8') as f:
+                arvore = ast.parse(f.read(), filename=caminho)
+            nomes = set()
+            for no in ast.walk(arvore):
+                if isinstance(no, ast.Import):
+                    nomes.update(alias.name.split('.')[0] for alias in no.names)
+                elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+                    nomes.add(no.module.split('.')[0])
+            Pipeline._importacoes[chave] = sorted(nomes)
+        return Pipeline._importacoes[chave]
+
+    def _arquivos_codigo(caminho):
+        '''
+            Arquivo-fonte de uma etapa e todos os módulos do projeto (no mesmo diretório) que
+            ele importa, direta ou indiretamente. Bibliotecas externas ficam de fora.
+        '''
+        if not caminho or not os.path.exists(caminho):
+            return []
+        raiz = os.path.dirname(os.path.abspath(caminho))
+        arquivos = set()
+        pendentes = [os.path.abspath(caminho)]
+        while pendentes:
+            arquivo = pendentes.pop()
+            if arquivo in arquivos:
+                continue
+            arquivos.add(arquivo)
+            for nome in Pipeline._modulos_importados(arquivo):
+                local = os.path.join(raiz, f'{nome}.py')
+                if os.path.exists(local):
+                    pendentes.append(local)
+        return sorted(arquivos)
+
+    def _hash_arquivo(caminho, estado):
+        # Reaproveitar o hash salvo enquanto o tamanho e o mtime não mudarem
+        if not caminho or not os.path.exists(caminho):
+            return None
+        stat = os.stat(caminho)
+        chave = os.path.abspath(caminho)
+        salvo = estado['arquivos'].get(chave)
+        if salvo and salvo['tamanho'] == stat.st_size and salvo['mtime_ns'] == stat.st_mtime_ns:
+            return salvo['sha256']
+
+        sha = hashlib.sha256()
+        with open(caminho, 'rb') as f:
+            for bloco in iter(lambda: f.read(1 << 20), b''):
+                sha.update(bloco)
+        estado['arquivos'][chave] = {'tamanho': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+        return sha.hexdigest()
+
+    def impressao_digital(etapa, digitais, estado):
+        '''
+            Calcula a impressão digital de uma etapa a partir das digitais já calculadas das
+            suas dependências.
+        '''
+        conteudo = {
+            'nome': etapa['nome'],
+            'parametros': repr(sorted(etapa.get('parametros', {}).items())),
+            'codigo': [Pipeline._hash_arquivo(caminho, estado)
+                       for caminho in Pipeline._arquivos_codigo(Pipeline._arquivo_fonte(etapa['funcao']))],
+            'entradas': [Pipeline._hash_arquivo(caminho, estado) for caminho in etapa.get('entradas', [])],
+            'dependencias': [digitais[nome] for nome in etapa.get('dependencias', [])],
+        }
+        return hashlib.sha256(json.dumps(conteudo, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def selecionar(etapas, alvos):
+        '''
+            Subconjunto do grafo necessário para executar as etapas em alvos: os próprios
+            alvos e todas as etapas de que eles dependem, direta ou indiretamente, na ordem
+            em que foram declaradas.
+        '''
+        por_nome = {etapa['nome']: etapa for etapa in etapas}
+        necessarias = set()
+        pendentes = list(alvos)
+        while pendentes:
+            nome = pendentes.pop()
+            if nome not in necessarias:
+                necessarias.add(nome)
+                pendentes += por_nome[nome].get('dependencias', [])
+        return [etapa for etapa in etapas if etapa['nome'] in necessarias]
+
+    def _niveis(etapas):
+        # Agrupar as etapas por profundidade no grafo; etapas do mesmo nível são independentes
+        profundidade = {}
+        for etapa in etapas:
+            deps = etapa.get('dependencias', [])
+            faltantes = [nome for nome in deps if nome not in profundidade]
+            if faltantes:
+                raise ValueError(f"A etapa {etapa['nome']} depende de etapas não declaradas antes dela: {faltantes}")
+            profundidade[etapa['nome']] = 1 + max((profundidade[nome] for nome in deps), default=-1)
+
+        niveis = [[] for _ in range(max(profundidade.values(), default=-1) + 1)]
+        for etapa in etapas:
+            niveis[profundidade[etapa['nome']]].append(etapa)
+        return niveis
+
+    def _caminho_valor(nome):
+        return os.path.join(Pipeline.diretorio, f'{nome}.pkl')
+
+    def _carregar_estado():
+        caminho = os.path.join(Pipeline.diretorio, 'estado.json')
+        if os.path.exists(caminho):
+            with open(caminho, encoding='utf-8') as f:
+                return json.load(f)
+        return {'arquivos': {}, 'etapas': {}}
+
+    def _salvar_estado(estado):
+        caminho = os.path.join(Pipeline.diretorio, 'estado.json')
+        with open(f'{caminho}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(estado, f, ensure_ascii=False, indent=2)
+        os.replace(f'{caminho}.tmp', caminho)
+
+    def exportar(df, caminho, index=False, formatos=('csv',)):
+        '''
+            Etapa de exportação de um DataFrame em cada um dos formatos de Saidas (CSV,
+            Parquet, Feather). A gravação segue em segundo plano; Pipeline.executar espera
+            as gravações antes de conferir as saídas declaradas.
+        '''
+        Saidas.tabela(df, caminho, formatos, index=index)
+
+    def _executar_etapa(nome, funcao, argumentos, parametros, aguardar=False):
+        # Executar uma etapa (também dentro de um processo do pool), medir o tempo gasto e
+        # retornar os registros de instrumentação gerados por ela. Com aguardar=True (nos
+        # processos do pool, que terminam com o pool) as gravações da etapa são concluídas aqui
+        inicio = time.perf_counter()
+        inicio_registros = len(Instrumentacao.registros)
+        try:
+            linhas = [Instrumentacao._linhas(a) for a in argumentos]
+            with Instrumentacao.etapa(nome, funcao if isinstance(funcao, str) else funcao.__qualname__,
+                                      sum(n for n in linhas if n is not None) if any(n is not None for n in linhas) else None) as registro:
+                resultado = Pipeline._resolver(funcao)(*argumentos, **parametros)
+                registro['linhas_saida'] = Instrumentacao._linhas(resultado)
+            erro = None
+        except Exception as e:
+            resultado, erro = None, repr(e)
+        if aguardar:
+            erros = Saidas.aguardar()
+            erro = erro or ('; '.join(erros) if erros else None)
+        return resultado, time.perf_counter() - inicio, erro, Instrumentacao.registros[inicio_registros:]
+
+    def _falhar(relatorio, nome, erro, registros):
+        # Marcar a falha no relatório e no registro da etapa (o primeiro registro gerado por ela)
+        relatorio[nome]['erro'] = erro
+        if registros:
+            registros[0]['status'] = 'falha'
+            if not registros[0]['erros']:
+                registros[0]['erros'].append({'tipo': None, 'mensagem': erro, 'traceback': None})
+
+    def executar(etapas, paralelo=None, forcar=False):
+        '''
+            Executa as etapas desatualizadas, nível a nível. Com paralelo=True, as etapas
+            desatualizadas de um mesmo nível rodam em um pool de processos; o padrão (None)
+            usa o pool apenas quando há mais de uma CPU. Com forcar=True todas as etapas são
+            executadas. Retorna um relatório
+            {etapa: {'executada', 'segundos', 'erro'}}.
+
+            As gravações de arquivos (Saidas) seguem em segundo plano enquanto as etapas
+            seguintes rodam; as saídas declaradas são conferidas ao final, depois de
+            Saidas.aguardar, e só então as etapas que as geram são dadas como atualizadas.
+        '''
+        if paralelo is None:
+            paralelo = (os.cpu_count() or 1) > 1
+
+        os.makedirs(Pipeline.diretorio, exist_ok=True)
+        estado = Pipeline._carregar_estado()
+        hashes_salvos = dict(estado['arquivos'])
+        por_nome = {etapa['nome']: etapa for etapa in etapas}
+        niveis = Pipeline._niveis(etapas)
+
+        # Calcular todas as impressões digitais antes de executar qualquer etapa
+        digitais = {}
+        for nivel in niveis:
+            for etapa in nivel:
+                digitais[etapa['nome']] = Pipeline.impressao_digital(etapa, digitais, estado)
+
+        # Salvar os hashes recalculados (ex.: arquivo tocado sem mudar o conteúdo)
+        if estado['arquivos'] != hashes_salvos:
+            Pipeline._salvar_estado(estado)
+
+        # Uma etapa está desatualizada se a digital mudou, se falta alguma saída ou se falhou antes
+        desatualizadas = set()
+        for etapa in etapas:
+            nome = etapa['nome']
+            if (forcar or etapa.get('sempre') or estado['etapas'].get(nome) != digitais[nome]
+                    or any(not os.path.exists(caminho) for caminho in etapa.get('saidas', []))):
+                desatualizadas.add(nome)
+
+        # Etapas cujo resultado salvo sumiu precisam rodar se alguma dependente for rodar
+        for etapa in reversed(etapas):
+            if etapa['nome'] in desatualizadas:
+                for dep in etapa.get('dependencias', []):
+                    if por_nome[dep].get('valor', True) and not os.path.exists(Pipeline._caminho_valor(dep)):
+                        desatualizadas.add(dep)
+
+        valores = {}
+        falhas = set()
+        conferir = []
+        relatorio = {etapa['nome']: {'executada': False, 'segundos': 0.0, 'erro': None} for etapa in etapas}
+
+        def valor(nome):
+            if nome not in valores:
+                with open(Pipeline._caminho_valor(nome), 'rb') as f:
+                    valores[nome] = pickle.load(f)
+            return valores[nome]
+
+        for nivel in niveis:
+            pendentes = []
+            for etapa in nivel:
+                if etapa['nome'] not in desatualizadas:
+                    continue
+                deps = etapa.get('dependencias', [])
+                if any(dep in falhas for dep in deps):
+                    falhas.add(etapa['nome'])
+                    relatorio[etapa['nome']]['erro'] = 'dependência falhou'
+                    continue
+                argumentos = [valor(dep) if por_nome[dep].get('valor', True) else None for dep in deps]
+                pendentes.append((etapa, (etapa['nome'], etapa['funcao'], argumentos, etapa.get('parametros', {}))))
+
+            if paralelo and len(pendentes) > 1:
+                with ProcessPoolExecutor(max_workers=len(pendentes)) as pool:
+                    futuros = [pool.submit(Pipeline._executar_etapa, *tarefa, True) for _, tarefa in pendentes]
+                    resultados = [futuro.result() for futuro in futuros]
+
+                # Registros de instrumentação gerados nos processos do pool
+                for *_, registros in resultados:
+                    Instrumentacao.incorporar(registros)
+            else:
+                resultados = [Pipeline._executar_etapa(*tarefa) for _, tarefa in pendentes]
+
+            for (etapa, _), (resultado, segundos, erro, registros) in zip(pendentes, resultados):
+                nome = etapa['nome']
+                if erro is None and etapa.get('valor', True) and resultado is None:
+                    erro = 'a etapa retornou None'
+
+                relatorio[nome] = {'executada': True, 'segundos': segundos, 'erro': None}
+                if erro is not None:
+                    Pipeline._falhar(relatorio, nome, erro, registros)
+                    falhas.add(nome)
+                    estado['etapas'].pop(nome, None)
+                    continue
+
+                if etapa.get('valor', True):
+                    valores[nome] = resultado
+                    caminho = Pipeline._caminho_valor(nome)
+                    with open(f'{caminho}.tmp', 'wb') as f:
+                        pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(f'{caminho}.tmp', caminho)
+
+                # Etapas com saídas declaradas são conferidas depois das gravações pendentes
+                if etapa.get('saidas'):
+                    conferir.append((etapa, registros))
+                else:
+                    estado['etapas'][nome] = digitais[nome]
+
+            # Salvar o estado a cada nível, para que uma interrupção não perca o progresso
+            if pendentes:
+                Pipeline._salvar_estado(estado)
+
+        Saidas.aguardar()
+        for etapa, registros in conferir:
+            faltantes = [caminho for caminho in etapa['saidas'] if not os.path.exists(caminho)]
+            if faltantes:
+                Pipeline._falhar(relatorio, etapa['nome'], f'saídas não geradas: {faltantes}', registros)
+            else:
+                estado['etapas'][etapa['nome']] = digitais[etapa['nome']]
+        if conferir:
+            Pipeline._salvar_estado(estado)
+
+        return relatorio
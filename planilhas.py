@@ -0,0 +1,364 @@
+from concurrent.futures import ProcessPoolExecutor
+import io
+import os
+import re
+import zipfile
+from xml.etree import ElementTree
+
+import pandas as pd
+
+
+class Planilhas:
+    '''
+        Leitura em fluxo de planilhas .xlsx (inclusive no formato strict OOXML, que o openpyxl
+        não lê) e .ods. O arquivo é aberto uma única vez como .zip e apenas o XML das abas
+        pedidas é percorrido, linha a linha, com os elementos já processados descartados:
+        a memória usada depende do tamanho do lote, não do tamanho da planilha.
+
+        A origem pode ser um caminho ou um objeto binário com acesso aleatório (ex.: io.BytesIO
+        com o conteúdo de um membro de .zip). As abas são indicadas pelo nome ou pela posição
+        e cabecalho é a linha (a partir de 0) com os nomes das colunas; as linhas anteriores
+        são ignoradas, assim como as linhas vazias. Datas são retornadas como pd.Timestamp.
+    '''
+
+    # Formatos numéricos nativos do Excel que representam datas e horas
+    formatos_data = set(range(14, 23)) | set(range(27, 37)) | set(range(45, 48)) | set(range(50, 59))
+
+    _ods = {
+        'tabela': '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}table',
+        'linha': '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}table-row',
+        'celula': '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}table-cell',
+        'coberta': '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}covered-table-cell',
+        'nome': '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}name',
+        'repetir_linhas': '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}number-rows-repeated',
+        'repetir_colunas': '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}number-columns-repeated',
+        'tipo': '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}value-type',
+        'valor': '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}value',
+        'data': '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}date-value',
+        'booleano': '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}boolean-value',
+        'paragrafo': '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}p',
+        'espaco': '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}s',
+        'quantidade': '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}c',
+    }
+
+    # Limite de colunas de uma planilha; repetições de células vazias além dele são ignoradas
+    max_colunas = 16384
+
+    def _local(tag):
+        # Nome do elemento sem o namespace (o .xlsx transicional e o strict usam namespaces diferentes)
+        return tag.rsplit('}', 1)[-1]
+
+    def _abrir(origem):
+        if isinstance(origem, bytes):
+            origem = io.BytesIO(origem)
+        return zipfile.ZipFile(origem)
+
+    def _formato(z):
+        nomes = set(z.namelist())
+        if 'content.xml' in nomes:
+            return 'ods'
+        if 'xl/workbook.xml' in nomes:
+            return 'xlsx'
+        raise ValueError("Formato de planilha não reconhecido (esperado .xlsx ou .ods)")
+
+    def _numero(texto):
+        # Números inteiros (ex.: anos e contagens) ficam como int, como no pd.read_excel
+        valor = float(texto)
+        return int(valor) if valor.is_integer() else valor
+
+    # Leitura de .xlsx
+
+    def _abas_xlsx(z):
+        # [(nome, caminho do XML da aba)] na ordem do livro
+        relacoes = {}
+        for elemento in ElementTree.fromstring(z.read('xl/_rels/workbook.xml.rels')):
+            alvo = elemento.get('Target')
+            relacoes[elemento.get('Id')] = alvo.lstrip('/') if alvo.startswith('/') else f'xl/{alvo}'
+
+        abas = []
+        for elemento in ElementTree.fromstring(z.read('xl/workbook.xml')).iter():
+            if Planilhas._local(elemento.tag) == 'sheet':
+                identificador = next(v for k, v in elemento.attrib.items() if Planilhas._local(k) == 'id')
+                abas.append((elemento.get('name'), relacoes[identificador]))
+        return abas
+
+    def _textos_xlsx(z):
+        # Tabela de textos compartilhados (ignorando as anotações fonéticas)
+        if 'xl/sharedStrings.xml' not in z.namelist():
+            return []
+        textos = []
+        with z.open('xl/sharedStrings.xml') as f:
+            for _, elemento in ElementTree.iterparse(f):
+                if Planilhas._local(elemento.tag) == 'si':
+                    partes = [filho for filho in elemento if Planilhas._local(filho.tag) in ('t', 'r')]
+                    textos.append(''.join(''.join(t.text or '' for t in parte.iter()
+                                                  if Planilhas._local(t.tag) == 't') for parte in partes))
+                    elemento.clear()
+        return textos
+
+    def _datas_xlsx(z):
+        # Índices dos estilos de célula com formato de data e a data base do livro (1900 ou 1904)
+        raiz = ElementTree.fromstring(z.read('xl/workbook.xml'))
+        data1904 = any(Planilhas._local(e.tag) == 'workbookPr' and e.get('date1904') in ('1', 'true') for e in raiz.iter())
+        base = pd.Timestamp('1904-01-01') if data1904 else pd.Timestamp('1899-12-30')
+        if 'xl/styles.xml' not in z.namelist():
+            return set(), base
+
+        formatos = set(Planilhas.formatos_data)
+        estilos = set()
+        raiz = ElementTree.fromstring(z.read('xl/styles.xml'))
+        for elemento in raiz.iter():
+            if Planilhas._local(elemento.tag) == 'numFmt':
+                # Formato personalizado: é data se tiver dia, ano ou hora fora de textos literais e cores
+                codigo = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', '', elemento.get('formatCode', '')).lower()
+                if re.search(r'[dyh]', codigo):
+                    formatos.add(int(elemento.get('numFmtId')))
+        for elemento in raiz.iter():
+            if Planilhas._local(elemento.tag) == 'cellXfs':
+                for indice, xf in enumerate(filho for filho in elemento if Planilhas._local(filho.tag) == 'xf'):
+                    if int(xf.get('numFmtId', 0)) in formatos:
+                        estilos.add(indice)
+        return estilos, base
+
+    def _coluna(referencia):
+        # Índice (a partir de 0) da coluna de uma referência como 'AB12'
+        indice = 0
+        for caractere in referencia:
+            if caractere.isdigit():
+                break
+            indice = indice * 26 + ord(caractere) - 64
+        return indice - 1
+
+    def _linhas_xlsx(z, caminho):
+        # Gera (número da linha, {coluna: valor}) das linhas não vazias da aba
+        textos = Planilhas._textos_xlsx(z)
+        estilos_data, base = Planilhas._datas_xlsx(z)
+        dados = None
+
+        with z.open(caminho) as f:
+            for evento, elemento in ElementTree.iterparse(f, events=('start', 'end')):
+                local = Planilhas._local(elemento.tag)
+                if evento == 'start':
+                    if local == 'sheetData':
+                        dados = elemento
+                    continue
+                if local != 'row':
+                    continue
+
+                linha = {}
+                for posicao, celula in enumerate(c for c in elemento if Planilhas._local(c.tag) == 'c'):
+                    referencia = celula.get('r')
+                    coluna = Planilhas._coluna(referencia) if referencia else posicao
+                    tipo = celula.get('t', 'n')
+                    v = next((filho.text for filho in celula if Planilhas._local(filho.tag) == 'v'), None)
+
+                    if tipo == 'inlineStr':
+                        valor = ''.join(t.text or '' for t in celula.iter() if Planilhas._local(t.tag) == 't')
+                    elif v is None or tipo == 'e':
+                        continue
+                    elif tipo == 's':
+                        valor = textos[int(v)]
+                    elif tipo == 'str':
+                        valor = v
+                    elif tipo == 'b':
+                        valor = v == '1'
+                    elif tipo == 'd':
+                        valor = pd.Timestamp(v)
+                    elif int(celula.get('s', 0)) in estilos_data:
+                        valor = base + pd.Timedelta(days=float(v))
+                    else:
+                        valor = Planilhas._numero(v)
+                    linha[coluna] = valor
+
+                numero = int(elemento.get('r')) - 1 if elemento.get('r') else None
+                elemento.clear()
+                if dados is not None:
+                    dados.clear()
+                if linha:
+                    yield numero, linha
+
+    # Leitura de .ods
+
+    def _abas_ods(z):
+        nomes = []
+        with z.open('content.xml') as f:
+            for evento, elemento in ElementTree.iterparse(f, events=('start', 'end')):
+                if evento == 'start' and elemento.tag == Planilhas._ods['tabela']:
+                    nomes.append(elemento.get(Planilhas._ods['nome']))
+                elif evento == 'end' and elemento.tag == Planilhas._ods['linha']:
+                    elemento.clear()
+        return nomes
+
+    def _texto_ods(elemento):
+        # Texto do elemento e dos seus filhos, com as sequências de espaços (text:s) expandidas
+        partes = [elemento.text or '']
+        for filho in elemento:
+            if filho.tag == Planilhas._ods['espaco']:
+                partes.append(' ' * int(filho.get(Planilhas._ods['quantidade'], 1)))
+            else:
+                partes.append(Planilhas._texto_ods(filho))
+            partes.append(filho.tail or '')
+        return ''.join(partes)
+
+    def _valor_ods(celula):
+        tipo = celula.get(Planilhas._ods['tipo'])
+        if tipo in ('float', 'percentage', 'currency'):
+            return Planilhas._numero(celula.get(Planilhas._ods['valor']))
+        if tipo == 'date':
+            return pd.Timestamp(celula.get(Planilhas._ods['data']))
+        if tipo == 'boolean':
+            return celula.get(Planilhas._ods['booleano']) == 'true'
+        paragrafos = [Planilhas._texto_ods(p) for p in celula.iter(Planilhas._ods['paragrafo'])]
+        return '\n'.join(paragrafos) if paragrafos else None
+
+    def _linhas_ods(z, nome):
+        # Gera (número da linha, {coluna: valor}) das linhas não vazias da aba, expandindo as repetições
+        o = Planilhas._ods
+        tabela = None
+        numero = 0
+        with z.open('content.xml') as f:
+            for evento, elemento in ElementTree.iterparse(f, events=('start', 'end')):
+                if evento == 'start':
+                    if elemento.tag == o['tabela']:
+                        if tabela is not None:
+                            return
+                        if elemento.get(o['nome']) == nome:
+                            tabela = elemento
+                    continue
+                if elemento.tag != o['linha']:
+                    continue
+                if tabela is None:
+                    elemento.clear()
+                    continue
+
+                linha = {}
+                coluna = 0
+                for celula in elemento:
+                    if celula.tag not in (o['celula'], o['coberta']):
+                        continue
+                    repeticoes = int(celula.get(o['repetir_colunas'], 1))
+                    valor = Planilhas._valor_ods(celula)
+                    if valor is not None:
+                        for indice in range(coluna, min(coluna + repeticoes, Planilhas.max_colunas)):
+                            linha[indice] = valor
+                    coluna += repeticoes
+
+                repeticoes = int(elemento.get(o['repetir_linhas'], 1))
+                elemento.clear()
+                tabela.clear()
+                if linha:
+                    # Linhas iguais e consecutivas são gravadas uma vez só, com a contagem de repetições
+                    for i in range(repeticoes):
+                        yield numero + i, linha
+                numero += repeticoes
+
+    # Interface pública
+
+    def abas(origem):
+        '''
+            Lista os nomes das abas da planilha, na ordem do livro.
+        '''
+        with Planilhas._abrir(origem) as z:
+            if Planilhas._formato(z) == 'ods':
+                return Planilhas._abas_ods(z)
+            return [nome for nome, _ in Planilhas._abas_xlsx(z)]
+
+    def _registros(z, aba, colunas, cabecalho):
+        # Gera os nomes das colunas selecionadas e, em seguida, as linhas de dados como listas
+        if Planilhas._formato(z) == 'ods':
+            nomes = Planilhas._abas_ods(z) if isinstance(aba, int) else None
+            linhas = Planilhas._linhas_ods(z, nomes[aba] if nomes is not None else aba)
+        else:
+            abas = Planilhas._abas_xlsx(z)
+            caminhos = dict(abas)
+            if isinstance(aba, int):
+                caminho = abas[aba][1]
+            elif aba in caminhos:
+                caminho = caminhos[aba]
+            else:
+                raise ValueError(f"Aba não encontrada: {aba}. Abas disponíveis: {[nome for nome, _ in abas]}")
+            linhas = Planilhas._linhas_xlsx(z, caminho)
+
+        indices = None
+        posicao = -1
+        for numero, linha in linhas:
+            posicao = numero if numero is not None else posicao + 1
+            if posicao < cabecalho:
+                continue
+            if indices is None:
+                # Linha de cabeçalho: colunas sem nome recebem 'Unnamed: i', como no pandas
+                largura = max(linha) + 1
+                nomes = [linha.get(i) for i in range(largura)]
+                nomes = [f'Unnamed: {i}' if nome is None else str(nome) for i, nome in enumerate(nomes)]
+                ausentes = [coluna for coluna in colunas or [] if coluna not in nomes]
+                if ausentes:
+                    raise ValueError(f"Colunas não encontradas na aba {aba}: {ausentes}. Colunas disponíveis: {nomes}")
+                indices = list(range(largura)) if colunas is None else [nomes.index(c) for c in colunas]
+                yield [nomes[i] for i in indices]
+                continue
+            yield [linha.get(i) for i in indices]
+
+        if indices is None:
+            raise ValueError(f"A aba {aba} não tem a linha de cabeçalho {cabecalho}")
+
+    def _quadro(nomes, linhas, tipos):
+        df = pd.DataFrame(linhas, columns=nomes)
+        tipos = dict(tipos or {})
+
+        # Colunas com números gravados como texto em algumas células viram numéricas, como no pd.read_excel
+        for coluna in df.columns[(df.dtypes == object).to_numpy()]:
+            if coluna not in tipos and df[coluna].map(type).isin([str, int, float]).all():
+                numeros = pd.to_numeric(df[coluna], errors='coerce')
+                if numeros.notna().sum() == df[coluna].notna().sum():
+                    df[coluna] = numeros
+
+        tipos = {coluna: tipo for coluna, tipo in tipos.items() if coluna in df.columns}
+        return df.astype(tipos) if tipos else df
+
+    def lotes(origem, aba=0, colunas=None, cabecalho=0, tipos=None, tamanho_lote=10_000):
+        '''
+            Gera DataFrames de até tamanho_lote linhas com as colunas pedidas (pelos nomes do
+            cabeçalho; todas por padrão), convertidas para os tipos em tipos ({coluna: tipo}).
+        '''
+        with Planilhas._abrir(origem) as z:
+            registros = Planilhas._registros(z, aba, colunas, cabecalho)
+            nomes = next(registros)
+            lote = []
+            for linha in registros:
+                lote.append(linha)
+                if len(lote) >= tamanho_lote:
+                    yield Planilhas._quadro(nomes, lote, tipos)
+                    lote = []
+            if lote:
+                yield Planilhas._quadro(nomes, lote, tipos)
+
+    def ler(origem, aba=0, colunas=None, cabecalho=0, tipos=None):
+        '''
+            Lê uma aba inteira (apenas as colunas pedidas) em um DataFrame.
+        '''
+        with Planilhas._abrir(origem) as z:
+            registros = Planilhas._registros(z, aba, colunas, cabecalho)
+            nomes = next(registros)
+            return Planilhas._quadro(nomes, list(registros), tipos)
+
+    def ler_abas(origem, abas=None, max_workers=None, **opcoes):
+        '''
+            Lê várias abas (por padrão, todas) e retorna {aba: DataFrame}, com uma aba por
+            processo. abas pode ser uma lista ou um dicionário {aba: opções}, com opções de
+            Planilhas.ler próprias de cada aba (ex.: colunas diferentes em cada aba); as
+            opções passadas diretamente valem para todas.
+        '''
+        if isinstance(origem, io.IOBase):
+            origem = origem.getvalue() if isinstance(origem, io.BytesIO) else origem.read()
+        if abas is None:
+            abas = Planilhas.abas(origem)
+        if not isinstance(abas, dict):
+            abas = {aba: {} for aba in abas}
+
+        if len(abas) == 1 or max_workers == 1:
+            return {aba: Planilhas.ler(origem, aba, **{**opcoes, **proprias}) for aba, proprias in abas.items()}
+
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(abas), os.cpu_count() or 1)) as executor:
+            futuros = {aba: executor.submit(Planilhas.ler, origem, aba, **{**opcoes, **proprias})
+                       for aba, proprias in abas.items()}
+            return {aba: futuro.result() for aba, futuro in futuros.items()}
@@ -0,0 +1,73 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import functools
+import importlib
+import os
+
+from saidas import Saidas
+
+
+class Renderizacao:
+    '''
+        Renderização de gráficos com a API orientada a objetos do matplotlib (Figure +
+        FigureCanvasAgg), sem o estado global do pyplot. Cada gráfico é uma tarefa
+        (funcao, argumentos) que cria, salva (com Saidas.figura) e libera a própria figura;
+        as tarefas são distribuídas em um pool de processos quando há mais de uma CPU.
+
+        O matplotlib (e o seaborn, em Visualizacoes) só é importado ao desenhar a primeira
+        figura, para que os comandos que não geram gráficos não paguem essa importação.
+    '''
+
+    @contextmanager
+    def figura(largura, altura, estilo=None):
+        '''
+            Cria uma figura Agg independente do pyplot com o tamanho em polegadas e, se
+            informado, um dicionário de rcParams (ex.: estilo do seaborn). A figura é limpa
+            ao sair do bloco, mesmo em caso de erro.
+        '''
+        import matplotlib
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        with matplotlib.rc_context(estilo or {}):
+            fig = Figure(figsize=(largura, altura))
+            FigureCanvasAgg(fig)
+            try:
+                yield fig
+            finally:
+                # Liberar os artistas da figura de forma determinística
+                fig.clear()
+
+    def _executar(tarefa, aguardar=False):
+        # Executar uma tarefa de renderização e retornar o erro, se houver; nos processos do
+        # pool (aguardar=True) a gravação da figura termina antes de a tarefa ser dada como concluída
+        funcao, argumentos = tarefa
+        try:
+            funcao(*argumentos)
+            erros = Saidas.aguardar() if aguardar else []
+            return f'{funcao.__qualname__}: {erros[0]}' if erros else None
+        except Exception as e:
+            return f'{funcao.__qualname__}: {e!r}'
+
+    def renderizar(tarefas, max_workers=None, modulos=()):
+        '''
+            Executa as tarefas de renderização (funcao, argumentos). Com mais de uma CPU (ou
+            max_workers > 1) as tarefas rodam em um pool de processos; caso contrário, em
+            sequência. modulos lista importações extras usadas pelas tarefas (ex.: 'seaborn'),
+            feitas uma única vez antes de criar o pool. Retorna, depois de gravados todos os
+            arquivos, a lista de erros das tarefas que falharam.
+        '''
+        tarefas = list(tarefas)
+
+        # Importar no processo principal, para que os workers herdem os módulos já carregados
+        for modulo in ('matplotlib.figure', 'matplotlib.backends.backend_agg', *modulos):
+            importlib.import_module(modulo)
+        processos = min(len(tarefas), max_workers or os.cpu_count() or 1)
+
+        if processos <= 1:
+            resultados = [Renderizacao._executar(tarefa) for tarefa in tarefas]
+        else:
+            with ProcessPoolExecutor(max_workers=processos) as pool:
+                resultados = list(pool.map(functools.partial(Renderizacao._executar, aguardar=True), tarefas))
+
+        return [erro for erro in resultados if erro is not None] + Saidas.aguardar()
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import threading
+import time
+
+
+class Saidas:
+    '''
+        Gravação das saídas (tabelas e gráficos) em segundo plano. Cada gravação é enfileirada
+        em um pool de threads e o cálculo continua enquanto os arquivos são serializados e
+        gravados; Saidas.aguardar espera as gravações pendentes e retorna os erros.
+
+        Todo arquivo é gravado em um temporário no mesmo diretório e renomeado com os.replace,
+        de forma que um leitor nunca encontra um arquivo pela metade. As tabelas podem ser
+        gravadas em CSV e nos formatos colunares comprimidos Parquet e Feather.
+
+        Os processos filhos (pools de processos do Pipeline e de Renderizacao, criados por fork)
+        herdariam o pool e as gravações pendentes do pai sem as threads que as executam; por isso
+        o estado é reiniciado no filho logo depois do fork e cada processo grava as suas saídas.
+
+        Com diretório versionado, cada execução grava em <raiz>/execucoes/<AAAAMMDD-HHMMSS> e,
+        ao final, o link <raiz>/ultima passa a apontar para ela.
+    '''
+
+    # Formatos de tabela e extensões dos arquivos
+    formatos = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+    compressao = 'zstd'
+
+    max_workers = 4
+    _pool = None
+    _pendentes = []
+    _trava = threading.Lock()
+
+    def _reiniciar():
+        # No processo filho: descartar o pool e as gravações do pai, que continuam sendo feitas por ele
+        Saidas._pool = None
+        Saidas._pendentes = []
+        Saidas._trava = threading.Lock()
+
+    def caminhos(caminho, formatos=('csv',)):
+        # Um arquivo por formato, trocando a extensão de caminho
+        base = os.path.splitext(caminho)[0]
+        return [base + Saidas.formatos[formato] for formato in formatos]
+
+    def _atomico(caminho, escrever):
+        # Gravar em um temporário no diretório de destino e substituir o arquivo de uma vez
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        temporario = f'{caminho}.{os.getpid()}-{threading.get_ident()}.tmp'
+        try:
+            escrever(temporario)
+            os.replace(temporario, caminho)
+        except Exception as e:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            print(f"Erro ao gravar {caminho}:", e)
+            return f'{caminho}: {e!r}'
+        return None
+
+    def _enfileirar(caminho, escrever):
+        with Saidas._trava:
+            if Saidas._pool is None:
+                Saidas._pool = ThreadPoolExecutor(max_workers=Saidas.max_workers, thread_name_prefix='saidas')
+            Saidas._pendentes.append(Saidas._pool.submit(Saidas._atomico, caminho, escrever))
+
+    def _escritor(df, formato, index):
+        if formato == 'csv':
+            return lambda destino: df.to_csv(destino, index=index)
+        if formato == 'parquet':
+            return lambda destino: df.to_parquet(destino, index=index, compression=Saidas.compressao)
+        if formato == 'feather':
+            # O Feather não guarda o índice: os rótulos das linhas viram colunas
+            tabela = df.reset_index() if index else df.reset_index(drop=True)
+            return lambda destino: tabela.to_feather(destino, compression=Saidas.compressao)
+        raise ValueError(f"Formato desconhecido: {formato}. Use um de {list(Saidas.formatos)}.")
+
+    def tabela(df, caminho, formatos=('csv',), index=False):
+        '''
+            Enfileira a gravação de um DataFrame em cada um dos formatos e retorna os caminhos
+            (a extensão de caminho é trocada pela do formato). O DataFrame não deve ser
+            alterado até Saidas.aguardar.
+        '''
+        caminhos = Saidas.caminhos(caminho, formatos)
+        escritores = [Saidas._escritor(df, formato, index) for formato in formatos]
+        for destino, escrever in zip(caminhos, escritores):
+            Saidas._enfileirar(destino, escrever)
+        return caminhos
+
+    def figura(fig, caminho, **opcoes):
+        '''
+            Renderiza a figura na hora (ela pode ser liberada em seguida) e enfileira a
+            gravação do arquivo. Destinos que não são caminhos (ex.: io.BytesIO) recebem a
+            imagem diretamente.
+        '''
+        if not isinstance(caminho, str):
+            fig.savefig(caminho, **opcoes)
+            return
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=os.path.splitext(caminho)[1][1:] or None, **opcoes)
+        conteudo = buffer.getvalue()
+
+        def escrever(destino):
+            with open(destino, 'wb') as f:
+                f.write(conteudo)
+
+        Saidas._enfileirar(caminho, escrever)
+
+    def aguardar():
+        '''
+            Espera todas as gravações pendentes e retorna a lista de erros (vazia se todas as
+            gravações terminaram bem).
+        '''
+        with Saidas._trava:
+            pendentes, Saidas._pendentes = Saidas._pendentes, []
+        return [erro for erro in (futuro.result() for futuro in pendentes) if erro is not None]
+
+    def diretorio_execucao(raiz='graficos', versionar=False):
+        '''
+            Diretório das saídas de uma execução: a própria raiz ou, com versionar=True, um
+            novo diretório <raiz>/execucoes/<AAAAMMDD-HHMMSS> (com sufixo se já existir).
+        '''
+        if not versionar:
+            return raiz
+
+        base = os.path.join(raiz, 'execucoes', time.strftime('%Y%m%d-%H%M%S'))
+        diretorio, sufixo = base, 1
+        while True:
+            try:
+                os.makedirs(diretorio)
+                return diretorio
+            except FileExistsError:
+                sufixo += 1
+                diretorio = f'{base}-{sufixo}'
+
+    def publicar(diretorio, raiz='graficos', nome='ultima'):
+        '''
+            Aponta o link <raiz>/<nome> para o diretório de uma execução concluída,
+            substituindo o link anterior de uma vez.
+        '''
+        link = os.path.join(raiz, nome)
+        temporario = f'{link}.{os.getpid()}.tmp'
+        os.symlink(os.path.relpath(diretorio, raiz), temporario)
+        os.replace(temporario, link)
+        return link
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=Saidas._reiniciar)
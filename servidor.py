@@ -0,0 +1,374 @@
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+import argparse
+import asyncio
+import functools
+import hashlib
+import io
+import json
+import time
+
+from data import Dados, Granularidade, Pacote
+from instrumentacao import Instrumentacao
+
+
+class Servidor:
+    '''
+        Modo serviço: mantém o DataFrame unificado em memória e responde por HTTP local, sem
+        pagar a importação das bibliotecas e a leitura de dados/ a cada atualização de um
+        painel. O servidor usa asyncio para atender muitas conexões ao mesmo tempo e envia o
+        trabalho de CPU (carregamento das fontes, correlações, predições e gráficos) para um
+        pool de processos; Analises e Visualizacoes só são importadas nesses processos.
+
+        Os arquivos das fontes são verificados a cada Servidor.intervalo segundos e apenas as
+        fontes cujos arquivos mudaram são recarregadas. As respostas ficam em cache até a
+        próxima recarga, com ETag (hash do corpo), e requisições iguais simultâneas
+        compartilham o mesmo cálculo.
+
+        Rotas (GET ou HEAD):
+            /saude                       estado do servidor e versão dos dados
+            /unificado                   DataFrame unificado (?formato=json ou csv)
+            /consulta                    Dados.Consultar (?anos=2010-2019&ufs=SP,RJ&indicadores=Crimes,IDH)
+            /correlacao                  matriz de correlação (?metodo=pearson ou spearman)
+            /predicao                    valores faltantes preenchidos (?metodo=interpolacao, ...)
+            /tendencias                  inclinações e pontos de mudança (?tipo=extremos: picos e vales)
+            /graficos/<nome>.png         mapa_calor, grafico_linha, grafico_homicidios_registros
+                                         ou o nome de um indicador (?uf=SP nos painéis)
+    '''
+
+    host = '127.0.0.1'
+    porta = 8050
+    intervalo = 2.0
+    max_workers = None
+    max_respostas = 256
+
+    # Parâmetros dos dados servidos (os mesmos de main)
+    configuracao = {'inicio': 2003, 'limite': 2019, 'granularidade': Granularidade.ANO, 'pacote': None}
+
+    _estado = {'versao': 0, 'carregado_em': None, 'fontes': {}, 'assinaturas': {}, 'unificado': None}
+    _respostas = {}
+    _pendentes = {}
+    _pool = None
+
+    # Tarefas executadas no pool de processos
+
+    def _tarefa(funcao, *args, **kwargs):
+        # Executar a função no processo do pool e descartar os registros de instrumentação acumulados
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            Instrumentacao.limpar()
+
+    def _carregar(nome, configuracao):
+        parametros = {'pacote': configuracao['pacote']}
+        if nome in Dados.fontes_regionais:
+            parametros['granularidade'] = configuracao['granularidade']
+        df = Dados.Carregar(nome, configuracao['limite'], **parametros)
+        if df is None:
+            raise ValueError(f"Falha ao carregar a fonte {nome}")
+        return df
+
+    def _correlacao(unificado, metodo):
+        from analises import Analises
+        return Analises.MatrizCorrelacao(unificado, metodo=metodo)
+
+    def _predicao(unificado, metodo):
+        from visualizacoes import Visualizacoes
+        return Visualizacoes.predicao(unificado, metodo=metodo)
+
+    def _tendencias(unificado, tipo):
+        from tendencias import Tendencias
+        if tipo == 'extremos':
+            from visualizacoes import Visualizacoes
+            return Tendencias.Extremos(Visualizacoes.predicao(unificado))
+        if tipo == 'resumo':
+            return Tendencias.Resumo(unificado)
+        raise KeyError(f"Tipo desconhecido: {tipo}")
+
+    def _grafico(nome, unificado, uf=None, pacote=None):
+        # Renderiza o gráfico em memória com as mesmas funções de desenho de Visualizacoes e retorna o PNG
+        from analises import Analises
+        from periodos import Periodos
+        from visualizacoes import Visualizacoes
+
+        if nome == 'mapa_calor':
+            df = unificado if uf is None or 'UF' not in unificado.columns else unificado[unificado['UF'] == uf]
+            desenhar = lambda buffer: Visualizacoes._desenhar_calor(buffer, Analises.MatrizCorrelacao(df), 100)
+        else:
+            base = Visualizacoes.to_percentage(Visualizacoes.predicao(unificado)) if nome == 'grafico_linha' else unificado
+            recortes = {diretorio: (df, mensal) for diretorio, df, mensal in Visualizacoes._recortes(base)}
+            diretorio = 'graficos' if 'UF' not in unificado.columns else f'graficos/{uf or Granularidade.ufs[0]}'
+            if diretorio not in recortes:
+                raise KeyError(f"UF sem dados: {uf}")
+            df, mensal = recortes[diretorio]
+
+            if nome == 'grafico_linha':
+                periodos = Periodos.Governos(Dados.Presidentes(pacote))
+                # Os extremos do recorte são calculados por Tendencias.Extremos dentro de _desenhar_linha
+                desenhar = lambda buffer: Visualizacoes._desenhar_linha(buffer, df, mensal, periodos)
+            elif nome == 'grafico_homicidios_registros':
+                periodos = Periodos.Governos(Dados.Presidentes(pacote))
+                desenhar = lambda buffer: Visualizacoes._desenhar_homicidios_registros(
+                    buffer, df[['Ano', 'Registros', 'Homicidios']], periodos, mensal)
+            elif nome in Granularidade.indicadores(df):
+                desenhar = lambda buffer: Visualizacoes._desenhar_variavel(buffer, df[['Ano', nome]].dropna(), nome, 'b')
+            else:
+                raise KeyError(f"Gráfico desconhecido: {nome}")
+
+        buffer = io.BytesIO()
+        desenhar(buffer)
+        return buffer.getvalue()
+
+    async def _executar(funcao, *args, **kwargs):
+        laco = asyncio.get_running_loop()
+        return await laco.run_in_executor(Servidor._pool, functools.partial(Servidor._tarefa, funcao, *args, **kwargs))
+
+    # Dados em memória e recarga incremental
+
+    def _assinaturas():
+        # (mtime, tamanho) do arquivo de cada fonte, como no cache colunar
+        assinaturas = {}
+        for nome in Dados.fontes:
+            arquivo = Dados._declaracao(nome, Servidor.configuracao['pacote'])['arquivo']
+            try:
+                assinaturas[nome] = Pacote.assinatura(arquivo)
+            except (OSError, KeyError):
+                assinaturas[nome] = None
+        return assinaturas
+
+    async def recarregar(forcar=False):
+        '''
+            Recarrega as fontes cujos arquivos mudaram (todas, com forcar=True), refaz o
+            DataFrame unificado e invalida as respostas em cache. Retorna as fontes recarregadas.
+        '''
+        estado = Servidor._estado
+        assinaturas = Servidor._assinaturas()
+        alteradas = [nome for nome in Dados.fontes if forcar or assinaturas[nome] != estado['assinaturas'].get(nome)]
+        if not alteradas:
+            return []
+
+        resultados = await asyncio.gather(*[Servidor._executar(Servidor._carregar, nome, Servidor.configuracao)
+                                            for nome in alteradas], return_exceptions=True)
+        for nome, resultado in zip(alteradas, resultados):
+            if isinstance(resultado, Exception):
+                # Manter a versão anterior da fonte; a próxima verificação tenta de novo
+                print(f"Erro ao recarregar a fonte {nome}:", resultado)
+                continue
+            estado['fontes'][nome] = resultado
+            estado['assinaturas'][nome] = assinaturas[nome]
+
+        if any(nome not in estado['fontes'] for nome in Dados.fontes):
+            return alteradas
+
+        estado['unificado'] = await Servidor._executar(
+            Dados.UniData, *[estado['fontes'][nome] for nome in Dados.fontes], inicio=Servidor.configuracao['inicio'])
+        estado['versao'] += 1
+        estado['carregado_em'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        Servidor._respostas.clear()
+        print(f"Dados recarregados (versão {estado['versao']}):", ', '.join(alteradas))
+        return alteradas
+
+    async def _observar():
+        # Verificar periodicamente os arquivos de dados/ e recarregar o que mudou
+        while True:
+            await asyncio.sleep(Servidor.intervalo)
+            try:
+                await Servidor.recarregar()
+            except Exception as e:
+                print("Erro ao verificar os arquivos de dados:", e)
+
+    # Rotas
+
+    def _json(df):
+        return df.to_json(orient='records', force_ascii=False, date_format='iso').encode('utf-8'), 'application/json'
+
+    def _tabela(df, consulta):
+        if consulta.get('formato') == 'csv':
+            return df.to_csv(index=False).encode('utf-8'), 'text/csv; charset=utf-8'
+        return Servidor._json(df)
+
+    async def _responder(caminho, consulta):
+        # Calcula o corpo e o tipo da resposta de uma rota
+        estado = Servidor._estado
+        if caminho == '/saude':
+            corpo = {'versao': estado['versao'], 'carregado_em': estado['carregado_em'],
+                     'configuracao': Servidor.configuracao, 'fontes': sorted(estado['fontes'])}
+            return json.dumps(corpo, ensure_ascii=False).encode('utf-8'), 'application/json'
+
+        unificado = estado['unificado']
+        if unificado is None:
+            raise RuntimeError("Os dados ainda não foram carregados")
+
+        if caminho == '/unificado':
+            return Servidor._tabela(unificado, consulta)
+
+        if caminho == '/consulta':
+            anos = tuple(int(a) for a in consulta['anos'].split('-')) if 'anos' in consulta else None
+            ufs = consulta['ufs'].split(',') if 'ufs' in consulta else None
+            indicadores = consulta['indicadores'].split(',') if 'indicadores' in consulta else None
+            df = await Servidor._executar(Dados.Consultar, anos=anos, ufs=ufs, indicadores=indicadores,
+                                          pacote=Servidor.configuracao['pacote'])
+            if df is None:
+                raise ValueError("Consulta inválida")
+            return Servidor._tabela(df, consulta)
+
+        if caminho == '/correlacao':
+            matriz = await Servidor._executar(Servidor._correlacao, unificado, consulta.get('metodo', 'pearson'))
+            return Servidor._tabela(matriz.rename_axis(index='Variavel').reset_index(), consulta)
+
+        if caminho == '/predicao':
+            df = await Servidor._executar(Servidor._predicao, unificado, consulta.get('metodo', 'interpolacao'))
+            return Servidor._tabela(df, consulta)
+
+        if caminho == '/tendencias':
+            df = await Servidor._executar(Servidor._tendencias, unificado, consulta.get('tipo', 'resumo'))
+            return Servidor._tabela(df, consulta)
+
+        if caminho.startswith('/graficos/') and caminho.endswith('.png'):
+            nome = caminho[len('/graficos/'):-len('.png')]
+            uf = consulta.get('uf')
+            return await Servidor._executar(Servidor._grafico, nome, unificado, uf,
+                                            Servidor.configuracao['pacote']), 'image/png'
+
+        raise FileNotFoundError(caminho)
+
+    async def _resposta(caminho, consulta):
+        # Resposta da rota pelo cache da versão atual dos dados; requisições iguais simultâneas aguardam o mesmo cálculo
+        chave = (Servidor._estado['versao'], caminho, tuple(sorted(consulta.items())))
+        if chave in Servidor._respostas:
+            return Servidor._respostas[chave]
+
+        if chave not in Servidor._pendentes:
+            Servidor._pendentes[chave] = asyncio.ensure_future(Servidor._responder(caminho, consulta))
+        tarefa = Servidor._pendentes[chave]
+        try:
+            corpo, tipo = await asyncio.shield(tarefa)
+        finally:
+            if tarefa.done():
+                Servidor._pendentes.pop(chave, None)
+
+        resposta = (f'"{hashlib.sha1(corpo).hexdigest()}"', tipo, corpo)
+        if caminho != '/saude' and chave[0] == Servidor._estado['versao']:
+            Servidor._respostas[chave] = resposta
+            while len(Servidor._respostas) > Servidor.max_respostas:
+                Servidor._respostas.pop(next(iter(Servidor._respostas)))
+        return resposta
+
+    # HTTP
+
+    def _cabecalho(status, tipo, tamanho, etag=None, manter=True):
+        motivos = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+                   405: 'Method Not Allowed', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+        linhas = [f'HTTP/1.1 {status} {motivos[status]}', f'Content-Type: {tipo}', f'Content-Length: {tamanho}',
+                  'Cache-Control: no-cache', f"Connection: {'keep-alive' if manter else 'close'}"]
+        if etag:
+            linhas.append(f'ETag: {etag}')
+        return ('\r\n'.join(linhas) + '\r\n\r\n').encode('latin-1')
+
+    def _erro(status, mensagem, manter):
+        corpo = json.dumps({'erro': mensagem}, ensure_ascii=False).encode('utf-8')
+        return Servidor._cabecalho(status, 'application/json', len(corpo), manter=manter) + corpo
+
+    async def _atender(leitor, escritor):
+        # Uma conexão HTTP/1.1, com várias requisições em sequência (keep-alive)
+        try:
+            while True:
+                linha = await leitor.readline()
+                if not linha.strip():
+                    break
+                cabecalhos = {}
+                while True:
+                    cabecalho = await leitor.readline()
+                    if cabecalho in (b'\r\n', b'\n', b''):
+                        break
+                    nome, _, valor = cabecalho.decode('latin-1').partition(':')
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+
+                partes = linha.decode('latin-1').split()
+                manter = cabecalhos.get('connection', '').lower() != 'close' and partes[-1:] != ['HTTP/1.0']
+                if len(partes) != 3:
+                    escritor.write(Servidor._erro(400, 'Requisição inválida', False))
+                    break
+                metodo, alvo, _ = partes
+                if metodo not in ('GET', 'HEAD'):
+                    escritor.write(Servidor._erro(405, f'Método não suportado: {metodo}', manter))
+                else:
+                    escritor.write(await Servidor._processar(metodo, alvo, cabecalhos, manter))
+                await escritor.drain()
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def _processar(metodo, alvo, cabecalhos, manter):
+        url = urlsplit(alvo)
+        caminho = unquote(url.path).rstrip('/') or '/'
+        consulta = {chave: valores[-1] for chave, valores in parse_qs(url.query).items()}
+        try:
+            etag, tipo, corpo = await Servidor._resposta(caminho, consulta)
+        except FileNotFoundError:
+            return Servidor._erro(404, f'Rota não encontrada: {caminho}', manter)
+        except RuntimeError as e:
+            return Servidor._erro(503, str(e), manter)
+        except (KeyError, ValueError) as e:
+            return Servidor._erro(400, str(e.args[0] if isinstance(e, KeyError) else e), manter)
+        except Exception as e:
+            print(f"Erro ao responder {caminho}:", e)
+            return Servidor._erro(500, str(e), manter)
+
+        if etag in [valor.strip() for valor in cabecalhos.get('if-none-match', '').split(',')]:
+            return Servidor._cabecalho(304, tipo, 0, etag, manter)
+        return Servidor._cabecalho(200, tipo, len(corpo), etag, manter) + (corpo if metodo == 'GET' else b'')
+
+    async def servir(host=None, porta=None):
+        '''
+            Carrega os dados, inicia a verificação dos arquivos e atende as conexões até o
+            processo ser interrompido.
+        '''
+        Servidor._pool = ProcessPoolExecutor(max_workers=Servidor.max_workers)
+        try:
+            await Servidor.recarregar(forcar=True)
+            observador = asyncio.ensure_future(Servidor._observar())
+            servidor = await asyncio.start_server(Servidor._atender, host or Servidor.host, porta or Servidor.porta)
+            print(f"Servindo em http://{host or Servidor.host}:{porta or Servidor.porta}")
+            try:
+                async with servidor:
+                    await servidor.serve_forever()
+            finally:
+                observador.cancel()
+        finally:
+            Servidor._pool.shutdown(cancel_futures=True)
+
+    def Executar(host=None, porta=None, **configuracao):
+        '''
+            Inicia o servidor. configuracao substitui os parâmetros de Servidor.configuracao
+            (inicio, limite, granularidade, pacote).
+        '''
+        Servidor.configuracao = {**Servidor.configuracao, **configuracao}
+        Granularidade.validar(Servidor.configuracao['granularidade'])
+        try:
+            asyncio.run(Servidor.servir(host, porta))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Servidor HTTP local dos dados e gráficos.')
+    parser.add_argument('--host', default=Servidor.host)
+    parser.add_argument('--porta', type=int, default=Servidor.porta)
+    parser.add_argument('--inicio', type=int, default=Servidor.configuracao['inicio'])
+    parser.add_argument('--limite', type=int, default=Servidor.configuracao['limite'])
+    parser.add_argument('--granularidade', default=Servidor.configuracao['granularidade'],
+                        choices=list(Granularidade.chaves))
+    parser.add_argument('--pacote', default=None, help='ler as fontes de dentro de um .zip')
+    parser.add_argument('--intervalo', type=float, default=Servidor.intervalo,
+                        help='segundos entre as verificações dos arquivos de dados/')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    Servidor.intervalo = args.intervalo
+    Servidor.max_workers = args.workers
+    Servidor.Executar(args.host, args.porta, inicio=args.inicio, limite=args.limite,
+                      granularidade=args.granularidade, pacote=args.pacote)
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from analises import Analises
+from data import Granularidade
+from instrumentacao import Instrumentacao
+
+
+class Tendencias:
+    '''
+        Sinais de evolução dos indicadores ao longo do tempo: picos e vales, ponto de mudança
+        de nível e inclinação da tendência linear. Todas as séries (indicadores x UF nos
+        painéis) são empilhadas em uma matriz (grupos, tempos, indicadores), completada com
+        NaN, e cada sinal sai de operações sobre a matriz inteira em vez de um laço por coluna.
+
+        O tempo de cada linha é o ano ou, nos painéis mensais, o período fracionário
+        ano + (mês - 1) / 12, o mesmo eixo x dos gráficos de Visualizacoes.
+    '''
+
+    # Rótulos dos extremos locais
+    tipos = {1: 'pico', -1: 'vale'}
+
+    # Variância relativa (à soma dos quadrados da série) abaixo da qual a série é considerada constante
+    tolerancia = 1e-9
+
+    def _series(df):
+        '''
+            Matriz (grupos, tempos, indicadores) das séries do DataFrame, com os grupos (UF
+            nos painéis, um único grupo na série nacional), os tempos ordenados, os
+            indicadores e a matriz (grupos, tempos) com a linha de df de cada posição (-1 onde
+            não há linha).
+        '''
+        colunas = Granularidade.indicadores(df)
+        tempo = df['Ano'].to_numpy(dtype=float)
+        if 'Mês' in df.columns:
+            tempo = tempo + (df['Mês'].to_numpy(dtype=float) - 1) / 12
+        tempos, t = np.unique(tempo, return_inverse=True)
+
+        if 'UF' in df.columns:
+            g, grupos = pd.factorize(df['UF'], sort=True)
+        else:
+            g, grupos = np.zeros(len(df), dtype=int), [None]
+
+        X = np.full((len(grupos), len(tempos), len(colunas)), np.nan)
+        X[g, t] = df[colunas].to_numpy(dtype=float)
+        linhas = np.full((len(grupos), len(tempos)), -1)
+        linhas[g, t] = np.arange(len(df))
+        return X, list(grupos), tempos, colunas, linhas
+
+    @Instrumentacao.medir()
+    def Extremos(df):
+        '''
+            Picos e vales locais de todos os indicadores: um pico é um ponto maior que o
+            anterior e maior que o seguinte (um vale, menor que os dois), como na marcação
+            original dos gráficos de linha. Retorna uma tabela longa com as chaves do
+            DataFrame (Ano e, nos painéis, UF e/ou Mês), Variavel, Tipo ('pico' ou 'vale') e
+            Valor.
+        '''
+        try:
+            chaves = [c for c in Granularidade.colunas if c in df.columns]
+            X, _, _, colunas, linhas = Tendencias._series(df)
+
+            # Sinal da variação para o ponto seguinte: pico quando sobe e depois desce, vale no contrário
+            with np.errstate(invalid='ignore'):
+                d = np.diff(X, axis=1)
+                tipo = np.zeros(X.shape, dtype=int)
+                tipo[:, 1:-1] = np.where((d[:, :-1] > 0) & (d[:, 1:] < 0), 1, 0) - \
+                    np.where((d[:, :-1] < 0) & (d[:, 1:] > 0), 1, 0)
+
+            g, t, k = np.nonzero(tipo)
+            tabela = df[chaves].iloc[linhas[g, t]].reset_index(drop=True)
+            tabela['Variavel'] = np.asarray(colunas, dtype=object)[k]
+            tabela['Tipo'] = pd.Series(tipo[g, t, k]).map(Tendencias.tipos).to_numpy()
+            tabela['Valor'] = X[g, t, k]
+            return tabela.sort_values(['Variavel'] + [c for c in ['UF', 'Ano', 'Mês'] if c in chaves],
+                                      kind='stable').reset_index(drop=True)
+        except Exception as e:
+            print("Erro ao localizar os picos e vales:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def Resumo(df):
+        '''
+            Tendência e ponto de mudança de cada indicador (e de cada UF nos painéis),
+            ignorando os valores ausentes. Retorna uma tabela com as colunas UF (nos painéis),
+            Variavel, N, Inicio e Fim (tempos com dados), Inclinacao (variação por ano da reta
+            de mínimos quadrados), R (correlação da série com o tempo), Mudanca (tempo em que
+            começa o segundo nível da melhor divisão da série em dois níveis), Antes e Depois
+            (médias dos dois níveis) e Explicada (fração da variância explicada pela divisão).
+        '''
+        try:
+            X, grupos, tempos, colunas, _ = Tendencias._series(df)
+            m = ~np.isnan(X)
+            x = np.where(m, X, 0.0)
+            T = np.where(m, tempos[None, :, None], 0.0)
+            n = m.sum(axis=1)
+
+            # Reta de mínimos quadrados contra o tempo, pelas somas de todas as séries de uma vez
+            st, sx = T.sum(axis=1), x.sum(axis=1)
+            stt, sxx, stx = (T ** 2).sum(axis=1), (x ** 2).sum(axis=1), (T * x).sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                variancia = stt - st ** 2 / n
+                inclinacao = np.where((n >= 2) & (variancia > 0), (stx - st * sx / n) / variancia, np.nan)
+            r = Analises._de_somas(n, st, sx, stt, sxx, stx)
+
+            # Divisão em dois níveis: o corte c separa os tempos anteriores a tempos[c] dos demais e o
+            # ganho n1 n2 / n (média1 - média2)^2 de todos os cortes sai das somas acumuladas
+            acumular = lambda a: np.concatenate([np.zeros_like(a[:, :1]), np.cumsum(a, axis=1)[:, :-1]], axis=1)
+            n1, s1 = acumular(m.astype(float)), acumular(x)
+            n2, s2 = n[:, None] - n1, sx[:, None] - s1
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ganho = np.where((n1 >= 2) & (n2 >= 2), n1 * n2 / n[:, None] * (s1 / n1 - s2 / n2) ** 2, -np.inf)
+            corte = np.argmax(ganho, axis=1)
+            melhor, n1, s1, n2, s2 = (np.take_along_axis(a, corte[:, None], axis=1)[:, 0] for a in (ganho, n1, s1, n2, s2))
+
+            # Séries constantes (variância abaixo da tolerância) ou curtas demais não têm mudança de nível
+            with np.errstate(divide='ignore', invalid='ignore'):
+                total = sxx - sx ** 2 / n
+                valida = np.isfinite(melhor) & (total > Tendencias.tolerancia * sxx)
+                explicada = np.where(valida, melhor / total, np.nan)
+                antes, depois = np.where(valida, s1 / n1, np.nan), np.where(valida, s2 / n2, np.nan)
+            mudanca = np.where(valida, tempos[corte], np.nan)
+
+            # Primeiro e último tempo com dados de cada série
+            alguma = m.any(axis=1)
+            inicio = np.where(alguma, tempos[np.argmax(m, axis=1)], np.nan)
+            fim = np.where(alguma, tempos[len(tempos) - 1 - np.argmax(m[:, ::-1], axis=1)], np.nan)
+
+            tabela = pd.DataFrame({
+                'Variavel': np.tile(colunas, len(grupos)), 'N': n.ravel(), 'Inicio': inicio.ravel(), 'Fim': fim.ravel(),
+                'Inclinacao': inclinacao.ravel(), 'R': r.ravel(), 'Mudanca': mudanca.ravel(),
+                'Antes': antes.ravel(), 'Depois': depois.ravel(), 'Explicada': explicada.ravel(),
+            })
+            if 'Mês' not in df.columns:
+                # Nas séries anuais os tempos são anos inteiros
+                tabela[['Inicio', 'Fim', 'Mudanca']] = tabela[['Inicio', 'Fim', 'Mudanca']].astype('Int64')
+            if 'UF' in df.columns:
+                tabela.insert(0, 'UF', pd.Categorical(np.repeat(grupos, len(colunas)), categories=Granularidade.ufs))
+            return tabela
+        except Exception as e:
+            print("Erro ao calcular as tendências:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
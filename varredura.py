@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from analises import Analises
+from data import Dados, Granularidade
+from imputacao import Imputacao
+from instrumentacao import Instrumentacao
+
+
+class Varredura:
+    '''
+        Varredura do pipeline sobre vários intervalos de anos em uma única passagem: as fontes
+        são carregadas e unidas uma vez e cada janela [Inicio, Fim] é um recorte do DataFrame
+        unificado, idêntico ao que Dados.UniData produziria para o mesmo intervalo.
+
+        As janelas podem ser crescentes (ano inicial fixo e vários anos finais, como rodar o
+        pipeline com vários valores de limite) ou móveis (tamanho fixo). As correlações de
+        Pearson de todas as janelas saem de somas acumuladas por linha: a soma de uma janela é
+        a diferença entre duas linhas das somas acumuladas, sem recalcular nada por janela.
+    '''
+
+    # Variância relativa (à soma dos quadrados da janela) abaixo da qual a série é considerada constante
+    tolerancia = 1e-9
+
+    def janelas(inicio, fins, tamanho=None):
+        '''
+            Lista de janelas (Inicio, Fim): crescentes a partir de inicio ou, com tamanho,
+            móveis com tamanho anos terminando em cada ano de fins (limitadas a inicio).
+        '''
+        if tamanho is None:
+            return [(inicio, fim) for fim in fins]
+        return [(max(inicio, fim - tamanho + 1), fim) for fim in fins]
+
+    def _somas(X, m):
+        # Somas acumuladas por linha dos termos das correlações par a par, com uma linha inicial de zeros
+        acumular = lambda a, b: np.concatenate([np.zeros((1,) + a.shape[1:] + b.shape[1:]),
+                                                np.cumsum(a[:, :, None] * b[:, None, :], axis=0)])
+        return [acumular(m, m), acumular(X, m), acumular(m, X), acumular(X ** 2, m), acumular(m, X ** 2),
+                acumular(X, X)]
+
+    @Instrumentacao.medir()
+    def Correlacoes(df_unificado, janelas, colunas=None):
+        '''
+            Matrizes de correlação de Pearson (com tratamento par a par dos valores ausentes,
+            como em Analises.MatrizCorrelacao) dos indicadores em cada janela (Inicio, Fim) de
+            anos. Retorna uma tabela longa com as colunas Inicio, Fim, Variavel1, Variavel2,
+            Correlacao e N.
+        '''
+        try:
+            colunas = list(colunas or Granularidade.indicadores(df_unificado))
+            df = df_unificado.sort_values('Ano', kind='stable')
+            anos = df['Ano'].to_numpy()
+            X = df[colunas].to_numpy(dtype=float)
+
+            # Centralizar pelas médias de toda a série (não altera as correlações e melhora a precisão)
+            m = ~np.isnan(X)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                media = np.where(m, X, 0.0).sum(axis=0) / m.sum(axis=0)
+            X = np.where(m, X - media, 0.0)
+            somas = Varredura._somas(X, m.astype(float))
+
+            # Linhas de cada janela nas somas acumuladas: a soma da janela é fim - início
+            inicios = np.searchsorted(anos, [i for i, _ in janelas], side='left')
+            fins = np.searchsorted(anos, [f for _, f in janelas], side='right')
+            n, sx, sy, sxx, syy, sxy = [soma[fins] - soma[inicios] for soma in somas]
+
+            # Séries constantes na janela deixam um resíduo de arredondamento no lugar da variância nula
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for s, ss in ((sx, sxx), (sy, syy)):
+                    quadrado = s ** 2 / n
+                    constante = ss - quadrado <= Varredura.tolerancia * ss
+                    ss[constante] = quadrado[constante]
+            r = Analises._de_somas(n, sx, sy, sxx, syy, sxy)
+
+            # A diagonal é exatamente 1 sempre que a correlação está definida
+            diagonal = np.arange(len(colunas))
+            r[:, diagonal, diagonal] = np.where(np.isnan(r[:, diagonal, diagonal]), np.nan, 1.0)
+
+            indice = pd.MultiIndex.from_tuples([(i, f, c1, c2) for i, f in janelas for c1 in colunas for c2 in colunas],
+                                               names=['Inicio', 'Fim', 'Variavel1', 'Variavel2'])
+            return pd.DataFrame({'Correlacao': r.ravel(), 'N': np.rint(n).astype(int).ravel()},
+                                index=indice).reset_index()
+        except Exception as e:
+            print("Erro ao calcular as correlações das janelas:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def Predicoes(df_unificado, janelas, metodo='interpolacao', grau=2):
+        '''
+            Imputação dos valores faltantes (Imputacao.Imputar) no recorte de cada janela
+            (Inicio, Fim). Retorna uma tabela longa com as colunas Inicio, Fim, as chaves do
+            DataFrame (Ano e, nos painéis, UF e/ou Mês), Variavel, Valor (imputado) e
+            Observado (NaN onde o valor faltava).
+        '''
+        try:
+            chaves = [c for c in Granularidade.colunas if c in df_unificado.columns]
+            colunas = Granularidade.indicadores(df_unificado)
+
+            tabelas = []
+            for inicio, fim in janelas:
+                recorte = df_unificado[df_unificado['Ano'].between(inicio, fim)].reset_index(drop=True)
+                imputado = Imputacao.Imputar(recorte, metodo=metodo, grau=grau)
+                if imputado is None:
+                    raise ValueError(f"Falha na imputação da janela {inicio}-{fim}")
+
+                valores = imputado.melt(id_vars=chaves, value_vars=colunas, var_name='Variavel', value_name='Valor')
+                valores['Observado'] = recorte.melt(id_vars=chaves, value_vars=colunas)['value'].to_numpy()
+                tabelas.append(valores.assign(Inicio=inicio, Fim=fim))
+
+            return pd.concat(tabelas, ignore_index=True)[['Inicio', 'Fim'] + chaves + ['Variavel', 'Valor', 'Observado']]
+        except Exception as e:
+            print("Erro ao imputar os valores das janelas:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
+
+    @Instrumentacao.medir()
+    def Executar(*fontes, inicio=2003, fins=None, tamanho=None, predicao=True, metodo='interpolacao', grau=2):
+        '''
+            Une as fontes uma única vez e calcula as correlações e (com predicao=True) as
+            predições de todas as janelas de Varredura.janelas(inicio, fins, tamanho). Sem
+            fins, as janelas terminam em cada ano a partir do terceiro ano dos dados.
+
+            Retorna uma única tabela longa, com a coluna Resultado indicando a origem de cada
+            linha: 'correlacao' (Variavel1, Variavel2, Valor = correlação, N) ou 'predicao'
+            (Variavel1, chaves, Valor = valor imputado, Observado).
+        '''
+        try:
+            df = Dados.UniData(*fontes, inicio=inicio)
+            if df is None:
+                raise ValueError("Não foi possível unificar as fontes")
+
+            anos = sorted(df['Ano'].unique())
+            fins = list(fins) if fins is not None else anos[2:]
+            janelas = Varredura.janelas(inicio, fins, tamanho)
+
+            correlacoes = Varredura.Correlacoes(df, janelas)
+            if correlacoes is None:
+                raise ValueError("Falha no cálculo das correlações")
+            tabelas = [correlacoes.rename(columns={'Correlacao': 'Valor'}).assign(Resultado='correlacao')]
+
+            if predicao:
+                predicoes = Varredura.Predicoes(df, janelas, metodo=metodo, grau=grau)
+                if predicoes is None:
+                    raise ValueError("Falha na imputação dos valores")
+                tabelas.append(predicoes.rename(columns={'Variavel': 'Variavel1'}).assign(Resultado='predicao'))
+
+            tabela = pd.concat(tabelas, ignore_index=True)
+
+            # Contagens e chaves inteiras, com valores ausentes nas linhas do outro tipo de resultado
+            for coluna in ['N', 'Ano', 'Mês']:
+                if coluna in tabela.columns:
+                    tabela[coluna] = tabela[coluna].astype('Int64')
+
+            primeiras = ['Inicio', 'Fim', 'Resultado', 'Variavel1', 'Variavel2']
+            return tabela[primeiras + [c for c in tabela.columns if c not in primeiras]]
+        except Exception as e:
+            print("Erro na varredura das janelas:", e)
+            Instrumentacao.registrar_erro(e)
+            return None
@@ -1,17 +1,45 @@
-from sklearn.linear_model import LinearRegression
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-from scipy.signal import argrelextrema
-import seaborn as sns
 import pandas as pd
 import numpy as np
 
+from data import Granularidade
+from imputacao import Imputacao
+from instrumentacao import Instrumentacao
+from renderizacao import Renderizacao
+from saidas import Saidas
+from tendencias import Tendencias
+
 
 class Visualizacoes:
-    def impute_missing(df, column):
+    # Bibliotecas de desenho, importadas só quando algum gráfico é gerado (ver Renderizacao.renderizar)
+    modulos = ('seaborn', 'matplotlib.ticker')
+
+    def _recortes(df, diretorio='graficos'):
+        """
+        Esta função divide o dataframe em recortes para os gráficos e retorna uma lista de
+        (diretório, dataframe, mensal). A série nacional gera um único recorte em diretorio;
+        painéis por UF geram um recorte por UF em diretorio/<UF>. Nos painéis mensais a coluna
+        'Ano' passa a ser o período fracionário (ano + (mês - 1) / 12) e a coluna 'Mês' é removida.
+        """
+        if 'UF' not in df.columns:
+            return [(diretorio, df, False)]
+
+        recortes = []
+        for uf, grupo in df.groupby('UF', observed=True):
+            grupo = grupo.drop(columns='UF')
+            mensal = 'Mês' in grupo.columns
+            if mensal:
+                grupo = grupo.assign(Ano=grupo['Ano'] + (grupo['Mês'] - 1) / 12).drop(columns='Mês')
+
+            recortes.append((f'{diretorio}/{uf}', grupo, mensal))
+
+        return recortes
+
+    @Instrumentacao.medir()
+    def impute_missing(df, column, metodo='interpolacao', grau=2):
         """
         Esta função recebe um dataframe e uma coluna e preenche os valores faltantes na coluna
-        com a média dos valores existentes.
+        com o método de Imputacao escolhido ('interpolacao', 'linear', 'polinomial' ou
+        'regressao'), ajustando uma série por UF nos painéis.
         """
         # Verificar se a coluna existe no dataframe
         if column not in df.columns:
@@ -24,43 +52,47 @@ class Visualizacoes:
             return df
 
         try:
-            # Calcular a média dos valores existentes
-            mean = df[column].mean()
-
-            # Preencher os valores faltantes com a média
-            df[column].fillna(mean, inplace=True)
-
-            return df
+            # Preencher os valores faltantes da coluna (os demais indicadores servem de preditores na regressão)
+            df_imputado = Imputacao.Imputar(df, metodo=metodo, grau=grau, colunas=[column])
+            return df if df_imputado is None else df_imputado
         except Exception as e:
             print(f"Erro ao preencher os valores faltantes para a coluna {column}:", e)
+            Instrumentacao.registrar_erro(e)
             return df
 
-    def predicao(df):
+    @Instrumentacao.medir()
+    def predicao(df, metodo='interpolacao', grau=2):
         """
-        Esta função recebe um dataframe, aplica a função impute_missing para cada coluna do dataframe
-        e retorna um dataframe sem valores faltantes.
+        Esta função recebe um dataframe, preenche os valores faltantes de todos os indicadores
+        de uma vez com o método de Imputacao escolhido e retorna um dataframe sem valores faltantes.
         """
         try:
-            df_filled = df.copy()
-
-            for column in ['Crimes', 'Homicidios', 'Registros', 'Apreendidas', 'IDH', 'Desemprego', 'IPC']:
-                df_filled = Visualizacoes.impute_missing(df_filled, column)
-
-            return df_filled
+            df_filled = Imputacao.Imputar(df, metodo=metodo, grau=grau)
+            return df if df_filled is None else df_filled
         except Exception as e:
             print("Erro durante a predição de valores faltantes:", e)
+            Instrumentacao.registrar_erro(e)
             return df
 
+    @Instrumentacao.medir()
     def to_percentage(df):
         """
         Esta função recebe um dataframe e retorna um dataframe onde os valores de cada coluna foram
         escalonados para o intervalo 0-100 (em porcentagem), sendo que o valor mínimo da coluna é 0%
-        e o valor máximo da coluna é 100%.
+        e o valor máximo da coluna é 100%. Nos painéis por UF o escalonamento é feito dentro de cada UF.
         """
         try:
             df_percentage = df.copy()
 
-            for column in ['Crimes', 'Homicidios', 'Registros', 'Apreendidas', 'IDH', 'Desemprego', 'IPC']:
+            for column in Granularidade.indicadores(df):
+                if 'UF' in df.columns:
+                    # Mínimo e máximo de cada UF, calculados de uma vez para todo o painel
+                    grupos = df.groupby('UF', observed=True)[column]
+                    min_val = grupos.transform('min')
+                    amplitude = grupos.transform('max') - min_val
+                    df_percentage[column] = np.where(amplitude == 0, 100, (df[column] - min_val) / amplitude * 100)
+                    continue
+
                 min_val = df[column].min()
                 max_val = df[column].max()
 
@@ -73,41 +105,69 @@ class Visualizacoes:
             return df_percentage
         except Exception as e:
             print("Erro ao converter valores para porcentagens:", e)
+            Instrumentacao.registrar_erro(e)
             return df
 
-    def plot_dataframe(df):
-        try:
-            # Configurar o estilo do Seaborn
-            sns.set(style="whitegrid")
-
-            # Ajustar o tamanho da figura para ter uma resolução de 1366x768
-            fig = plt.figure(figsize=(19.20, 16.80))
-
+    def _estilo_whitegrid():
+        # Equivalente a sns.set(style="whitegrid"), aplicado só à figura em vez do estado global
+        import seaborn as sns
+        return {**sns.axes_style('whitegrid'), **sns.plotting_context('notebook')}
+
+    def _faixas_periodos(ax, periodos, mensal=False):
+        # Faixas sombreadas dos períodos de governo (Periodos.Governos) no intervalo dos dados, coloridas
+        # pelo partido e rotuladas com o presidente no pé do eixo; nos gráficos anuais cada ano ocupa [ano - 0,5, ano + 0,5]
+        if periodos is None or len(periodos) == 0:
+            return
+        from matplotlib import colormaps
+
+        x0, x1 = ax.dataLim.x0, ax.dataLim.x1
+        partidos = list(dict.fromkeys(periodos['Partido']))
+        for governo in periodos.itertuples():
+            inicio, fim = (governo.Inicio, governo.Fim + 1) if mensal else (governo.Inicio - 0.5, governo.Fim + 0.5)
+            inicio, fim = max(inicio, x0), min(fim, x1)
+            if inicio >= fim:
+                continue
+            cor = colormaps['tab10'](partidos.index(governo.Partido) % 10)
+            ax.axvspan(inicio, fim, color=cor, alpha=0.08, linewidth=0, zorder=0)
+            if inicio > x0:
+                # Divisa entre governos consecutivos (também quando o partido se mantém)
+                ax.axvline(inicio, color='gray', linestyle=':', linewidth=0.8, zorder=0)
+            ax.text((inicio + fim) / 2, 0.01, f'{governo.Presidente} ({governo.Partido})', transform=ax.get_xaxis_transform(),
+                    ha='center', va='bottom', fontsize=8, color='dimgray')
+
+    def _desenhar_linha(caminho, df, mensal, periodos=None, extremos=None):
+        # Ajustar o tamanho da figura para ter uma resolução de 1366x768, com o estilo whitegrid do Seaborn
+        with Renderizacao.figura(19.20, 16.80, Visualizacoes._estilo_whitegrid()) as fig:
             # Usar gridspec para criar uma grade com duas linhas
-            gs = gridspec.GridSpec(2, 1, height_ratios=[4, 1])
+            gs = fig.add_gridspec(2, 1, height_ratios=[4, 1])
 
             # Desenhar o gráfico de linha na primeira subplot
             ax1 = fig.add_subplot(gs[0])
             colors = ['blue', 'green', 'red', 'cyan', 'magenta', 'yellow', 'black']  # exemplo de cores
             for idx, column in enumerate(df.columns):
                 if column != 'Ano':
-                    data = df[column]
-                    ax1.plot(df['Ano'], data, label=column, linewidth=2, color=colors[idx % len(colors)])
-
-                    # Encontrar picos e vales
-                    diff = data.diff()
-                    peaks = (diff.shift(-1) < 0) & (diff > 0)
-                    valleys = (diff.shift(-1) > 0) & (diff < 0)
-
-                    ax1.scatter(df['Ano'][peaks], data[peaks], marker='o', color='r')  # marcar picos
-                    ax1.scatter(df['Ano'][valleys], data[valleys], marker='o', color='b')  # marcar vales
-
+                    ax1.plot(df['Ano'], df[column], label=column, linewidth=2, color=colors[idx % len(colors)])
+
+            # Marcar os picos e vales calculados por Tendencias.Extremos, na escala do gráfico
+            if extremos is None:
+                extremos = Tendencias.Extremos(df)
+            valores = df.set_index('Ano')
+            for tipo, cor in [('pico', 'r'), ('vale', 'b')]:
+                marcas = extremos[(extremos['Tipo'] == tipo) & extremos['Variavel'].isin(valores.columns)]
+                y = [valores.at[ano, variavel] for ano, variavel in zip(marcas['Ano'], marcas['Variavel'])]
+                ax1.scatter(marcas['Ano'], y, marker='o', color=cor)
+
+            Visualizacoes._faixas_periodos(ax1, periodos, mensal)
             ax1.legend()
-            ax1.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
-            plt.xticks(np.arange(2003, 2020, 1))  # Definir ticks do eixo x de 2003 a 2019
+            from matplotlib.ticker import MaxNLocator
+            ax1.xaxis.set_major_locator(MaxNLocator(integer=True))
+            ax1.set_xticks(np.arange(int(df['Ano'].min()), int(df['Ano'].max()) + 1))  # Um tick por ano do intervalo dos dados
 
-            # Reduzir o número de dígitos decimais na tabela para 2
-            table_data = df.round(2).set_index('Ano')
+            # Reduzir o número de dígitos decimais na tabela para 2 (médias anuais nos painéis mensais)
+            if mensal:
+                table_data = df.groupby(df['Ano'].astype(int)).mean().drop(columns='Ano').round(2)
+            else:
+                table_data = df.round(2).set_index('Ano')
 
             # Criar a segunda subplot para a tabela
             ax2 = fig.add_subplot(gs[1])
@@ -124,68 +184,114 @@ class Visualizacoes:
             ax2.set_position([ax2.get_position().x0, ax2.get_position().y0 + 0.17, ax2.get_position().width, ax2.get_position().height])
 
             # Salvar o gráfico em um arquivo PNG
-            plt.savefig('graficos/grafico_linha.png', dpi=72)
+            Saidas.figura(fig, caminho, dpi=72)
+
+    @Instrumentacao.medir(valor=False)
+    def plot_dataframe(df, periodos=None, extremos=None, diretorio='graficos'):
+        try:
+            # Picos e vales de todos os recortes de uma vez (a etapa extremos do pipeline já os traz prontos);
+            # a tabela de extremos tem as mesmas chaves do DataFrame e é recortada da mesma forma
+            if extremos is None:
+                extremos = Tendencias.Extremos(df)
+            marcas = {diretorio: recorte for diretorio, recorte, _ in Visualizacoes._recortes(extremos, diretorio)}
+
+            # Uma tarefa de renderização por recorte (série nacional ou uma UF do painel)
+            tarefas = [(Visualizacoes._desenhar_linha, (f'{diretorio}/grafico_linha.png', recorte, mensal, periodos,
+                                                        marcas.get(diretorio, extremos.iloc[:0])))
+                       for diretorio, recorte, mensal in Visualizacoes._recortes(df, diretorio)]
+
+            for erro in Renderizacao.renderizar(tarefas, modulos=Visualizacoes.modulos):
+                print("Erro ao plotar o dataframe:", erro)
+                Instrumentacao.registrar_erro(erro)
 
         except Exception as e:
             print("Erro ao plotar o dataframe:", e)
+            Instrumentacao.registrar_erro(e)
+
+    def _desenhar_variavel(caminho, df, coluna, cor):
+        import seaborn as sns
+        with Renderizacao.figura(10, 8) as fig:
+            ax = fig.add_subplot()
 
-    def AnalisarVariaveis(df):
+            # Criar o gráfico com seaborn para um visual mais bonito
+            sns.lineplot(data=df, x='Ano', y=coluna, marker='o', lw=2, color=cor, ax=ax)
+
+            # Adicionar anotações com o valor de cada ponto
+            for x, y in zip(df['Ano'], df[coluna]):
+                ax.text(x, y, f'{y:.2f}', color=cor, ha='center', va='bottom', fontsize=8, weight='bold')
+
+            # Configurações do gráfico
+            ax.set_title(f'Análise da Variável: {coluna}', fontsize=14, fontweight='bold')
+            ax.set_xlabel('Ano', fontsize=12, fontweight='bold')
+            ax.set_ylabel('Valor', fontsize=12, fontweight='bold')
+            ax.grid(True)
+
+            # Salvar o gráfico
+            Saidas.figura(fig, caminho)
+
+    @Instrumentacao.medir(valor=False)
+    def AnalisarVariaveis(df, diretorio='graficos'):
         try:
-            # Extrair as colunas numéricas do DataFrame
-            colunas_numericas = df.select_dtypes(include='number').columns
-
-            # Substitui os valores infinitos por NaN e depois remove
-            df = df.replace([np.inf, -np.inf], np.nan).dropna()
-
-            # Configurar cores para cada linha
-            cores = ['b', 'g', 'r', 'c', 'm', 'y', 'k']
-
-            # Gerar os gráficos de análise para cada variável
-            for coluna, cor in zip(colunas_numericas, cores):
-                plt.figure(figsize=(10, 8))
-                
-                # Criar o gráfico com seaborn para um visual mais bonito
-                sns.lineplot(data=df, x='Ano', y=coluna, marker='o', lw=2, color=cor)
-
-                # Adicionar anotações com o valor de cada ponto
-                for x, y in zip(df['Ano'], df[coluna]):
-                    plt.text(x, y, f'{y:.2f}', color=cor, ha='center', va='bottom', fontsize=8, weight='bold')
-
-                # Configurações do gráfico
-                plt.title(f'Análise da Variável: {coluna}', fontsize=14, fontweight='bold')
-                plt.xlabel('Ano', fontsize=12, fontweight='bold')
-                plt.ylabel('Valor', fontsize=12, fontweight='bold')
-                plt.grid(True)
-                
-                # Salvar o gráfico
-                plt.savefig(f'graficos/{coluna}.png')
-                plt.close()
+            tarefas = []
+
+            # Gerar os gráficos para cada recorte (série nacional ou uma UF do painel)
+            for diretorio, df, mensal in Visualizacoes._recortes(df, diretorio):
+                # Extrair as colunas numéricas do DataFrame
+                colunas_numericas = df.select_dtypes(include='number').columns
+
+                # Substitui os valores infinitos por NaN e depois remove
+                df = df.replace([np.inf, -np.inf], np.nan).dropna()
+
+                # Configurar cores para cada linha
+                cores = ['b', 'g', 'r', 'c', 'm', 'y', 'k']
+
+                # Uma tarefa de renderização por variável, apenas com as colunas usadas no gráfico
+                for indice, coluna in enumerate(colunas_numericas):
+                    cor = cores[indice % len(cores)]
+                    colunas = ['Ano'] if coluna == 'Ano' else ['Ano', coluna]
+                    tarefas.append((Visualizacoes._desenhar_variavel, (f'{diretorio}/{coluna}.png', df[colunas], coluna, cor)))
+
+            for erro in Renderizacao.renderizar(tarefas, modulos=Visualizacoes.modulos):
+                print("Ocorreu um erro ao analisar as variáveis:", erro)
+                Instrumentacao.registrar_erro(erro)
 
         except Exception as e:
             print("Ocorreu um erro ao analisar as variáveis:", e)
-            
+            Instrumentacao.registrar_erro(e)
 
-    def grafico_calor(correlation_matrix):
-        try:
+    def _desenhar_calor(caminho, matriz, dpi):
+        import seaborn as sns
+        with Renderizacao.figura(10, 10) as fig:
             # Gerar o mapa de calor
-            plt.figure(figsize=(10, 10))
-            sns.heatmap(correlation_matrix, annot=True, cmap='Blues')
-            plt.title('Mapa de Calor - Correlação entre os dados')
-            plt.savefig('graficos/mapa_calor.png', dpi=300)
-            plt.close()
+            ax = fig.add_subplot()
+            sns.heatmap(matriz, annot=True, cmap='Blues', ax=ax)
+            ax.set_title('Mapa de Calor - Correlação entre os dados')
+            Saidas.figura(fig, caminho, dpi=dpi)
+
+    @Instrumentacao.medir(valor=False)
+    def grafico_calor(correlation_matrix, dpi=300, diretorio='graficos'):
+        try:
+            # Matrizes por UF (índice (UF, indicador)) geram um mapa de calor por UF
+            if isinstance(correlation_matrix.index, pd.MultiIndex):
+                matrizes = [(f'{diretorio}/{uf}', matriz.droplevel(0))
+                            for uf, matriz in correlation_matrix.groupby(level=0, observed=True)]
+            else:
+                matrizes = [(diretorio, correlation_matrix)]
+
+            tarefas = [(Visualizacoes._desenhar_calor, (f'{caminho}/mapa_calor.png', matriz, dpi))
+                       for caminho, matriz in matrizes]
+
+            for erro in Renderizacao.renderizar(tarefas, modulos=Visualizacoes.modulos):
+                print("Erro ao gerar o mapa de calor:", erro)
+                Instrumentacao.registrar_erro(erro)
         except Exception as e:
             print("Erro ao gerar o mapa de calor:", e)
+            Instrumentacao.registrar_erro(e)
             return None
-    
-    def grafico_homicidios_registros(df):
-        try:
-            # Filtrar o dataframe pelo ano e colunas desejadas
-            df = df[(df['Ano'] >= 2003) & (df['Ano'] <= 2019)][['Ano', 'Registros', 'Homicidios']]
 
-            # Exportar os dados para um arquivo CSV
-            # df.to_csv('graficos/dados/homicidios_registros.csv', sep=';', index=False)
-
-            fig, ax1 = plt.subplots(figsize=(19.20, 10.80))
+    def _desenhar_homicidios_registros(caminho, df, periodos=None, mensal=False):
+        with Renderizacao.figura(19.20, 10.80, Visualizacoes._estilo_whitegrid()) as fig:
+            ax1 = fig.add_subplot()
 
             # Plotando o gráfico para 'Registros'
             line1, = ax1.plot(df['Ano'], df['Registros'], marker='o', linewidth=2, label='Registros', color='blue')
@@ -205,12 +311,37 @@ class Visualizacoes:
             ax1.set_ylabel('Registros de armas de fogo (CAC)', fontsize=12, fontweight='bold', color='blue')
             ax2.set_ylabel('Homicidios por armas de fogo', fontsize=12, fontweight='bold', color='red')
             ax1.set_title('Tendências ao longo dos anos', fontsize=14, fontweight='bold')
+            Visualizacoes._faixas_periodos(ax1, periodos, mensal)
             ax1.legend(loc='upper left', fontsize=12)
             ax2.legend(loc='upper right', fontsize=12)
 
+            # Anos inteiros no eixo x, qualquer que seja o intervalo dos dados
+            from matplotlib.ticker import MaxNLocator
+            ax1.xaxis.set_major_locator(MaxNLocator(integer=True))
+
             # Salvar o gráfico
-            plt.savefig('graficos/grafico_homicidios_registros.png')
+            Saidas.figura(fig, caminho)
+
+    @Instrumentacao.medir(valor=False)
+    def grafico_homicidios_registros(df, periodos=None, diretorio='graficos'):
+        try:
+            tarefas = []
+
+            # Gerar o gráfico para cada recorte (série nacional ou uma UF do painel)
+            for diretorio, df, mensal in Visualizacoes._recortes(df, diretorio):
+                # Selecionar as colunas desejadas; o intervalo de anos é o dos dados (inicio e limite de UniData)
+                df = df[['Ano', 'Registros', 'Homicidios']]
+
+                # Exportar os dados para um arquivo CSV
+                # df.to_csv('graficos/dados/homicidios_registros.csv', sep=';', index=False)
+
+                tarefas.append((Visualizacoes._desenhar_homicidios_registros,
+                                (f'{diretorio}/grafico_homicidios_registros.png', df, periodos, mensal)))
+
+            for erro in Renderizacao.renderizar(tarefas, modulos=Visualizacoes.modulos):
+                print("Erro ao plotar o dataframe:", erro)
+                Instrumentacao.registrar_erro(erro)
 
         except Exception as e:
             print("Erro ao plotar o dataframe:", e)
-
+            Instrumentacao.registrar_erro(e)